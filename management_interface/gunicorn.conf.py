@@ -0,0 +1,86 @@
+"""
+Gunicorn settings for HANS_MI_SERVER_MODE=production, derived from management_interface.configuration.
+
+Run with `gunicorn --config gunicorn.conf.py`; `kill -HUP` on the master reloads workers gracefully.
+"""
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from management_interface.configuration import SETTINGS  # noqa: E402
+
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+
+
+def default_workers(worker_class, cpus):
+    # an event loop per core is enough for async workers; blocking workers want spares for requests
+    # waiting on Postgres
+    if worker_class == "uvicorn":
+        return cpus
+    return cpus * 2 + 1
+
+
+def default_threads(worker_class):
+    return 4 if worker_class == "gthread" else 1
+
+
+if SETTINGS.WORKER_CLASS not in WORKER_CLASSES:
+    raise ValueError(f"HANS_MI_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}")
+
+wsgi_app = (
+    "management_interface.asgi:application"
+    if SETTINGS.WORKER_CLASS == "uvicorn"
+    else "management_interface.wsgi:application"
+)
+bind = SETTINGS.BIND
+worker_class = WORKER_CLASSES[SETTINGS.WORKER_CLASS]
+workers = SETTINGS.WORKERS or default_workers(SETTINGS.WORKER_CLASS, multiprocessing.cpu_count())
+threads = SETTINGS.THREADS or default_threads(SETTINGS.WORKER_CLASS)
+
+# import Django, the models and fhir.resources once in the master, shared copy-on-write by every worker
+preload_app = True
+keepalive = SETTINGS.KEEPALIVE
+timeout = SETTINGS.WORKER_TIMEOUT
+graceful_timeout = SETTINGS.GRACEFUL_TIMEOUT
+# recycle workers now and then, staggered so they do not all restart together
+max_requests = SETTINGS.MAX_REQUESTS
+max_requests_jitter = SETTINGS.MAX_REQUESTS // 10
+accesslog = "-"
+
+
+def when_ready(server):
+    # runs in the master once the app is preloaded and before any worker is forked, so every worker shares the result
+    if SETTINGS.WARM_UP:
+        from management_interface.warmup import warm_up_process
+
+        warm_up_process()
+
+
+def post_fork(server, worker):
+    # never share a database connection opened in the master with a worker
+    from django.db import connections
+
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # connect before taking traffic, then build this worker's known hash filter in the background; searches query
+    # Postgres until it is ready. Audit events are written from a thread of the worker's own. The first worker to
+    # start builds the host's directory snapshot in the background if there is none yet.
+    from management_interface.audit import lookup_audit
+    from management_interface.lookup import known_hashes
+    from management_interface.snapshot import snapshots
+    from management_interface.warmup import warm_up_connections
+
+    if SETTINGS.WARM_UP:
+        # a sync worker with one thread is the only kind to serve requests on the thread running this hook
+        warm_up_connections(threads=threads, on_request_thread=SETTINGS.WORKER_CLASS == "sync" and threads == 1)
+    known_hashes.start()
+    lookup_audit.start()
+    snapshots.start()
@@ -1,7 +1,26 @@
+import re
+
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 
 from .forms import CareProviderLocationForm, CareRecipientForm, RegisteredManagerForm
-from .models import CareProviderLocation, CareRecipient, RegisteredManager
+from .models import (
+    CareProviderLocation,
+    CareRecipient,
+    LookupAuditDay,
+    RegisteredManager,
+)
+
+# below this many rows an exact COUNT(*) is cheap enough, and more useful than an estimate
+ESTIMATED_COUNT_THRESHOLD = 100000
+# shorter hash prefixes match too many care recipients to be worth searching for
+MIN_HASH_PREFIX_LENGTH = 6
+HEX_DIGITS = "0123456789abcdef"
+HEX = re.compile(f"[{HEX_DIGITS}]+")
 
 
 def set_obj_created_updated(request, obj, form):
@@ -16,15 +35,114 @@ def set_obj_created_updated(request, obj, form):
     return obj
 
 
+def estimated_count(queryset):
+    """
+    Row count of the queryset's table according to the planner's statistics, or -1 if it has never been analysed.
+    A partitioned table's count is the sum of its partitions'.
+    """
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN bool_or(reltuples < 0) THEN -1 ELSE sum(reltuples)::bigint END "
+            "FROM pg_partition_tree(%s::regclass) tree JOIN pg_class ON pg_class.oid = tree.relid WHERE tree.isleaf",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else -1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the size of a large unfiltered changelist from the planner's statistics instead of
+    counting every row
+    """
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def hash_prefix_query(prefix):
+    """
+    Matches hashes starting with prefix, as a range of their stored bytes the care_recipient_hash_lookup index
+    can serve
+    """
+
+    def to_bytes(digits):
+        # an odd number of digits is padded to whole bytes with the lowest digit
+        return bytes.fromhex(digits + "0" * (len(digits) % 2))
+
+    query = Q(nhs_number_hash__gte=to_bytes(prefix))
+    # the smallest value above every hash with the prefix; there is none for a prefix of only "f"s
+    stem = prefix.rstrip("f")
+    if stem:
+        query &= Q(nhs_number_hash__lt=to_bytes(stem[:-1] + HEX_DIGITS[HEX_DIGITS.index(stem[-1]) + 1]))
+    return query
+
+
+class CareProviderLocationOdsCodeFilter(admin.SimpleListFilter):
+    """
+    Filters by a typed ODS code, rather than listing every care provider location as a choice
+    """
+
+    title = "care provider location ODS code"
+    parameter_name = "ods_code"
+    template = "admin/management_interface/input_filter.html"
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        # the other parameters of the current changelist, kept as hidden inputs of the filter's form
+        yield {
+            "query_parts": [
+                (name, value)
+                for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ]
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(care_provider_location__ods_code=self.value().strip())
+        return queryset
+
+
 @admin.register(CareRecipient)
 class CareRecipientAdmin(admin.ModelAdmin):
     search_fields = (
         "nhs_number_hash",
         "provider_reference_id",
     )
-    list_filter = ("care_provider_location_id",)
+    search_help_text = (
+        f"The start of a provider reference ID, or at least {MIN_HASH_PREFIX_LENGTH} characters of an NHS number hash"
+    )
+    list_filter = (CareProviderLocationOdsCodeFilter,)
+    # __str__ includes the care provider location's name
+    list_select_related = ("care_provider_location",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ("care_provider_location",)
     form = CareRecipientForm
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Prefix matches only, so that every search is served by an index
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        query = Q(provider_reference_id__startswith=search_term)
+        if len(search_term) >= MIN_HASH_PREFIX_LENGTH and HEX.fullmatch(search_term.lower()):
+            query |= hash_prefix_query(search_term.lower())
+        return queryset.filter(query), False
+
     def save_model(self, request, obj, form, change):
         obj = set_obj_created_updated(request, obj, form)
         super().save_model(request, obj, form, change)
@@ -38,6 +156,8 @@ class CareRecipientAdmin(admin.ModelAdmin):
 
 @admin.register(RegisteredManager)
 class RegisteredManagerAdmin(admin.ModelAdmin):
+    # each field has a trigram index serving icontains
+    search_fields = ("given_name", "family_name", "email")
     form = RegisteredManagerForm
 
     def save_model(self, request, obj, form, change):
@@ -47,8 +167,31 @@ class RegisteredManagerAdmin(admin.ModelAdmin):
 
 @admin.register(CareProviderLocation)
 class CareProviderLocationAdmin(admin.ModelAdmin):
+    # each field has a trigram index serving icontains
+    search_fields = ("name", "email", "ods_code", "cqc_location_id")
     form = CareProviderLocationForm
 
     def save_model(self, request, obj, form, change):
         obj = set_obj_created_updated(request, obj, form)
         super().save_model(request, obj, form, change)
+
+
+@admin.register(LookupAuditDay)
+class LookupAuditDayAdmin(admin.ModelAdmin):
+    """
+    Read-only: the counts are only ever added to by the audit log
+    """
+
+    list_display = ("day", "outcome", "lookups")
+    list_filter = ("outcome",)
+    date_hierarchy = "day"
+    ordering = ("-day", "outcome")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
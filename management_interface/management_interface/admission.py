@@ -0,0 +1,203 @@
+"""
+Admission control for the search endpoints, so that a surge is turned away quickly instead of queueing until every
+request times out: a token bucket per client, and a cap on searches in flight in the process with a short, bounded
+queue in front of it.
+
+Both are per worker process, so a client's effective rate is its rate times the number of workers.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+
+def client_address(request, header):
+    """
+    The address a request came from: the last address in header, as added by the load balancer in front of the
+    service, or the peer address without one. Earlier addresses in the header are the client's own claims.
+    """
+    if header:
+        forwarded = request.headers.get(header, "")
+        if forwarded.strip():
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class RateLimiter:
+    """
+    A token bucket per client holding up to burst tokens, refilled at rate per second; a rate of zero disables it.
+    The least recently seen buckets are dropped beyond max_clients; a dropped client starts again with a full bucket.
+    """
+
+    def __init__(self, rate, burst, max_clients, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, client):
+        """
+        Takes a token for client, returning 0, or the seconds until one is available if there is none
+        """
+        if not self.enabled:
+            return 0
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                self.allowed += 1
+                wait = 0
+            else:
+                self.limited += 1
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+class ConcurrencyLimit:
+    """
+    Admits up to limit callers at a time, threads and asyncio tasks alike. Beyond that up to queue_size callers
+    wait, first come first served, for up to timeout seconds; the rest are turned away at once. A limit of zero
+    disables it.
+
+    A caller admitted with acquire() or aacquire() must call release() when it is done, which hands its slot
+    straight to the longest waiting caller.
+    """
+
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # threading.Event for a waiting thread, asyncio.Future for a waiting task
+        self._waiters = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self):
+        return self.limit > 0
+
+    def _admit_or_queue(self, make_waiter):
+        """
+        Returns (admitted, waiter): a waiter to wait on if queued, or None if admitted or turned away
+        """
+        with self._lock:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                self.admitted += 1
+                return True, None
+            if len(self._waiters) >= self.queue_size:
+                self.rejected += 1
+                return False, None
+            waiter = make_waiter()
+            self._waiters.append(waiter)
+            self.queued += 1
+            return False, waiter
+
+    def _give_up(self, waiter, timed_out=True):
+        """
+        Takes waiter out of the queue, returning False, or True if it was handed a slot just as it gave up
+        """
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return True
+            self.timed_out += timed_out
+            return False
+
+    def acquire(self):
+        if not self.enabled:
+            return True
+        admitted, waiter = self._admit_or_queue(threading.Event)
+        if waiter is None:
+            return admitted
+        if waiter.wait(self.timeout):
+            return True
+        return self._give_up(waiter)
+
+    async def aacquire(self):
+        """
+        As acquire, waiting without blocking the event loop
+        """
+        if not self.enabled:
+            return True
+        admitted, waiter = self._admit_or_queue(asyncio.get_running_loop().create_future)
+        if waiter is None:
+            return admitted
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+        except asyncio.CancelledError:
+            # the request went away while queued; a slot it was handed meanwhile goes to the next in line
+            if self._give_up(waiter, timed_out=False):
+                self.release()
+            raise
+
+    def release(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                self.admitted += 1
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                else:
+                    waiter.get_loop().call_soon_threadsafe(wake, waiter)
+                return
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+search_rate_limiter = RateLimiter(
+    rate=settings.HANS_SEARCH_RATE, burst=settings.HANS_SEARCH_BURST, max_clients=settings.HANS_SEARCH_RATE_CLIENTS
+)
+searches_in_flight = ConcurrencyLimit(
+    limit=settings.HANS_SEARCH_MAX_IN_FLIGHT,
+    queue_size=settings.HANS_SEARCH_QUEUE_SIZE,
+    timeout=settings.HANS_SEARCH_QUEUE_TIMEOUT,
+)
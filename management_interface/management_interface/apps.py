@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class HansManagementInterfaceAdmin(AppConfig):
     name = 'management_interface'
     verbose_name = 'HANS Management Interface'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .metrics import install_query_recorder
+
+        connection_created.connect(install_query_recorder)
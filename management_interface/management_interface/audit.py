@@ -0,0 +1,213 @@
+"""
+Audit log of every pseudonymous identifier the search endpoints look up, and the outcome, written behind the request.
+
+record() adds an event to an in-memory buffer. A background thread, started in each worker with start(), writes the
+buffer with a multi-row INSERT once it holds batch_size events or interval seconds have passed, adding the events to
+the daily counts in the same transaction, and writes whatever is left when the process exits. A process that has
+not started one, such as runserver or a management command, writes each batch on the thread that completes it.
+
+When the buffer is full, because the database is slow or down, record() waits up to max_wait seconds for the
+thread to make room, then drops the event and counts it, so searches slow down rather than stop.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .fields import is_hex_digest
+from .models import LookupAuditDay, LookupAuditEvent
+
+logger = logging.getLogger(__name__)
+
+
+def write_events(events):
+    """
+    Inserts events, given as (looked_up_at, outcome, nhs_number_hash), and adds them to the daily counts
+    """
+    days = Counter((timezone.localdate(looked_up_at), outcome) for looked_up_at, outcome, _ in events)
+    table = LookupAuditDay._meta.db_table
+    with transaction.atomic():
+        LookupAuditEvent.objects.bulk_create(
+            LookupAuditEvent(looked_up_at=looked_up_at, outcome=outcome, nhs_number_hash=nhs_number_hash)
+            for looked_up_at, outcome, nhs_number_hash in events
+        )
+        with connection.cursor() as cursor:
+            # in the same order in every process, so two workers adding to the same days cannot deadlock
+            cursor.execute(
+                f"INSERT INTO {table} (day, outcome, lookups) VALUES {', '.join(['(%s, %s, %s)'] * len(days))} "
+                f"ON CONFLICT (day, outcome) DO UPDATE SET lookups = {table}.lookups + EXCLUDED.lookups",
+                [value for (day, outcome), count in sorted(days.items()) for value in (day, outcome, count)],
+            )
+
+
+class AuditLog:
+    """
+    Thread-safe write-behind buffer of audit events, written with write(events)
+    """
+
+    def __init__(self, enabled, write, capacity, batch_size, interval, max_wait, clock=time.monotonic):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_wait = max_wait
+        self._write = write
+        self._clock = clock
+        self._condition = threading.Condition()
+        # one flush at a time, so batches are written in order
+        self._flushing = threading.Lock()
+        self._buffer = []
+        self._flushed_at = clock()
+        self._thread_pid = None
+        # whether events have been dropped since the last batch was written, so a long outage logs once
+        self._dropping = False
+        self.recorded = 0
+        self.written = 0
+        self.flushes = 0
+        self.waits = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def running(self):
+        return self._thread_pid == os.getpid()
+
+    def start(self):
+        """
+        Starts the background thread for this process, once; call after forking
+        """
+        if not self.enabled or self.running:
+            return
+        # anything buffered before the fork, and the state of its lock, belong to the parent
+        self._condition = threading.Condition()
+        self._buffer = []
+        self._thread_pid = os.getpid()
+        atexit.register(self.flush)
+        threading.Thread(target=self._run, name="lookup-audit", daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._buffer) >= self.batch_size, timeout=self.interval)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def record(self, outcome, nhs_number_hash):
+        if not self.enabled:
+            return
+        event = self._event(outcome, nhs_number_hash)
+        if not self._try_add(event):
+            self._add_when_room(event)
+
+    async def arecord(self, outcome, nhs_number_hash):
+        """
+        As record, waiting for room or writing in another thread rather than blocking the event loop
+        """
+        if not self.enabled:
+            return
+        event = self._event(outcome, nhs_number_hash)
+        if not self._try_add(event):
+            # writing needs the database connection of the thread async views use; waiting for room needs none
+            await sync_to_async(self._add_when_room, thread_sensitive=not self.running)(event)
+
+    def _event(self, outcome, nhs_number_hash):
+        # an identifier that is not a hex digest can neither match a subscription nor be stored as one
+        return timezone.now(), outcome, nhs_number_hash if is_hex_digest(nhs_number_hash) else ""
+
+    def _try_add(self, event):
+        """
+        Adds event to the buffer if there is room and no batch is due to be written by the caller
+        """
+        with self._condition:
+            if len(self._buffer) >= self.capacity:
+                return False
+            if not self.running and (
+                len(self._buffer) + 1 >= self.batch_size or self._clock() - self._flushed_at >= self.interval
+            ):
+                return False
+            self._buffer.append(event)
+            self.recorded += 1
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+            return True
+
+    def _add_when_room(self, event):
+        if not self.running:
+            with self._condition:
+                self._buffer.append(event)
+                self.recorded += 1
+            self.flush()
+            return
+        with self._condition:
+            self.waits += 1
+            self._condition.notify_all()
+            if self._condition.wait_for(lambda: len(self._buffer) < self.capacity, timeout=self.max_wait):
+                self._buffer.append(event)
+                self.recorded += 1
+                return
+            self.dropped += 1
+            first_drop, self._dropping = not self._dropping, True
+        if first_drop:
+            logger.error("Dropping lookup audit events: the buffer of %d is full", self.capacity)
+
+    def flush(self):
+        """
+        Writes every buffered event, a batch at a time. A batch that fails is put back, as far as there is room,
+        to be written next time.
+        """
+        with self._flushing:
+            while True:
+                with self._condition:
+                    batch_size = self.batch_size
+                    events = self._buffer[:batch_size]
+                    del self._buffer[:batch_size]
+                    self._flushed_at = self._clock()
+                    self._condition.notify_all()
+                if not events:
+                    return
+                try:
+                    self._write(events)
+                except Exception:
+                    logger.exception("Could not write %d lookup audit events", len(events))
+                    with self._condition:
+                        room = max(self.capacity - len(self._buffer), 0)
+                        self._buffer[:0] = events[:room]
+                        self.dropped += len(events[room:])
+                        self.errors += 1
+                    return
+                with self._condition:
+                    self.written += len(events)
+                    self.flushes += 1
+                    self._dropping = False
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "written": self.written,
+            "flushes": self.flushes,
+            "waits": self.waits,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+lookup_audit = AuditLog(
+    enabled=settings.HANS_LOOKUP_AUDIT,
+    write=write_events,
+    capacity=settings.HANS_LOOKUP_AUDIT_BUFFER,
+    batch_size=settings.HANS_LOOKUP_AUDIT_BATCH_SIZE,
+    interval=settings.HANS_LOOKUP_AUDIT_INTERVAL,
+    max_wait=settings.HANS_LOOKUP_AUDIT_MAX_WAIT,
+)
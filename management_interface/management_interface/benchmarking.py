@@ -0,0 +1,154 @@
+"""
+Latency and throughput benchmarks for the lookup API and the care recipient admin, run against synthetic data
+through the full middleware stack with Django's test client.
+"""
+import random
+import statistics
+import subprocess
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .compact_keys import finish_compact_keys, keys_compacted
+from .lookup import lookup_cache
+from .partitioning import partition_care_recipients
+from .synthetic import create_locations, create_recipients, synthetic_nhs_number_hash
+
+
+def summarise(durations):
+    """
+    Latency percentiles in milliseconds and sequential throughput for a list of durations in seconds
+    """
+    milliseconds = sorted(duration * 1000 for duration in durations)
+    cut_points = statistics.quantiles(milliseconds, n=100, method="inclusive") if len(milliseconds) > 1 else []
+    return {
+        "requests": len(milliseconds),
+        "mean_ms": statistics.fmean(milliseconds),
+        "p50_ms": cut_points[49] if cut_points else milliseconds[0],
+        "p95_ms": cut_points[94] if cut_points else milliseconds[0],
+        "p99_ms": cut_points[98] if cut_points else milliseconds[0],
+        "requests_per_second": len(milliseconds) / (sum(milliseconds) / 1000),
+    }
+
+
+def time_requests(send, requests):
+    durations = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        send()
+        durations.append(time.perf_counter() - started)
+    return summarise(durations)
+
+
+def benchmark_search(client, recipients, requests, rng):
+    url = reverse("care_provider_search")
+
+    def hit():
+        client.post(url, {"_careRecipientPseudoId": synthetic_nhs_number_hash(rng.randrange(recipients))})
+
+    def hit_uncached():
+        lookup_cache.clear()
+        hit()
+
+    def miss():
+        client.post(url, {"_careRecipientPseudoId": synthetic_nhs_number_hash(recipients + rng.randrange(recipients))})
+
+    def bad_request():
+        client.post(url, {})
+
+    return {
+        "hit": time_requests(hit, requests),
+        "hit_uncached": time_requests(hit_uncached, requests),
+        "miss": time_requests(miss, requests),
+        "bad_request": time_requests(bad_request, requests),
+    }
+
+
+def benchmark_admin_changelist(client, requests):
+    url = reverse("admin:management_interface_carerecipient_changelist")
+    return time_requests(lambda: client.get(url), requests)
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    recipient_counts, managers=10, locations=100, requests=1000, admin_requests=5, seed=0, partitions=0, log=print
+):
+    """
+    Grows the directory to each of recipient_counts in turn and benchmarks the lookup API and admin at that size.
+    Expects an empty database. With partitions, the care recipient table is first hash-partitioned into that many,
+    once the text keys kept by migration 0008 are dropped.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    admin_client = Client()
+    admin_client.force_login(User.objects.create_superuser("benchmark", "benchmark@nhs.net", None))
+
+    location_ids = create_locations(managers, locations)
+    if partitions:
+        with connection.cursor() as cursor:
+            compacted = keys_compacted(cursor)
+        if not compacted:
+            finish_compact_keys(log=log)
+        partition_care_recipients(partitions, log=log)
+    results = []
+    created = 0
+    for recipients in sorted(recipient_counts):
+        log(f"Creating care recipients {created} to {recipients}")
+        create_recipients(location_ids, created, recipients)
+        created = recipients
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        log(f"Benchmarking at {recipients} care recipients")
+        lookup_cache.clear()
+        results.append(
+            {
+                "recipients": recipients,
+                "search": benchmark_search(client, recipients, requests, rng),
+                "admin_changelist": benchmark_admin_changelist(admin_client, admin_requests),
+            }
+        )
+
+    return {
+        "commit": current_commit(),
+        "created_at": timezone.now().isoformat(),
+        "database": connection.vendor,
+        "managers": managers,
+        "locations": locations,
+        "partitions": partitions,
+        "results": results,
+    }
+
+
+def measurements(run):
+    for result in run["results"]:
+        for name, summary in result["search"].items():
+            yield (result["recipients"], f"search {name}"), summary
+        yield (result["recipients"], "admin changelist"), result["admin_changelist"]
+
+
+def compare(baseline, current):
+    """
+    Yields a line per measurement present in both runs, giving the change in p50 and p95 latency
+    """
+    baseline_measurements = dict(measurements(baseline))
+    for (recipients, name), summary in measurements(current):
+        before = baseline_measurements.get((recipients, name))
+        if before is None:
+            continue
+        changes = ", ".join(
+            f"{key} {before[key]:.2f} -> {summary[key]:.2f} ms ({(summary[key] - before[key]) / before[key]:+.0%})"
+            for key in ("p50_ms", "p95_ms")
+        )
+        yield f"{recipients:>9} recipients, {name}: {changes}"
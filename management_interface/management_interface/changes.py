@@ -0,0 +1,211 @@
+"""
+Change feed of the directory: every save or delete that can change the answer care_provider_search gives for a
+hash is logged as a DirectoryChange, which consumers read in commit-safe order with changes_since().
+
+Sequence numbers are taken when a row is inserted but become visible when its transaction commits, so a lower
+number can appear after a higher one has been read. The feed is read instead in order of the id of the transaction
+that wrote each change, then its sequence, and only up to the oldest transaction still running: Postgres assigns
+every later transaction a higher id, so nothing can commit behind a consumer's cursor. A transaction that stays
+open holds the feed back until it ends, which the short batches of import_hans and rehash keep brief.
+
+As a transaction that records changes commits, a trigger sends a notification on CHANGE_CHANNEL, which a
+ChangeListener counts, so a process can tell when others have changed the directory without polling.
+"""
+import logging
+import os
+import re
+import select
+import threading
+import time
+
+import psycopg2
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models
+
+from .models import CareRecipient, DirectoryChange
+
+logger = logging.getLogger(__name__)
+
+# a bare sequence number is a cursor from before changes recorded their transaction
+CURSOR = re.compile(r"(?:(\d+)\.)?(\d+)")
+# the channel the directory_change_notify trigger notifies
+CHANGE_CHANNEL = "directory_change"
+# seconds a listener waits for a notification before checking that its connection is still up
+LISTEN_KEEPALIVE = 60
+
+
+class OldestRunningTransactionId(models.Func):
+    """
+    The id below which every transaction has committed or rolled back, as the querying transaction sees it
+    """
+
+    template = "pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+    output_field = models.BigIntegerField()
+
+
+def parse_cursor(cursor):
+    """
+    Returns the (transaction id, sequence) of a change feed cursor, raising ValueError for one that is not
+    """
+    match = CURSOR.fullmatch(cursor)
+    if match is None:
+        raise ValueError(f"{cursor!r} is not a change feed cursor")
+    transaction_id, sequence = match.groups()
+    return int(transaction_id or 0), int(sequence)
+
+
+def format_cursor(transaction_id, sequence):
+    return f"{transaction_id}.{sequence}"
+
+
+def record_changes(entity, action, nhs_number_hashes):
+    DirectoryChange.objects.bulk_create(
+        DirectoryChange(entity=entity, action=action, nhs_number_hash=nhs_number_hash)
+        for nhs_number_hash in nhs_number_hashes
+    )
+
+
+def record_location_change(care_provider_location_id):
+    """
+    Logs a change to every hash subscribed at a care provider location, with one statement however many there are
+    """
+    hash_column = CareRecipient._meta.get_field("nhs_number_hash").column
+    location_column = CareRecipient._meta.get_field("care_provider_location").column
+    with connection.cursor() as cursor:
+        # transaction_id is left to its database default
+        cursor.execute(
+            f"INSERT INTO {DirectoryChange._meta.db_table} (changed_at, entity, action, nhs_number_hash) "
+            f"SELECT now(), %s, %s, {hash_column} FROM {CareRecipient._meta.db_table} WHERE {location_column} = %s",
+            [DirectoryChange.Entity.CARE_PROVIDER_LOCATION, DirectoryChange.Action.SAVED, care_provider_location_id],
+        )
+
+
+def changes_since(cursor, limit):
+    """
+    Returns up to limit committed changes after the (transaction id, sequence) cursor, the cursor to carry on from,
+    and whether more are ready
+    """
+    transaction_id, sequence = cursor
+    # always read from the primary, whose running transactions are the ones that bound the feed
+    rows = (
+        DirectoryChange.objects.filter(
+            transaction_id__gte=transaction_id, transaction_id__lt=OldestRunningTransactionId()
+        )
+        .exclude(transaction_id=transaction_id, sequence__lte=sequence)
+        .order_by("transaction_id", "sequence")[: limit + 1]
+    )
+    changes = list(rows)
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        transaction_id, sequence = changes[-1].transaction_id, changes[-1].sequence
+    return changes, (transaction_id, sequence), more
+
+
+def oldest_running_transaction_id():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def committed_cursor():
+    """
+    A cursor before which every change has committed, so a reader that has seen everything visible now can carry on
+    from it
+    """
+    return oldest_running_transaction_id(), 0
+
+
+def hashes_changed_since(cursor):
+    """
+    Returns the hash of every committed change after the (transaction id, sequence) cursor, including those of
+    transactions that committed while an older one is still running, and the cursor to carry on from, which stops
+    short of those
+    """
+    # taken first, so every transaction below it has finished before the changes are read
+    oldest_running = oldest_running_transaction_id()
+    transaction_id, sequence = cursor
+    rows = (
+        DirectoryChange.objects.filter(transaction_id__gte=transaction_id)
+        .exclude(transaction_id=transaction_id, sequence__lte=sequence)
+        .order_by("transaction_id", "sequence")
+        .values_list("transaction_id", "sequence", "nhs_number_hash")
+    )
+    hashes = []
+    for change_transaction_id, change_sequence, nhs_number_hash in rows.iterator(chunk_size=10000):
+        hashes.append(nhs_number_hash)
+        if change_transaction_id < oldest_running:
+            cursor = change_transaction_id, change_sequence
+    return hashes, cursor
+
+
+class ChangeListener:
+    """
+    Counts the notifications sent as transactions that record changes commit, in a thread with a connection of its
+    own started with start(). While it is not listening, changes made elsewhere can go unnoticed.
+    """
+
+    def __init__(self, alias=DEFAULT_DB_ALIAS, retry_after=5):
+        self.alias = alias
+        self.retry_after = retry_after
+        self.received = 0
+        self.listening = False
+        self.errors = 0
+        self._changed = threading.Event()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def start(self):
+        """
+        Starts the listening thread for this process, once; call after forking
+        """
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name="change-listener", daemon=True).start()
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for a notification, returning whether one has come since the last wait
+        """
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def notified(self):
+        with self._lock:
+            self.received += 1
+        self._changed.set()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                self.errors += 1
+                logger.exception("Stopped listening for directory changes")
+            time.sleep(self.retry_after)
+
+    def _listen(self):
+        listener = psycopg2.connect(**connections[self.alias].get_connection_params())
+        try:
+            listener.autocommit = True
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANGE_CHANNEL}")
+            # changes may have committed while nothing was listening
+            self.notified()
+            self.listening = True
+            while True:
+                if not select.select([listener], [], [], LISTEN_KEEPALIVE)[0]:
+                    with listener.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                listener.poll()
+                if listener.notifies:
+                    listener.notifies.clear()
+                    self.notified()
+        finally:
+            self.listening = False
+            listener.close()
+
+    def stats(self):
+        return {"listening": self.listening, "received": self.received, "errors": self.errors}
@@ -0,0 +1,95 @@
+"""
+Second release of the conversion of keys to uuid and of nhs_number_hash to bytea, begun by migration 0008.
+
+0008 left the text columns of the previous release next to the uuid and bytea shadow columns the models use, with a
+trigger keeping each pair in step so both releases could run during the deploy. Once no instance of the previous
+release is left, finish_compact_keys() drops the trigger and the text columns, with their keys and indexes, and
+makes the prebuilt unique indexes on the shadows the primary keys, under a short exclusive lock that is retried if
+the tables cannot be locked promptly. Every step takes time independent of the number of care recipients; the new
+foreign keys are added unchecked and validated afterwards, which does not block writes. The shadow columns keep
+their names, so the models carry on unchanged whether or not it has run.
+"""
+import time
+
+from django.db import OperationalError, connection, transaction
+
+from .models import CareProviderLocation, CareRecipient, RegisteredManager
+
+MANAGERS = RegisteredManager._meta.db_table
+LOCATIONS = CareProviderLocation._meta.db_table
+RECIPIENTS = CareRecipient._meta.db_table
+
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 10
+# (table, text column, shadow column) of every pair migration 0008 keeps in step
+SHADOWS = [
+    (MANAGERS, "id", "uuid"),
+    (LOCATIONS, "id", "uuid"),
+    (LOCATIONS, "registered_manager_id", "registered_manager_uuid"),
+    (RECIPIENTS, "id", "uuid"),
+    (RECIPIENTS, "care_provider_location_id", "care_provider_location_uuid"),
+    (RECIPIENTS, "nhs_number_hash", "nhs_number_digest"),
+]
+# (name, table, column, referenced table) of the foreign keys between the shadow columns
+FOREIGN_KEYS = [
+    ("location_registered_manager_fk", LOCATIONS, "registered_manager_uuid", MANAGERS),
+    ("care_recipient_location_fk", RECIPIENTS, "care_provider_location_uuid", LOCATIONS),
+]
+
+
+def keys_compacted(cursor):
+    """
+    Whether finish_compact_keys() has run, so only the shadow columns are left
+    """
+    cursor.execute(
+        "SELECT NOT EXISTS (SELECT FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'nhs_number_hash' "
+        "AND NOT attisdropped)",
+        [RECIPIENTS],
+    )
+    return cursor.fetchone()[0]
+
+
+def drop_text_columns(cursor):
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    cursor.execute(f"LOCK TABLE {MANAGERS}, {LOCATIONS}, {RECIPIENTS} IN ACCESS EXCLUSIVE MODE")
+    for table in (MANAGERS, LOCATIONS, RECIPIENTS):
+        cursor.execute(f"DROP TRIGGER {table}_sync_keys ON {table}")
+        cursor.execute(f"DROP FUNCTION {table}_sync_keys()")
+        texts = [text for shadow_table, text, _ in SHADOWS if shadow_table == table]
+        # CASCADE drops the foreign keys referring to a text primary key along with it, as well as the column's
+        # own keys and indexes
+        cursor.execute(f"ALTER TABLE {table} " + ", ".join(f"DROP COLUMN {text} CASCADE" for text in texts))
+
+    for table, _, shadow in SHADOWS:
+        # the CHECK constraints validated by migration 0008 prove these without scanning the table
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {shadow} SET NOT NULL, DROP CONSTRAINT {shadow}_not_null")
+    for table in (MANAGERS, LOCATIONS, RECIPIENTS):
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_uuid_key")
+    for name, table, column, referenced in FOREIGN_KEYS:
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {referenced} (uuid) "
+            "DEFERRABLE INITIALLY DEFERRED NOT VALID"
+        )
+
+
+def finish_compact_keys(log=print):
+    """
+    Drops the text keys and hashes migration 0008 kept for the previous release, which must no longer be running
+    """
+    with connection.cursor() as cursor:
+        if keys_compacted(cursor):
+            raise ValueError("The text keys have already been dropped")
+        log("Dropping the text keys")
+        for attempt in range(1, SWAP_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    drop_text_columns(cursor)
+                break
+            except OperationalError:
+                if attempt == SWAP_ATTEMPTS:
+                    raise
+                time.sleep(attempt)
+        log("Validating foreign keys")
+        for name, table, _, _ in FOREIGN_KEYS:
+            cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+        cursor.execute(f"ANALYZE {RECIPIENTS}")
@@ -1,6 +1,18 @@
 import os
+import tempfile
 from dataclasses import dataclass
 
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+def env_flag(name, default):
+    """
+    A boolean environment variable: true if set to 1, true, yes or on in any case, false if set to anything else,
+    and default if unset
+    """
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in TRUE_VALUES
+
 
 @dataclass(frozen=True)
 class Settings:
@@ -9,17 +21,67 @@ class Settings:
     POSTGRES_PASSWORD: str = os.environ.get("HANS_MI_PSQL_PASSWORD", "postgres")
     POSTGRES_HOST: str = os.environ.get("HANS_MI_PSQL_HOST", "localhost")
     POSTGRES_PORT: int = int(os.environ.get("HANS_MI_PSQL_PORT", 5432))
+    POSTGRES_CONN_MAX_AGE: int = int(os.environ.get("HANS_MI_PSQL_CONN_MAX_AGE", 60))
+    POSTGRES_CONN_HEALTH_CHECKS: bool = env_flag("HANS_MI_PSQL_CONN_HEALTH_CHECKS", True)
+    POSTGRES_POOL_SIZE: int = int(os.environ.get("HANS_MI_PSQL_POOL_SIZE", 0))
+    POSTGRES_POOL_TIMEOUT: float = float(os.environ.get("HANS_MI_PSQL_POOL_TIMEOUT", 10))
+    POSTGRES_REPLICA_HOSTS: str = os.environ.get("HANS_MI_PSQL_REPLICA_HOSTS", "")
+    POSTGRES_REPLICA_RETRY_AFTER: int = int(os.environ.get("HANS_MI_PSQL_REPLICA_RETRY_AFTER", 30))
+    POSTGRES_REPLICA_READ_YOUR_WRITES: int = int(os.environ.get("HANS_MI_PSQL_REPLICA_READ_YOUR_WRITES", 10))
     SECRET_KEY: str = os.environ.get(
         "HANS_MI_SECRET_KEY", "django-insecure-ys038snwqt5(l_7m%p6hh8ke20+w!8fbi+@covbk)^xl1@8r%-"
     )
     APP_NAME: str = os.environ.get("APP_NAME", "management_interface")
-    DEBUG: bool = bool(os.environ.get("HANS_MI_DEBUG", False))
+    DEBUG: bool = env_flag("HANS_MI_DEBUG", False)
     CSRF_TRUSTED_ORIGINS: str = os.environ.get("CSRF_TRUSTED_ORIGINS", "http://localhost")
     COGNITO_ENDPOINT: str = os.environ.get("COGNITO_ENDPOINT", "change_me")
     COGNITO_CLIENT_ID: str = os.environ.get("COGNITO_CLIENT_ID", "change_me")
     COGNITO_CLIENT_SECRET: str = os.environ.get("COGNITO_CLIENT_SECRET", "change_me")
     COGNITO_JWKS_URI: str = os.environ.get("COGNITO_JWKS_URI", "change_me")
     COGNITO_REDIRECT_URI: str = os.environ.get("COGNITO_REDIRECT_URI", "change_me")
+    LOOKUP_CACHE_SIZE: int = int(os.environ.get("HANS_MI_LOOKUP_CACHE_SIZE", 10000))
+    LOOKUP_CACHE_TTL: int = int(os.environ.get("HANS_MI_LOOKUP_CACHE_TTL", 60))
+    SINGLE_FLIGHT: bool = env_flag("HANS_MI_SINGLE_FLIGHT", True)
+    SEARCH_MAX_AGE: int = int(os.environ.get("HANS_MI_SEARCH_MAX_AGE", 60))
+    SEARCH_RATE: float = float(os.environ.get("HANS_MI_SEARCH_RATE", 0))
+    SEARCH_BURST: int = int(os.environ.get("HANS_MI_SEARCH_BURST", 50))
+    SEARCH_RATE_CLIENTS: int = int(os.environ.get("HANS_MI_SEARCH_RATE_CLIENTS", 10000))
+    SEARCH_CLIENT_HEADER: str = os.environ.get("HANS_MI_SEARCH_CLIENT_HEADER", "")
+    SEARCH_MAX_IN_FLIGHT: int = int(os.environ.get("HANS_MI_SEARCH_MAX_IN_FLIGHT", 32))
+    SEARCH_QUEUE_SIZE: int = int(os.environ.get("HANS_MI_SEARCH_QUEUE_SIZE", 32))
+    SEARCH_QUEUE_TIMEOUT: float = float(os.environ.get("HANS_MI_SEARCH_QUEUE_TIMEOUT", 0.5))
+    LOOKUP_AUDIT: bool = env_flag("HANS_MI_LOOKUP_AUDIT", True)
+    LOOKUP_AUDIT_BUFFER: int = int(os.environ.get("HANS_MI_LOOKUP_AUDIT_BUFFER", 50000))
+    LOOKUP_AUDIT_BATCH_SIZE: int = int(os.environ.get("HANS_MI_LOOKUP_AUDIT_BATCH_SIZE", 1000))
+    LOOKUP_AUDIT_INTERVAL: float = float(os.environ.get("HANS_MI_LOOKUP_AUDIT_INTERVAL", 1.0))
+    LOOKUP_AUDIT_MAX_WAIT: float = float(os.environ.get("HANS_MI_LOOKUP_AUDIT_MAX_WAIT", 0.5))
+    NEGATIVE_LOOKUP_FILTER: bool = env_flag("HANS_MI_NEGATIVE_LOOKUP_FILTER", True)
+    NEGATIVE_LOOKUP_ERROR_RATE: float = float(os.environ.get("HANS_MI_NEGATIVE_LOOKUP_ERROR_RATE", 0.001))
+    NEGATIVE_LOOKUP_REFRESH: int = int(os.environ.get("HANS_MI_NEGATIVE_LOOKUP_REFRESH", 5))
+    NHS_NUMBER_HASHER: str = os.environ.get("HANS_MI_NHS_NUMBER_HASHER", "sha3_256")
+    SCRYPT_SALT: str = os.environ.get("HANS_MI_SCRYPT_SALT", "")
+    SCRYPT_N: int = int(os.environ.get("HANS_MI_SCRYPT_N", 2**14))
+    SCRYPT_R: int = int(os.environ.get("HANS_MI_SCRYPT_R", 8))
+    SCRYPT_P: int = int(os.environ.get("HANS_MI_SCRYPT_P", 1))
+    HASH_WORKERS: int = int(os.environ.get("HANS_MI_HASH_WORKERS", 0))
+    QUERY_BUDGET: int = int(os.environ.get("HANS_MI_QUERY_BUDGET", 20))
+    METRICS_TOKEN: str = os.environ.get("HANS_MI_METRICS_TOKEN", "")
+    DIRECTORY_TOKEN: str = os.environ.get("HANS_MI_DIRECTORY_TOKEN", "")
+    CHANGE_FEED_PAGE_SIZE: int = int(os.environ.get("HANS_MI_CHANGE_FEED_PAGE_SIZE", 1000))
+    SNAPSHOT_DIR: str = os.environ.get("HANS_MI_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "hans-snapshots"))
+    SNAPSHOT_REFRESH: int = int(os.environ.get("HANS_MI_SNAPSHOT_REFRESH", 60))
+    SERVER_MODE: str = os.environ.get("HANS_MI_SERVER_MODE", "development")
+    BIND: str = os.environ.get("HANS_MI_BIND", "0.0.0.0:8000")
+    WORKER_CLASS: str = os.environ.get("HANS_MI_WORKER_CLASS", "gthread")
+    WORKERS: int = int(os.environ.get("HANS_MI_WORKERS", 0))
+    THREADS: int = int(os.environ.get("HANS_MI_THREADS", 0))
+    KEEPALIVE: int = int(os.environ.get("HANS_MI_KEEPALIVE", 5))
+    WORKER_TIMEOUT: int = int(os.environ.get("HANS_MI_WORKER_TIMEOUT", 30))
+    GRACEFUL_TIMEOUT: int = int(os.environ.get("HANS_MI_GRACEFUL_TIMEOUT", 30))
+    MAX_REQUESTS: int = int(os.environ.get("HANS_MI_MAX_REQUESTS", 10000))
+    WARM_UP: bool = env_flag("HANS_MI_WARM_UP", True)
+    ASYNC_SEARCH: bool = env_flag("HANS_MI_ASYNC_SEARCH", WORKER_CLASS == "uvicorn")
+    BATCH_SEARCH_MAX_ENTRIES: int = int(os.environ.get("HANS_MI_BATCH_SEARCH_MAX_ENTRIES", 1000))
 
 
 SETTINGS = Settings()
@@ -0,0 +1,181 @@
+"""
+Per-process pool of psycopg2 connections, shared by every thread of a gunicorn worker.
+
+Connections are handed back to the pool rather than closed at the end of a request, so a request only pays for
+the TCP and authentication handshake when the pool has no idle connection and is below its maximum size.
+"""
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe bounded pool of connections made by connect().
+
+    acquire() reuses the most recently released idle connection, opens a new one while fewer than max_size are
+    open, and otherwise waits up to timeout seconds for one to be released. check(connection), when given, is
+    called on every reused connection; those failing it are discarded and replaced.
+    """
+
+    def __init__(self, connect, max_size, timeout, check=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._connect = connect
+        self._check = check
+        self._clock = clock
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        while True:
+            connection = self._checkout()
+            if connection is None:
+                return self._open_connection()
+            if self._check is None or self._check(connection):
+                return connection
+            self.discard(connection)
+
+    def _checkout(self):
+        """
+        Returns an idle connection, or None once a slot for a new connection has been reserved
+        """
+        deadline = self._clock() + self.timeout
+        with self._condition:
+            if not self._idle and self._open >= self.max_size:
+                self.waits += 1
+            while not self._idle and self._open >= self.max_size:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection became free within {self.timeout} seconds")
+                self._condition.wait(remaining)
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self._open += 1
+            return None
+
+    def _open_connection(self):
+        try:
+            connection = self._connect()
+        except BaseException:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.created += 1
+        return connection
+
+    def release(self, connection):
+        """
+        Returns connection to the pool, rolling back any transaction left open; broken connections are discarded
+        """
+        if connection.closed:
+            self.discard(connection)
+            return
+        try:
+            status = connection.info.transaction_status
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                raise OperationalError("connection is in an unknown state")
+            if status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except OperationalError:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        finally:
+            with self._condition:
+                self._open -= 1
+                self.discarded += 1
+                self._condition.notify()
+
+    def close(self):
+        """
+        Closes every idle connection; connections in use are closed as they are released
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+            }
+
+
+# pools by database alias and connection parameters, for the process that created them
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, max_size, timeout, check=None):
+    global _pools_pid
+    key = (alias, tuple(sorted(conn_params.items())))
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # connections inherited across a fork belong to the parent; leave them for it to close
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(lambda: psycopg2.connect(**conn_params), max_size, timeout, check=check)
+        return pool
+
+
+def close_pools(database=None):
+    """
+    Closes the idle connections of every pool, or only those connected to the named database
+    """
+    with _pools_lock:
+        pools = [
+            pool for (_, params), pool in _pools.items() if database is None or dict(params).get("database") == database
+        ]
+    for pool in pools:
+        pool.close()
+
+
+def pool_statistics():
+    """
+    Totals across this process's pools, reported as lookup_statistics()["connection_pool"]
+    """
+    totals = {"pools": 0}
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    for pool in pools:
+        totals["pools"] += 1
+        for key, value in pool.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
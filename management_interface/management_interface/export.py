@@ -0,0 +1,68 @@
+"""
+Streaming export of the subscription directory: every care recipient with its location and manager.
+
+Rows are read through a server-side cursor a chunk at a time and rendered one line at a time, so memory
+use does not grow with the size of the directory.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import CareRecipient
+from .routers import iterate_from_replica
+
+# (exported column, queryset lookup); related columns come from the same JOINed query
+EXPORT_COLUMNS = (
+    ("subscription_id", "subscription_id"),
+    ("nhs_number_hash", "nhs_number_hash"),
+    ("nhs_number_hash_scheme", "nhs_number_hash_scheme"),
+    ("provider_reference_id", "provider_reference_id"),
+    ("updated_at", "updated_at"),
+    ("ods_code", "care_provider_location__ods_code"),
+    ("cqc_location_id", "care_provider_location__cqc_location_id"),
+    ("care_provider_location_name", "care_provider_location__name"),
+    ("care_provider_location_email", "care_provider_location__email"),
+    ("registered_manager_email", "care_provider_location__registered_manager__email"),
+    ("registered_manager_given_name", "care_provider_location__registered_manager__given_name"),
+    ("registered_manager_family_name", "care_provider_location__registered_manager__family_name"),
+    ("cqc_registered_manager_id", "care_provider_location__registered_manager__cqc_registered_manager_id"),
+)
+
+EXPORT_HEADER = tuple(column for column, _ in EXPORT_COLUMNS)
+
+
+def directory_rows(chunk_size=2000):
+    return iterate_from_replica(
+        lambda alias: CareRecipient.objects.using(alias)
+        .order_by()
+        .values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+class Echo:
+    """
+    File-like object whose write() returns what it was given, so csv.writer can render single lines
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_HEADER, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", render_csv),
+    "ndjson": ("application/x-ndjson", render_ndjson),
+}
@@ -0,0 +1,43 @@
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+HEX_DIGEST = re.compile(r"(?:[0-9a-f]{2})*")
+
+
+def is_hex_digest(value):
+    return isinstance(value, str) and HEX_DIGEST.fullmatch(value) is not None
+
+
+class HexDigestField(models.BinaryField):
+    """
+    Stores a lowercase hex digest as raw bytes (bytea on Postgres), half the size of its text form in the table
+    and in every index, while Python code keeps reading and writing hex strings.
+
+    Filtering by anything other than a hex digest raises ValueError, so lookups of user input should check
+    is_hex_digest() first.
+    """
+
+    def get_default(self):
+        default = super().get_default()
+        return "" if default == b"" else default
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or isinstance(value, (bytes, memoryview)):
+            return value
+        return bytes.fromhex(value)
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else bytes(value).hex()
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value).hex()
+        if value is not None and not is_hex_digest(value):
+            raise ValidationError("Enter a lowercase hexadecimal digest", code="invalid")
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
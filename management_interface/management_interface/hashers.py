@@ -0,0 +1,121 @@
+"""
+Pseudonymisation of NHS numbers into the nhs_number_hash used as _careRecipientPseudoId.
+
+Each care recipient records the scheme that produced its hash. The original scheme, "sha3_256", is the
+SHA3-256 hex digest of the NHS number. NHS numbers are never stored, so stronger schemes are applied to
+that SHA3 digest rather than to the number itself: existing hashes can then be upgraded in place by the
+rehash command, and the hospital feed derives the same identifier by applying the same chain.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+
+# the salt HANS_MI_SCRYPT_SALT defaulted to in earlier releases, which is public
+PLACEHOLDER_SALT = "change_me"
+
+
+def sha3_hex(value):
+    return hashlib.sha3_256(str(value).encode()).hexdigest()
+
+
+class Sha3Hasher:
+    scheme = "sha3_256"
+
+    def hash_nhs_number(self, nhs_number):
+        return sha3_hex(nhs_number)
+
+    def upgrade(self, nhs_number_hash, scheme):
+        """
+        Returns nhs_number_hash re-hashed under this hasher's scheme, or None if it cannot be derived
+        """
+        return nhs_number_hash if scheme == self.scheme else None
+
+
+class ScryptHasher:
+    """
+    scrypt over the SHA3-256 digest, with a deployment-wide salt so that identifiers stay deterministic.
+    The cost parameters are part of the scheme, so changing them marks existing hashes for rehashing.
+    """
+
+    def __init__(self, salt, n, r, p, dklen=32):
+        # a known salt would let anyone with the hashes try every NHS number against them
+        if not salt or salt == PLACEHOLDER_SALT:
+            raise ValueError("The scrypt NHS number hasher needs a secret HANS_MI_SCRYPT_SALT")
+        self.salt = salt
+        self.n = n
+        self.r = r
+        self.p = p
+        self.dklen = dklen
+
+    @property
+    def scheme(self):
+        return f"scrypt${self.n}${self.r}${self.p}"
+
+    def derive(self, sha3_digest):
+        return hashlib.scrypt(
+            sha3_digest.encode(),
+            salt=self.salt.encode(),
+            n=self.n,
+            r=self.r,
+            p=self.p,
+            maxmem=256 * self.n * self.r,
+            dklen=self.dklen,
+        ).hex()
+
+    def hash_nhs_number(self, nhs_number):
+        return self.derive(sha3_hex(nhs_number))
+
+    def upgrade(self, nhs_number_hash, scheme):
+        if scheme == self.scheme:
+            return nhs_number_hash
+        if scheme == Sha3Hasher.scheme:
+            return self.derive(nhs_number_hash)
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_hasher():
+    """
+    Returns the hasher configured by HANS_NHS_NUMBER_HASHER
+    """
+    if settings.HANS_NHS_NUMBER_HASHER == "scrypt":
+        return ScryptHasher(
+            salt=settings.HANS_SCRYPT_SALT,
+            n=settings.HANS_SCRYPT_N,
+            r=settings.HANS_SCRYPT_R,
+            p=settings.HANS_SCRYPT_P,
+        )
+    if settings.HANS_NHS_NUMBER_HASHER == "sha3_256":
+        return Sha3Hasher()
+    raise ValueError(f"Unknown NHS number hasher: {settings.HANS_NHS_NUMBER_HASHER}")
+
+
+class HashingPool:
+    """
+    Pool of worker processes that maps functions over iterables, preserving order, started once and reused for every
+    batch of a command; use as a context manager. Hashing with scrypt is deliberately CPU-bound, so bulk work is
+    spread over every core by default.
+    """
+
+    def __init__(self, workers=None, chunksize=64):
+        self.workers = workers or settings.HANS_HASH_WORKERS or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def map(self, function, *iterables):
+        if self._executor is None:
+            return list(map(function, *iterables))
+        return list(self._executor.map(function, *iterables, chunksize=self.chunksize))
@@ -0,0 +1,242 @@
+"""
+In-memory Bloom filter of every known nhs_number_hash, so that searches for patients without a subscription are
+answered without a query.
+
+A Bloom filter never reports a hash it was given as absent, but may report an unknown hash as present; those false
+positives fall through to the database as before. Each worker builds its own filter in a background thread with one
+streaming pass over care recipients, then tops it up from the change feed, which picks up subscriptions made by
+other processes, as soon as they notify that they have committed a change and every few seconds besides.
+
+A subscription another process has just made is not in the filter until the next top-up, so a hash the filter does
+not contain is only answered as unknown while it is current: it has applied every change notified so far, and is
+listening for more. Otherwise the database is asked, as it is without a filter.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# room left for growth when sizing a filter, and the share of deletions that makes a rebuild worthwhile
+CAPACITY_HEADROOM = 2
+MIN_CAPACITY = 1024
+REBUILD_DELETED_FRACTION = 0.1
+
+
+class BloomFilter:
+    """
+    Bit array sized for capacity keys at error_rate false positives, using double hashing of a BLAKE2b digest
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + number * second) % self.bits for number in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        array = self._array
+        if all(array[position >> 3] & (1 << (position & 7)) for position in positions):
+            return
+        for position in positions:
+            array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        array = self._array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def false_positive_rate(self):
+        """
+        Expected chance of reporting an unknown key as present, given the keys added so far
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class KnownHashFilter:
+    """
+    Thread-safe BloomFilter of known hashes, built and kept current by a background thread started with start().
+
+    count(), load_all() and load_changed_since(cursor) read the number of hashes, every hash, and the hashes changed
+    after a change feed cursor together with the cursor to carry on from; position() gives the cursor up to which
+    load_all() is complete. changes is the ChangeListener told of changes committed elsewhere. Until the first build
+    finishes might_contain() answers True, so nothing is answered from it.
+    """
+
+    def __init__(self, enabled, error_rate, refresh_interval, count, load_all, load_changed_since, position, changes):
+        self.enabled = enabled
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.changes = changes
+        self._count = count
+        self._load_all = load_all
+        self._load_changed_since = load_changed_since
+        self._position = position
+        self._lock = threading.Lock()
+        self._filter = None
+        # hashes added while a build is streaming, applied to the new filter before it replaces the old one
+        self._pending = None
+        self._cursor = None
+        # the notifications of changes committed elsewhere that the filter had received when last built or topped up
+        self._applied = None
+        self._thread_pid = None
+        self.deletions = 0
+        self.negatives = 0
+        self.unsure = 0
+        self.false_positives = 0
+        self.builds = 0
+        self.top_ups = 0
+        self.errors = 0
+
+    @property
+    def ready(self):
+        return self._filter is not None
+
+    @property
+    def current(self):
+        """
+        Whether every change committed elsewhere that has been notified is in the filter, and more will be notified
+        """
+        return self.changes.listening and self._applied == self.changes.received
+
+    def might_contain(self, nhs_number_hash):
+        bloom_filter = self._filter
+        if bloom_filter is None or nhs_number_hash in bloom_filter:
+            return True
+        if not self.current:
+            self.unsure += 1
+            return True
+        self.negatives += 1
+        return False
+
+    def record_false_positive(self):
+        """
+        Called when a hash the filter let through had no subscription
+        """
+        if self.ready:
+            self.false_positives += 1
+
+    def add(self, nhs_number_hash):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(nhs_number_hash)
+            if self._pending is not None:
+                self._pending.append(nhs_number_hash)
+
+    def discard(self, nhs_number_hash):
+        # hashes cannot be taken out of a Bloom filter; they linger as false positives until the next rebuild
+        with self._lock:
+            self.deletions += 1
+
+    def build(self):
+        received = self.changes.received
+        cursor = self._position()
+        with self._lock:
+            self._pending = []
+        try:
+            bloom_filter = BloomFilter(max(self._count() * CAPACITY_HEADROOM, MIN_CAPACITY), self.error_rate)
+            for nhs_number_hash in self._load_all():
+                bloom_filter.add(nhs_number_hash)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for nhs_number_hash in self._pending:
+                bloom_filter.add(nhs_number_hash)
+            self._pending = None
+            self._filter = bloom_filter
+            self._cursor = cursor
+            self._applied = received
+            self.deletions = 0
+            self.builds += 1
+
+    def top_up(self):
+        # counted first, so a notification that arrives while the changes are read leaves the filter behind
+        received = self.changes.received
+        hashes, cursor = self._load_changed_since(self._cursor)
+        for nhs_number_hash in hashes:
+            self.add(nhs_number_hash)
+        self._cursor = cursor
+        self._applied = received
+        self.top_ups += 1
+
+    def needs_rebuild(self):
+        bloom_filter = self._filter
+        return bloom_filter is None or (
+            bloom_filter.count > bloom_filter.capacity or self.deletions > bloom_filter.count * REBUILD_DELETED_FRACTION
+        )
+
+    def refresh(self):
+        """
+        Builds the filter if it needs it, otherwise tops it up
+        """
+        if self.needs_rebuild():
+            self.build()
+        else:
+            self.top_up()
+
+    def start(self):
+        """
+        Starts the background thread for this process, and the change listener, once; call after forking
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        self.changes.start()
+        threading.Thread(target=self._run, name="known-hash-filter", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                self.errors += 1
+                logger.exception("Could not refresh the known hash filter")
+            finally:
+                close_old_connections()
+            self.changes.wait(self.refresh_interval)
+
+    def clear(self):
+        """
+        Drops the filter, so every hash is looked up until it is built again
+        """
+        with self._lock:
+            self._filter = None
+            self._cursor = None
+            self._applied = None
+
+    def stats(self):
+        bloom_filter = self._filter
+        return {
+            "enabled": self.enabled,
+            "ready": bloom_filter is not None,
+            "count": bloom_filter.count if bloom_filter else 0,
+            "capacity": bloom_filter.capacity if bloom_filter else 0,
+            "bytes": len(bloom_filter._array) if bloom_filter else 0,
+            "expected_false_positive_rate": bloom_filter.false_positive_rate() if bloom_filter else 0.0,
+            "current": self.current,
+            "negatives": self.negatives,
+            "unsure": self.unsure,
+            "false_positives": self.false_positives,
+            "deletions": self.deletions,
+            "builds": self.builds,
+            "top_ups": self.top_ups,
+            "errors": self.errors,
+        }
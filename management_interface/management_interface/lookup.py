@@ -0,0 +1,204 @@
+from datetime import datetime
+from typing import NamedTuple
+from uuid import UUID
+
+from django.conf import settings
+
+from .admission import search_rate_limiter, searches_in_flight
+from .audit import lookup_audit
+from .changes import ChangeListener, committed_cursor, hashes_changed_since
+from .connection_pool import pool_statistics
+from .fields import is_hex_digest
+from .known_hashes import KnownHashFilter
+from .lookup_cache import LookupCache
+from .models import CareRecipient
+from .routers import (
+    aread_from_replica,
+    pinned_to_primary,
+    read_from_replica,
+    replicas,
+)
+from .single_flight import SingleFlight
+from .snapshot import snapshots
+
+
+class CareProviderMatch(NamedTuple):
+    """
+    The care provider location details needed to answer a search for a pseudonymous identifier,
+    with the location's pre-rendered FHIR Organization
+    """
+
+    care_recipient_id: UUID
+    care_provider_location_id: UUID
+    organization: str
+    care_recipient_updated_at: datetime
+    care_provider_location_updated_at: datetime
+
+
+MATCH_FIELDS = (
+    "id",
+    "care_provider_location_id",
+    "care_provider_location__fhir_organization",
+    "updated_at",
+    "care_provider_location__updated_at",
+)
+
+lookup_cache = LookupCache(max_size=settings.HANS_LOOKUP_CACHE_SIZE, ttl=settings.HANS_LOOKUP_CACHE_TTL)
+lookups_in_flight = SingleFlight(enabled=settings.HANS_SINGLE_FLIGHT)
+
+
+def count_hashes():
+    return CareRecipient.objects.count()
+
+
+def all_hashes():
+    return CareRecipient.objects.order_by().values_list("nhs_number_hash", flat=True).iterator(chunk_size=10000)
+
+
+known_hashes = KnownHashFilter(
+    enabled=settings.HANS_NEGATIVE_LOOKUP_FILTER,
+    error_rate=settings.HANS_NEGATIVE_LOOKUP_ERROR_RATE,
+    refresh_interval=settings.HANS_NEGATIVE_LOOKUP_REFRESH,
+    count=count_hashes,
+    load_all=all_hashes,
+    load_changed_since=hashes_changed_since,
+    position=committed_cursor,
+    changes=ChangeListener(),
+)
+
+
+def match_queryset():
+    """
+    Reads only the columns needed to answer a search, so that the care_recipient_hash_lookup covering index
+    serves the care recipient side without visiting the table
+    """
+    return CareRecipient.objects.values_list(*MATCH_FIELDS)
+
+
+def query_care_provider(nhs_number_hash):
+    try:
+        row = match_queryset().get(nhs_number_hash=nhs_number_hash)
+    except CareRecipient.DoesNotExist:
+        return None
+    return CareProviderMatch(*row)
+
+
+async def aquery_care_provider(nhs_number_hash):
+    try:
+        row = await match_queryset().aget(nhs_number_hash=nhs_number_hash)
+    except CareRecipient.DoesNotExist:
+        return None
+    return CareProviderMatch(*row)
+
+
+def query_care_providers(nhs_number_hashes):
+    matches = {}
+    rows = CareRecipient.objects.filter(nhs_number_hash__in=nhs_number_hashes).values_list(
+        "nhs_number_hash", *MATCH_FIELDS
+    )
+    for nhs_number_hash, *match in rows:
+        matches.setdefault(nhs_number_hash, CareProviderMatch(*match))
+    return matches
+
+
+def reads_primary():
+    """
+    Whether lookups read from the primary rather than a replica: when pinned to it, and for a while after this
+    process invalidated a cached lookup, since a replica that has not yet replayed the change would put its
+    predecessor back in the cache for the whole TTL
+    """
+    return pinned_to_primary.get() or lookup_cache.invalidated_within(settings.HANS_REPLICA_READ_YOUR_WRITES)
+
+
+def flight_key(nhs_number_hash, primary):
+    """
+    Lookups share a query only if it would read what each of them would have: a lookup that reads the primary never
+    waits on a replica read, nor one started after an invalidation on a query started before it
+    """
+    return nhs_number_hash, lookup_cache.generation, primary
+
+
+def load_care_provider(nhs_number_hash):
+    if reads_primary():
+        return lookups_in_flight.do(flight_key(nhs_number_hash, True), query_care_provider, nhs_number_hash)
+    return lookups_in_flight.do(
+        flight_key(nhs_number_hash, False), read_from_replica, query_care_provider, nhs_number_hash
+    )
+
+
+async def aload_care_provider(nhs_number_hash):
+    if reads_primary():
+        return await lookups_in_flight.ado(flight_key(nhs_number_hash, True), aquery_care_provider, nhs_number_hash)
+    return await lookups_in_flight.ado(
+        flight_key(nhs_number_hash, False), aread_from_replica, aquery_care_provider, nhs_number_hash
+    )
+
+
+def find_care_provider(nhs_number_hash):
+    """
+    Returns the CareProviderMatch subscribed for nhs_number_hash, or None if there is no subscription.
+    Anything other than a hex digest cannot match a stored hash, so is answered without a query, and concurrent
+    lookups of the same hash share one.
+    """
+    if not is_hex_digest(nhs_number_hash) or not known_hashes.might_contain(nhs_number_hash):
+        return None
+    match = lookup_cache.get_or_load(nhs_number_hash, load_care_provider)
+    if match is None:
+        known_hashes.record_false_positive()
+    return match
+
+
+async def afind_care_provider(nhs_number_hash):
+    """
+    As find_care_provider, using the async ORM
+    """
+    if not is_hex_digest(nhs_number_hash) or not known_hashes.might_contain(nhs_number_hash):
+        return None
+    match = await lookup_cache.aget_or_load(nhs_number_hash, aload_care_provider)
+    if match is None:
+        known_hashes.record_false_positive()
+    return match
+
+
+def find_care_providers(nhs_number_hashes):
+    """
+    Returns a dict of CareProviderMatch by hash for those of nhs_number_hashes with a subscription.
+    Everything not already cached or ruled out by known_hashes is resolved with a single query.
+    """
+    matches = {}
+    uncached = []
+    for nhs_number_hash in set(nhs_number_hashes):
+        if not is_hex_digest(nhs_number_hash) or not known_hashes.might_contain(nhs_number_hash):
+            continue
+        match = lookup_cache.get(nhs_number_hash)
+        if match is None:
+            uncached.append(nhs_number_hash)
+        else:
+            matches[nhs_number_hash] = match
+
+    if uncached:
+        generation = lookup_cache.generation
+        queried = (
+            query_care_providers(uncached) if reads_primary() else read_from_replica(query_care_providers, uncached)
+        )
+        for nhs_number_hash, match in queried.items():
+            lookup_cache.set(nhs_number_hash, match, generation=generation)
+        for _ in range(len(uncached) - len(queried)):
+            known_hashes.record_false_positive()
+        matches.update(queried)
+    return matches
+
+
+def lookup_statistics():
+    return {
+        "lookup_cache": lookup_cache.stats(),
+        "connection_pool": pool_statistics(),
+        "read_replicas": replicas.stats(),
+        "negative_lookup_filter": known_hashes.stats(),
+        "change_listener": known_hashes.changes.stats(),
+        "directory_snapshot": snapshots.stats(),
+        "single_flight": lookups_in_flight.stats(),
+        "lookup_audit": lookup_audit.stats(),
+        "search_rate_limit": search_rate_limiter.stats(),
+        "search_concurrency": searches_in_flight.stats(),
+    }
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LookupCache:
+    """
+    Thread-safe in-process read-through cache with LRU eviction and a TTL on every entry.
+
+    A max_size or ttl of zero disables caching entirely, so every call goes to the loader.
+    """
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped on every invalidation so that a load which raced with one is not stored
+        self._generation = 0
+        self._invalidated_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self):
+        """
+        Token to pass to set() for a value loaded after reading it, so the value is dropped if it may be stale
+        """
+        return self._generation
+
+    def invalidated_within(self, seconds):
+        """
+        Whether anything was invalidated in the last seconds
+        """
+        with self._lock:
+            return self._invalidated_at is not None and self._clock() - self._invalidated_at < seconds
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it is absent or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, generation=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for key, calling loader(key) on a miss.
+        Only values other than None are stored, so unknown keys are always looked up again.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        value = loader(key)
+        if value is not None:
+            self.set(key, value, generation=generation)
+        return value
+
+    async def aget_or_load(self, key, loader):
+        """
+        As get_or_load, for a coroutine loader
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        value = await loader(key)
+        if value is not None:
+            self.set(key, value, generation=generation)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = self._clock()
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_where(self, predicate):
+        """
+        Drops every entry whose value matches predicate(value)
+        """
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = self._clock()
+            stale = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
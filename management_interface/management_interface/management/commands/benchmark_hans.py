@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from management_interface.benchmarking import compare, run_benchmark
+from management_interface.routers import replicas
+
+
+def counts(value):
+    return [int(count) for count in value.split(",")]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks care_provider_search and the care recipient admin changelist against synthetic data. "
+        "Runs in a freshly created test database, which is destroyed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipients",
+            type=counts,
+            default=[10_000, 100_000, 1_000_000],
+            help="Comma-separated directory sizes to benchmark at (default: 10000,100000,1000000)",
+        )
+        parser.add_argument("--managers", type=int, default=10)
+        parser.add_argument("--locations", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=1000, help="Search requests per scenario and size")
+        parser.add_argument("--admin-requests", type=int, default=5, help="Changelist loads per size")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--partitions", type=int, default=0, help="Hash-partition the care recipient table into this many first"
+        )
+        parser.add_argument("--output", help="File to save the results to as JSON")
+        parser.add_argument("--compare", help="Results file from an earlier run to compare against")
+
+    def handle(
+        self, *args, recipients, managers, locations, requests, admin_requests, seed, partitions, output, **options
+    ):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # only the primary's connection is moved to the test database; the replicas still serve the real one
+            with replicas.disabled():
+                results = run_benchmark(
+                    recipients,
+                    managers=managers,
+                    locations=locations,
+                    requests=requests,
+                    admin_requests=admin_requests,
+                    seed=seed,
+                    partitions=partitions,
+                    log=self.stdout.write,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for result in results["results"]:
+            for name, summary in [*result["search"].items(), ("admin changelist", result["admin_changelist"])]:
+                self.stdout.write(
+                    f"{result['recipients']:>9} recipients, {name}: p50 {summary['p50_ms']:.2f} ms, "
+                    f"p95 {summary['p95_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms, "
+                    f"{summary['requests_per_second']:.0f} req/s"
+                )
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as file:
+                baseline = json.load(file)
+            self.stdout.write(f"Compared with {baseline.get('commit') or options['compare']}:")
+            for line in compare(baseline, results):
+                self.stdout.write(line)
+
+        if output:
+            with open(output, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {output}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from management_interface.export import EXPORT_FORMATS, directory_rows
+
+
+class Command(BaseCommand):
+    help = "Streams every care recipient with its care provider location and registered manager as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--output", help="File to write (default: standard output)")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched from the database at a time")
+
+    def handle(self, *args, format, output, chunk_size, **options):
+        _, render = EXPORT_FORMATS[format]
+        lines = render(directory_rows(chunk_size=chunk_size))
+        if output:
+            with open(output, "w", newline="", encoding="utf-8") as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
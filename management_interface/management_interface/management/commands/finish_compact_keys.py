@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from management_interface.compact_keys import finish_compact_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Drops the text keys and hashes kept alongside their uuid and bytea replacements by migration 0008. "
+        "Run once no instance of a release before it is left: see the README."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Compacting keys needs PostgreSQL")
+        try:
+            finish_compact_keys(log=self.stdout.write)
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS("Keys and hashes are now stored as uuid and bytea only"))
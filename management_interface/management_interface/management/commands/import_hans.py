@@ -0,0 +1,269 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+
+from management_interface.changes import record_changes
+from management_interface.hashers import HashingPool, get_hasher
+from management_interface.models import (
+    CareProviderLocation,
+    CareRecipient,
+    DirectoryChange,
+    RegisteredManager,
+)
+from management_interface.rendering import render_organization
+
+MANAGER_FIELDS = ("given_name", "family_name", "email", "cqc_registered_manager_id")
+LOCATION_FIELDS = ("name", "email", "ods_code", "cqc_location_id", "registered_manager_email")
+RECIPIENT_FIELDS = ("nhs_number", "provider_reference_id", "ods_code")
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path, file_format=None):
+    """
+    Yields (line number, row dict) for each record of a CSV file with a header row or an NDJSON file
+    """
+    file_format = file_format or ("csv" if Path(path).suffix.lower() == ".csv" else "ndjson")
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield line_number, None
+                    continue
+                yield line_number, row if isinstance(row, dict) else None
+
+
+def required(row, fields):
+    values = {}
+    for field in fields:
+        value = row.get(field)
+        value = "" if value is None else str(value).strip()
+        if not value:
+            raise RowError(f"missing {field}")
+        values[field] = value
+    return values
+
+
+def full_clean(obj, exclude):
+    try:
+        obj.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        raise RowError("; ".join(f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk imports registered managers, care provider locations and care recipients from CSV or NDJSON files. "
+        "Locations refer to their manager by registered_manager_email and recipients to their location by ods_code."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--managers", help="File of given_name, family_name, email, cqc_registered_manager_id")
+        parser.add_argument(
+            "--locations", help="File of name, email, ods_code, cqc_location_id, registered_manager_email"
+        )
+        parser.add_argument("--recipients", help="File of nhs_number, provider_reference_id, ods_code")
+        parser.add_argument(
+            "--format", choices=["csv", "ndjson"], help="File format (default: csv for .csv files, else ndjson)"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows inserted per transaction")
+        parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: one per CPU)")
+        parser.add_argument("--dry-run", action="store_true", help="Validate the files without saving anything")
+
+    def handle(self, *args, managers, locations, recipients, format, batch_size, workers, dry_run, **options):
+        if not (managers or locations or recipients):
+            raise CommandError("Nothing to import: give at least one of --managers, --locations or --recipients")
+
+        self.file_format = format
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.hasher = get_hasher()
+        self.managers_by_email = dict(RegisteredManager.objects.values_list("email", "pk"))
+        self.locations_by_ods_code = dict(CareProviderLocation.objects.values_list("ods_code", "pk"))
+        self.cqc_location_ids = set(CareProviderLocation.objects.values_list("cqc_location_id", flat=True))
+        self.provider_reference_ids = set()
+        self.nhs_number_hashes = set()
+        self.rejected = 0
+
+        # in dependency order, so that later files can refer to rows created by earlier ones
+        if managers:
+            self.import_file(managers, self.build_manager, self.insert_managers, self.forget_manager)
+        if locations:
+            self.import_file(locations, self.build_location, self.insert_locations, self.forget_location)
+        if recipients:
+            with HashingPool(workers) as self.hashing_pool:
+                self.import_file(
+                    recipients,
+                    self.build_recipient,
+                    self.insert_recipients,
+                    self.forget_recipient,
+                    prepare=self.prepare_recipients,
+                )
+
+        if self.rejected:
+            self.stdout.write(self.style.WARNING(f"Rejected {self.rejected} rows"))
+
+    def import_file(self, path, build, insert, forget, prepare=None):
+        imported = 0
+        batch = []
+        for line_number, row in read_rows(path, self.file_format):
+            try:
+                if row is None:
+                    raise RowError("not a JSON object")
+                batch.append((line_number, build(row)))
+            except RowError as e:
+                self.reject(path, line_number, e)
+            if len(batch) >= self.batch_size:
+                imported += self.insert_batch(path, batch, insert, forget, prepare)
+                batch = []
+        if batch:
+            imported += self.insert_batch(path, batch, insert, forget, prepare)
+
+        verb = "Validated" if self.dry_run else "Imported"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {imported} rows from {path}"))
+
+    def insert_batch(self, path, batch, insert, forget, prepare):
+        if prepare is not None:
+            # rows it rejects are left out, so a batch that fails to save reports each row once
+            batch = prepare(path, batch)
+        try:
+            with transaction.atomic():
+                return insert(path, batch)
+        except DatabaseError as e:
+            for line_number, obj in batch:
+                # so that later rows cannot refer to it, or are not taken for duplicates of it
+                forget(obj)
+                self.reject(path, line_number, f"batch failed to save: {e}")
+            return 0
+
+    def reject(self, path, line_number, error):
+        self.rejected += 1
+        self.stderr.write(f"{path}:{line_number}: {error}")
+
+    def build_manager(self, row):
+        values = required(row, MANAGER_FIELDS)
+        if values["email"] in self.managers_by_email:
+            raise RowError(f"registered manager {values['email']} already exists")
+        manager = RegisteredManager(**values)
+        full_clean(manager, exclude=["id"])
+        self.managers_by_email[manager.email] = manager.pk
+        return manager
+
+    def forget_manager(self, manager):
+        del self.managers_by_email[manager.email]
+
+    def insert_managers(self, path, batch):
+        managers = [manager for _, manager in batch]
+        if not self.dry_run:
+            RegisteredManager.objects.bulk_create(managers)
+        return len(managers)
+
+    def build_location(self, row):
+        values = required(row, LOCATION_FIELDS)
+        manager_email = values.pop("registered_manager_email")
+        try:
+            registered_manager_id = self.managers_by_email[manager_email]
+        except KeyError:
+            raise RowError(f"no registered manager with email {manager_email}")
+        if values["ods_code"] in self.locations_by_ods_code:
+            raise RowError(f"care provider location {values['ods_code']} already exists")
+        if values["cqc_location_id"] in self.cqc_location_ids:
+            raise RowError(f"CQC location {values['cqc_location_id']} already exists")
+
+        location = CareProviderLocation(registered_manager_id=registered_manager_id, **values)
+        full_clean(location, exclude=["id", "registered_manager"])
+        location.fhir_organization = render_organization(location.name, location.email)
+        self.locations_by_ods_code[location.ods_code] = location.pk
+        self.cqc_location_ids.add(location.cqc_location_id)
+        return location
+
+    def forget_location(self, location):
+        del self.locations_by_ods_code[location.ods_code]
+        self.cqc_location_ids.discard(location.cqc_location_id)
+
+    def insert_locations(self, path, batch):
+        locations = [location for _, location in batch]
+        if not self.dry_run:
+            CareProviderLocation.objects.bulk_create(locations)
+        return len(locations)
+
+    def build_recipient(self, row):
+        values = required(row, RECIPIENT_FIELDS)
+        ods_code = values.pop("ods_code")
+        try:
+            care_provider_location_id = self.locations_by_ods_code[ods_code]
+        except KeyError:
+            raise RowError(f"no care provider location with ODS code {ods_code}")
+        if values["provider_reference_id"] in self.provider_reference_ids:
+            raise RowError(f"provider reference {values['provider_reference_id']} appears more than once")
+
+        # hashed a batch at a time in insert_recipients rather than by clean()
+        nhs_number = values.pop("nhs_number")
+        recipient = CareRecipient(care_provider_location_id=care_provider_location_id, **values)
+        full_clean(recipient, exclude=["id", "care_provider_location", "nhs_number_hash", "subscription_id"])
+        recipient.nhs_number = nhs_number
+        self.provider_reference_ids.add(recipient.provider_reference_id)
+        return recipient
+
+    def forget_recipient(self, recipient):
+        self.provider_reference_ids.discard(recipient.provider_reference_id)
+        self.nhs_number_hashes.discard(recipient.nhs_number_hash)
+
+    def prepare_recipients(self, path, batch):
+        """
+        Hashes a batch of recipients before its transaction opens, and leaves out those already in the directory
+        """
+        hashes = self.hashing_pool.map(self.hasher.hash_nhs_number, [recipient.nhs_number for _, recipient in batch])
+        existing_references = set(
+            CareRecipient.objects.filter(
+                provider_reference_id__in=[recipient.provider_reference_id for _, recipient in batch]
+            ).values_list("provider_reference_id", flat=True)
+        )
+        # searches expect one care recipient per hash
+        existing_hashes = set(
+            CareRecipient.objects.filter(nhs_number_hash__in=hashes).values_list("nhs_number_hash", flat=True)
+        )
+        prepared = []
+        for (line_number, recipient), nhs_number_hash in zip(batch, hashes):
+            recipient.nhs_number_hash = nhs_number_hash
+            recipient.nhs_number_hash_scheme = self.hasher.scheme
+            recipient.nhs_number = None
+            if recipient.provider_reference_id in existing_references:
+                error = f"provider reference {recipient.provider_reference_id} already exists"
+            elif nhs_number_hash in existing_hashes:
+                error = "NHS number is already subscribed"
+            elif nhs_number_hash in self.nhs_number_hashes:
+                error = "NHS number appears more than once"
+            else:
+                self.nhs_number_hashes.add(nhs_number_hash)
+                prepared.append((line_number, recipient))
+                continue
+            self.provider_reference_ids.discard(recipient.provider_reference_id)
+            self.reject(path, line_number, error)
+        return prepared
+
+    def insert_recipients(self, path, batch):
+        recipients = [recipient for _, recipient in batch]
+        if not self.dry_run:
+            CareRecipient.objects.bulk_create(recipients)
+            # bulk_create sends no signals, so the change feed is written here
+            record_changes(
+                DirectoryChange.Entity.CARE_RECIPIENT,
+                DirectoryChange.Action.SAVED,
+                [recipient.nhs_number_hash for recipient in recipients],
+            )
+        return len(recipients)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from management_interface.partitioning import COPY_BATCH_SIZE, partition_care_recipients
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the care recipient table to hash partitions on nhs_number_hash while the service keeps running. "
+        "One-way: see the README before running it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--partitions", type=int, default=16, help="Number of hash partitions (default: 16)")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=COPY_BATCH_SIZE,
+            help=f"Care recipients copied per transaction (default: {COPY_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--keep-unpartitioned",
+            action="store_true",
+            help="Keep the original table, no longer updated, as management_interface_carerecipient_unpartitioned",
+        )
+
+    def handle(self, *args, partitions, batch_size, keep_unpartitioned, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning needs PostgreSQL")
+        if partitions < 2:
+            raise CommandError("--partitions must be at least 2")
+        try:
+            partition_care_recipients(
+                partitions, batch_size=batch_size, keep_unpartitioned=keep_unpartitioned, log=self.stdout.write
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f"Care recipients are now in {partitions} hash partitions"))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from management_interface.changes import record_changes
+from management_interface.hashers import HashingPool, get_hasher
+from management_interface.models import CareRecipient, DirectoryChange
+
+
+class Command(BaseCommand):
+    help = "Re-hashes every care recipient's nhs_number_hash under the currently configured hashing scheme"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Care recipients updated per transaction")
+        parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: one per CPU)")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without saving")
+
+    def handle(self, *args, batch_size, workers, dry_run, **options):
+        hasher = get_hasher()
+        outdated = (
+            CareRecipient.objects.exclude(nhs_number_hash_scheme=hasher.scheme)
+            .order_by("pk")
+            .values_list("pk", "nhs_number_hash", "nhs_number_hash_scheme")
+        )
+
+        with HashingPool(workers) as pool:
+            rehashed, skipped = self.rehash(hasher, outdated, pool, batch_size, dry_run)
+
+        verb = "Would rehash" if dry_run else "Rehashed"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {rehashed} care recipients to {hasher.scheme}, skipped {skipped}")
+        )
+
+    def rehash(self, hasher, outdated, pool, batch_size, dry_run):
+        rehashed = 0
+        skipped = 0
+        last_pk = None
+        while True:
+            batch = outdated if last_pk is None else outdated.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            pks, hashes, schemes = zip(*batch)
+            new_hashes = pool.map(hasher.upgrade, hashes, schemes)
+
+            now = timezone.now()
+            updates = []
+            replaced = []
+            for pk, old_hash, scheme, new_hash in zip(pks, hashes, schemes, new_hashes):
+                if new_hash is None:
+                    skipped += 1
+                    self.stderr.write(f"Cannot rehash care recipient {pk} from scheme {scheme}")
+                    continue
+                updates.append(
+                    CareRecipient(pk=pk, nhs_number_hash=new_hash, nhs_number_hash_scheme=hasher.scheme, updated_at=now)
+                )
+                replaced.append(old_hash)
+
+            if not dry_run:
+                with transaction.atomic():
+                    CareRecipient.objects.bulk_update(
+                        updates, ["nhs_number_hash", "nhs_number_hash_scheme", "updated_at"]
+                    )
+                    # bulk_update sends no signals, so the change feed is written here
+                    record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.DELETED, replaced)
+                    record_changes(
+                        DirectoryChange.Entity.CARE_RECIPIENT,
+                        DirectoryChange.Action.SAVED,
+                        [update.nhs_number_hash for update in updates],
+                    )
+            rehashed += len(updates)
+            self.stdout.write(f"Processed {rehashed + skipped} care recipients")
+        return rehashed, skipped
@@ -0,0 +1,82 @@
+import json
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# loads the app as a gunicorn worker would, in a fresh interpreter so nothing is already imported
+PROFILE_SCRIPT = """
+import json
+import sys
+import time
+
+started = time.perf_counter()
+from management_interface.wsgi import application
+timings = {"load_app": time.perf_counter() - started}
+
+from management_interface import warmup
+
+timings.update(warmup.warm_up_process())
+if sys.argv[1] == "connect":
+    timings.update(warmup.warm_up_connections())
+print(json.dumps(timings))
+"""
+
+
+def parse_import_times(output):
+    """
+    Returns (module, self seconds, cumulative seconds) for each line of python -X importtime output
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        if not self_us.strip().isdigit():
+            continue
+        imports.append((module.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return imports
+
+
+def time_by_package(imports):
+    packages = Counter()
+    for module, self_seconds, _ in imports:
+        packages[module.split(".")[0]] += self_seconds
+    return packages
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports where a worker's startup time goes: loading the app, each warm-up step, and the slowest imports. "
+        "Runs in a separate interpreter, so the report reflects a cold start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=15, help="Imports and packages to list (default: 15)")
+        parser.add_argument("--connect", action="store_true", help="Also time connecting to each database")
+
+    def handle(self, *args, limit, connect, **options):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROFILE_SCRIPT, "connect" if connect else "no-connect"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Loading the app failed:\n{result.stderr[-2000:]}")
+        timings = json.loads(result.stdout.splitlines()[-1])
+        imports = parse_import_times(result.stderr)
+
+        self.stdout.write(f"Loaded the app in {timings.pop('load_app') * 1000:.0f} ms, then warmed up:")
+        for step, seconds in timings.items():
+            self.stdout.write(f"  {seconds * 1000:8.1f} ms  {step}")
+
+        self.stdout.write("Slowest imports, including everything they import:")
+        for module, _, cumulative in sorted(imports, key=lambda row: row[2], reverse=True)[:limit]:
+            self.stdout.write(f"  {cumulative * 1000:8.1f} ms  {module}")
+
+        self.stdout.write("Import time by package:")
+        for package, seconds in time_by_package(imports).most_common(limit):
+            self.stdout.write(f"  {seconds * 1000:8.1f} ms  {package}")
@@ -0,0 +1,195 @@
+"""
+Per-request wall time, database time and query counts, labelled by view and exposed in the Prometheus text format.
+
+Metrics are held per worker process, so a scrape sees the process that answered it.
+"""
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, value):
+        with self._lock:
+            counts, total = self._series.get(view, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[view] = (counts, total + value)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for view, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, view):
+        with self._lock:
+            self._series[view] = self._series.get(view, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines.extend(f'{self.name}{{view="{view}"}} {value}' for view, value in series)
+        return lines
+
+
+REQUEST_DURATION = Histogram("hans_request_duration_seconds", "Wall time spent handling requests", DURATION_BUCKETS)
+DB_DURATION = Histogram("hans_db_duration_seconds", "Time spent in database queries per request", DURATION_BUCKETS)
+QUERY_COUNT = Histogram("hans_db_queries", "Database queries issued per request", QUERY_COUNT_BUCKETS)
+QUERY_BUDGET_EXCEEDED = Counter(
+    "hans_query_budget_exceeded_total", "Requests that issued more queries than HANS_MI_QUERY_BUDGET"
+)
+METRICS = (REQUEST_DURATION, DB_DURATION, QUERY_COUNT, QUERY_BUDGET_EXCEEDED)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# shared with the threads that run async ORM queries, since sync_to_async copies the context
+request_query_stats = ContextVar("request_query_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query's time to the current request's QueryStats
+    """
+    stats = request_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created receiver, so that every database connection of every thread reports its queries
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def view_name(request):
+    resolver_match = getattr(request, "resolver_match", None)
+    return resolver_match.view_name if resolver_match else "unmatched"
+
+
+def record_request(request, started, stats):
+    view = view_name(request)
+    REQUEST_DURATION.observe(view, time.perf_counter() - started)
+    DB_DURATION.observe(view, stats.duration)
+    QUERY_COUNT.observe(view, stats.count)
+    if stats.count > settings.HANS_QUERY_BUDGET:
+        QUERY_BUDGET_EXCEEDED.inc(view)
+        logger.warning(
+            "%s %s (%s) issued %d queries, over the budget of %d",
+            request.method,
+            request.path,
+            view,
+            stats.count,
+            settings.HANS_QUERY_BUDGET,
+        )
+
+
+class RequestMetricsMiddleware:
+    """
+    Records wall time, database time and query count for every request, labelled by view name
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # marks this instance as a coroutine function to Django's handler, as in Django 4.1's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = request_query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            request_query_stats.reset(token)
+            record_request(request, started, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = request_query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            request_query_stats.reset(token)
+            record_request(request, started, stats)
+
+
+def render_statistics(statistics):
+    """
+    Renders the numeric values of lookup_statistics() as gauges, e.g. hans_lookup_cache_hits
+    """
+    lines = []
+    for section, values in sorted(statistics.items()):
+        for key, value in sorted(values.items()):
+            if isinstance(value, (bool, int, float)):
+                name = f"hans_{section}_{key}"
+                lines.extend([f"# TYPE {name} gauge", f"{name} {float(value)}"])
+    return lines
+
+
+def render_metrics(statistics):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(render_statistics(statistics))
+    return "\n".join(lines) + "\n"
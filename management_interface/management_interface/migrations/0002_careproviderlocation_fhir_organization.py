@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+from management_interface.rendering import render_organization
+
+
+def render_organizations(apps, schema_editor):
+    CareProviderLocation = apps.get_model("management_interface", "CareProviderLocation")
+    locations = []
+    for location in CareProviderLocation.objects.only("id", "name", "email").iterator(chunk_size=1000):
+        location.fhir_organization = render_organization(location.name, location.email)
+        locations.append(location)
+    CareProviderLocation.objects.bulk_update(locations, ["fhir_organization"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("management_interface", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="careproviderlocation",
+            name="fhir_organization",
+            field=models.TextField(default="", editable=False),
+        ),
+        migrations.RunPython(render_organizations, migrations.RunPython.noop),
+    ]
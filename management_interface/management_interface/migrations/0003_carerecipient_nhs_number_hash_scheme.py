@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("management_interface", "0002_careproviderlocation_fhir_organization"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="carerecipient",
+            name="nhs_number_hash_scheme",
+            field=models.CharField(default="sha3_256", editable=False, max_length=64),
+        ),
+    ]
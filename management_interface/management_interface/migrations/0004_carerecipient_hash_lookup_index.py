@@ -0,0 +1,30 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; building the covering index this way
+    # keeps care recipients writable, and the old single-column index is only dropped once it exists
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0003_carerecipient_nhs_number_hash_scheme"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="carerecipient",
+            index=models.Index(
+                fields=["nhs_number_hash"],
+                include=("id", "care_provider_location"),
+                name="care_recipient_hash_lookup",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="carerecipient",
+            name="nhs_number_hash",
+            field=models.CharField(editable=False, max_length=128),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0004_carerecipient_hash_lookup_index"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="carerecipient",
+            index=models.Index(
+                fields=["updated_at"],
+                include=("nhs_number_hash",),
+                name="care_recipient_recent_changes",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0005_carerecipient_recent_changes_index"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="carerecipient",
+            index=models.Index(
+                fields=["provider_reference_id"],
+                name="care_recipient_ref_prefix",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
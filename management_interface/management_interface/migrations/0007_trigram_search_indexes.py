@@ -0,0 +1,32 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:00
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+def trigram_index(model_name, field, name):
+    return AddIndexConcurrently(
+        model_name=model_name,
+        index=GinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=name),
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0006_carerecipient_ref_prefix_index"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        trigram_index("careproviderlocation", "name", "location_name_trgm"),
+        trigram_index("careproviderlocation", "email", "location_email_trgm"),
+        trigram_index("careproviderlocation", "ods_code", "location_ods_code_trgm"),
+        trigram_index("careproviderlocation", "cqc_location_id", "location_cqc_id_trgm"),
+        trigram_index("registeredmanager", "given_name", "manager_given_name_trgm"),
+        trigram_index("registeredmanager", "family_name", "manager_family_name_trgm"),
+        trigram_index("registeredmanager", "email", "manager_email_trgm"),
+    ]
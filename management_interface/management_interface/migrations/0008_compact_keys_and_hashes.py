@@ -0,0 +1,231 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:00
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import management_interface.fields
+
+MANAGERS = "management_interface_registeredmanager"
+LOCATIONS = "management_interface_careproviderlocation"
+RECIPIENTS = "management_interface_carerecipient"
+
+BACKFILL_BATCH_SIZE = 10000
+
+# (table, text column, uuid or bytea shadow column, shadow value from the text column, text value from the shadow)
+SHADOWS = [
+    (MANAGERS, "id", "uuid", "NEW.id::uuid", "NEW.uuid::text"),
+    (LOCATIONS, "id", "uuid", "NEW.id::uuid", "NEW.uuid::text"),
+    (
+        LOCATIONS,
+        "registered_manager_id",
+        "registered_manager_uuid",
+        "NEW.registered_manager_id::uuid",
+        f"COALESCE((SELECT id FROM {MANAGERS} WHERE uuid = NEW.registered_manager_uuid), "
+        "NEW.registered_manager_uuid::text)",
+    ),
+    (RECIPIENTS, "id", "uuid", "NEW.id::uuid", "NEW.uuid::text"),
+    (
+        RECIPIENTS,
+        "care_provider_location_id",
+        "care_provider_location_uuid",
+        "NEW.care_provider_location_id::uuid",
+        f"COALESCE((SELECT id FROM {LOCATIONS} WHERE uuid = NEW.care_provider_location_uuid), "
+        "NEW.care_provider_location_uuid::text)",
+    ),
+    (
+        RECIPIENTS,
+        "nhs_number_hash",
+        "nhs_number_digest",
+        "decode(NEW.nhs_number_hash, 'hex')",
+        "encode(NEW.nhs_number_digest, 'hex')",
+    ),
+]
+TABLES = [MANAGERS, LOCATIONS, RECIPIENTS]
+
+
+def shadows(table):
+    return [shadow for shadow in SHADOWS if shadow[0] == table]
+
+
+def sync_trigger(table):
+    """
+    Keeps each text column and its shadow in step, from whichever of the two a write set, so instances of the
+    previous release, which write the text columns, and of this one, which write the shadows, can run side by side
+    """
+    statements = []
+    for _, text, shadow, to_shadow, to_text in shadows(table):
+        statements.append(
+            f"""
+            IF TG_OP = 'INSERT' THEN
+                IF NEW.{shadow} IS NULL THEN
+                    NEW.{shadow} := {to_shadow};
+                END IF;
+            ELSIF NEW.{text} IS DISTINCT FROM OLD.{text} THEN
+                NEW.{shadow} := {to_shadow};
+            END IF;
+            -- leaves a text value alone if it already converts to the shadow, as backfilled rows do
+            IF NEW.{text} IS NULL OR {to_shadow} IS DISTINCT FROM NEW.{shadow} THEN
+                NEW.{text} := {to_text};
+            END IF;
+            """
+        )
+    body = "".join(statements)
+    return [
+        f"CREATE FUNCTION {table}_sync_keys() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN {body} RETURN NEW; END $$",
+        f"CREATE TRIGGER {table}_sync_keys BEFORE INSERT OR UPDATE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {table}_sync_keys()",
+    ]
+
+
+def add_shadow_columns(apps, schema_editor):
+    """
+    Adds uuid and bytea copies of the text columns being converted, kept in step by a trigger from here on
+    """
+    for table in TABLES:
+        columns = ", ".join(
+            f"ADD COLUMN {shadow} {'bytea' if shadow == 'nhs_number_digest' else 'uuid'}"
+            for _, _, shadow, _, _ in shadows(table)
+        )
+        schema_editor.execute(f"ALTER TABLE {table} {columns}")
+        for statement in sync_trigger(table):
+            schema_editor.execute(statement)
+
+
+def backfill(apps, schema_editor):
+    """
+    Fills the shadow columns of existing rows in batches, each committed on its own so no lock is held for long
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            assignments = ", ".join(
+                f"{shadow} = {to_shadow.replace('NEW.', 'target.')}" for _, _, shadow, to_shadow, _ in shadows(table)
+            )
+            last_id = ""
+            while True:
+                # the database orders the keys, so the next batch starts where this one ended under its collation
+                cursor.execute(
+                    f"""
+                    WITH batch AS (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s),
+                    updated AS (UPDATE {table} target SET {assignments} FROM batch WHERE target.id = batch.id)
+                    SELECT count(*), max(id) FROM batch
+                    """,
+                    [last_id, BACKFILL_BATCH_SIZE],
+                )
+                selected, last_id = cursor.fetchone()
+                if selected < BACKFILL_BATCH_SIZE:
+                    break
+
+
+def index_shadow_columns(apps, schema_editor):
+    """
+    Builds the unique indexes that later become primary keys, and the foreign key indexes, without blocking writes
+    """
+    for table in TABLES:
+        schema_editor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY {table}_uuid_key ON {table} (uuid)")
+    for table, column in ((LOCATIONS, "registered_manager_uuid"), (RECIPIENTS, "care_provider_location_uuid")):
+        name = schema_editor._create_index_name(table, [column])
+        schema_editor.execute(f"CREATE INDEX CONCURRENTLY {name} ON {table} ({column})")
+
+
+def check_not_null(apps, schema_editor):
+    """
+    Proves every shadow column filled, so a later SET NOT NULL needs no scan; separate statements, so the scan
+    made by VALIDATE runs without the lock taken to add the constraint
+    """
+    for table, _, shadow, _, _ in SHADOWS:
+        schema_editor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {shadow}_not_null CHECK ({shadow} IS NOT NULL) NOT VALID"
+        )
+        schema_editor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {shadow}_not_null")
+
+
+class Migration(migrations.Migration):
+    # Converts primary and foreign keys from 64-character strings to uuid, and nhs_number_hash from hex text to
+    # bytea, without downtime, in two releases.
+    #
+    # This is the first. It adds uuid and bytea shadow columns next to the text ones, with a trigger keeping each
+    # pair in step, backfills existing rows in committed batches and builds the shadows' indexes concurrently.
+    # The models read and write the shadows from this release on, while the trigger keeps the text columns
+    # current for instances of the previous release still running during the deploy. The text columns keep their
+    # keys and indexes, so each release is served by the indexes it queries, including care_recipient_hash_lookup,
+    # whose text version is renamed out of the way.
+    #
+    # A later release runs finish_compact_keys once no instance of the previous one is left: it drops the text
+    # columns, their indexes and the trigger, and makes the shadows the primary and foreign keys.
+    #
+    # subscription_id stays text: it is not part of any join or search, and the model accepts any string up to 64
+    # characters in it, not just a uuid. care_recipient_recent_changes, which nothing reads any more, is not
+    # rebuilt, and goes with the text nhs_number_hash column.
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0007_trigram_search_indexes"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_shadow_columns),
+                migrations.RunPython(backfill),
+                migrations.RunPython(index_shadow_columns),
+                migrations.RunSQL(
+                    "ALTER INDEX care_recipient_hash_lookup RENAME TO care_recipient_hash_lookup_text",
+                    "ALTER INDEX care_recipient_hash_lookup_text RENAME TO care_recipient_hash_lookup",
+                ),
+                migrations.RunSQL(
+                    f"CREATE INDEX CONCURRENTLY care_recipient_hash_lookup ON {RECIPIENTS} (nhs_number_digest) "
+                    "INCLUDE (uuid, care_provider_location_uuid)"
+                ),
+                migrations.RunPython(check_not_null),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(model_name="carerecipient", name="care_recipient_recent_changes"),
+                migrations.AlterField(
+                    model_name="registeredmanager",
+                    name="id",
+                    field=models.UUIDField(
+                        db_column="uuid", default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="careproviderlocation",
+                    name="id",
+                    field=models.UUIDField(
+                        db_column="uuid", default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="careproviderlocation",
+                    name="registered_manager",
+                    field=models.ForeignKey(
+                        db_column="registered_manager_uuid",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="management_interface.registeredmanager",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="carerecipient",
+                    name="id",
+                    field=models.UUIDField(
+                        db_column="uuid", default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="carerecipient",
+                    name="care_provider_location",
+                    field=models.ForeignKey(
+                        db_column="care_provider_location_uuid",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="management_interface.careproviderlocation",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="carerecipient",
+                    name="nhs_number_hash",
+                    field=management_interface.fields.HexDigestField(db_column="nhs_number_digest"),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+import management_interface.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("management_interface", "0008_compact_keys_and_hashes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirectoryChange",
+            fields=[
+                ("sequence", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "changed_at",
+                    models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+                (
+                    "entity",
+                    models.CharField(
+                        choices=[
+                            ("care_recipient", "Care Recipient"),
+                            ("care_provider_location", "Care Provider Location"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("saved", "Saved"), ("deleted", "Deleted")],
+                        max_length=16,
+                    ),
+                ),
+                ("nhs_number_hash", management_interface.fields.HexDigestField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:33
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+import management_interface.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("management_interface", "0009_directorychange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LookupAuditDay",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "outcome",
+                    models.CharField(
+                        choices=[
+                            ("hit", "Hit"),
+                            ("miss", "Miss"),
+                            ("bad_request", "Bad Request"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("lookups", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LookupAuditEvent",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("looked_up_at", models.DateTimeField()),
+                (
+                    "outcome",
+                    models.CharField(
+                        choices=[
+                            ("hit", "Hit"),
+                            ("miss", "Miss"),
+                            ("bad_request", "Bad Request"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                (
+                    "nhs_number_hash",
+                    management_interface.fields.HexDigestField(blank=True),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="lookupauditevent",
+            index=django.contrib.postgres.indexes.BrinIndex(fields=["looked_up_at"], name="lookup_audit_event_time"),
+        ),
+        migrations.AddConstraint(
+            model_name="lookupauditday",
+            constraint=models.UniqueConstraint(fields=("day", "outcome"), name="lookup_audit_day_outcome"),
+        ),
+    ]
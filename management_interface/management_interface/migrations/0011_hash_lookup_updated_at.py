@@ -0,0 +1,37 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:10
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the covering index gains updated_at, for the Last-Modified of GET searches; the new one is built alongside
+    # the old, so lookups keep an index-only scan throughout
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0010_lookup_audit"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="carerecipient",
+            index=models.Index(
+                fields=["nhs_number_hash"],
+                include=("id", "care_provider_location", "updated_at"),
+                name="care_recipient_hash_lookup_new",
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="carerecipient",
+            name="care_recipient_hash_lookup",
+        ),
+        migrations.RenameIndex(
+            model_name="carerecipient",
+            new_name="care_recipient_hash_lookup",
+            old_name="care_recipient_hash_lookup_new",
+        ),
+    ]
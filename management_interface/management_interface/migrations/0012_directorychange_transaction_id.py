@@ -0,0 +1,53 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:02
+
+import django.db.models.functions.datetime
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+import management_interface.models
+
+
+class Migration(migrations.Migration):
+    # the change feed is read in commit-safe order by the id of the transaction that wrote each change. The column
+    # is added with a constant default, which does not rewrite the table, then given the transaction id as its
+    # database default, so changes the previous release writes during a rolling deploy get one too
+    atomic = False
+
+    dependencies = [
+        ("management_interface", "0011_hash_lookup_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="directorychange",
+            name="changed_at",
+            field=models.DateTimeField(default=django.db.models.functions.datetime.Now, editable=False),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "ALTER TABLE management_interface_directorychange "
+                    "ADD COLUMN transaction_id bigint NOT NULL DEFAULT 0",
+                    "ALTER TABLE management_interface_directorychange DROP COLUMN transaction_id",
+                ),
+                migrations.RunSQL(
+                    "ALTER TABLE management_interface_directorychange "
+                    "ALTER COLUMN transaction_id SET DEFAULT pg_current_xact_id()::text::bigint",
+                    migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name="directorychange",
+                    name="transaction_id",
+                    field=models.BigIntegerField(
+                        default=management_interface.models.CurrentTransactionId, editable=False
+                    ),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name="directorychange",
+            index=models.Index(fields=["transaction_id", "sequence"], name="directory_change_cursor"),
+        ),
+    ]
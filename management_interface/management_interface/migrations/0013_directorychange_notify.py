@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 18:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # notifies listeners on the directory_change channel as a transaction that records changes commits, so workers
+    # top up their known hash filters as soon as another process changes the directory. Postgres delivers the
+    # notification on commit, once per transaction however many changes it records
+
+    dependencies = [
+        ("management_interface", "0012_directorychange_transaction_id"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION directory_change_notify() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                PERFORM pg_notify('directory_change', '');
+                RETURN NULL;
+            END;
+            $$;
+            CREATE TRIGGER directory_change_notify
+                AFTER INSERT ON management_interface_directorychange
+                FOR EACH STATEMENT EXECUTE FUNCTION directory_change_notify();
+            """,
+            """
+            DROP TRIGGER directory_change_notify ON management_interface_directorychange;
+            DROP FUNCTION directory_change_notify();
+            """,
+        ),
+    ]
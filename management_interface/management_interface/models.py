@@ -1,11 +1,16 @@
-import hashlib
 import uuid
 
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, OpClass
 from django.core.validators import EmailValidator
 from django.db import models
+from django.db.models.functions import Now, Upper
 from django.utils import timezone
 
+from .fields import HexDigestField
+from .hashers import Sha3Hasher, get_hasher
+from .rendering import render_organization
+
 
 class SecureEmailValidator(EmailValidator):
     message = "Enter an nhs.net email address"
@@ -17,6 +22,13 @@ class SecureEmailValidator(EmailValidator):
         return False
 
 
+def trigram_index(field, name):
+    """
+    GIN trigram index on UPPER(field), the expression the admin's icontains searches compile to
+    """
+    return GinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=name)
+
+
 class BaseModel(models.Model):
     """
     Base model holding shared data
@@ -25,7 +37,8 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
-    id = models.CharField(primary_key=True, max_length=64, default=uuid.uuid4, editable=False, unique=True)
+    # the text keys of earlier releases stay alongside until finish_compact_keys, so these have columns of their own
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, db_column="uuid")
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
     created_by = models.ForeignKey(
@@ -41,13 +54,25 @@ class CareProviderLocation(BaseModel):
     Model that represents a registered care provider location (branch) who wants to receive emails.
     """
 
+    class Meta:
+        indexes = [
+            trigram_index("name", "location_name_trgm"),
+            trigram_index("email", "location_email_trgm"),
+            trigram_index("ods_code", "location_ods_code_trgm"),
+            trigram_index("cqc_location_id", "location_cqc_id_trgm"),
+        ]
+
     name = models.CharField(max_length=256, help_text="Your Care Provider Branch Name")
     email = models.EmailField(
         null=False, db_index=True, help_text="example@nhs.net", validators=[SecureEmailValidator()]
     )
     ods_code = models.CharField(null=False, max_length=16, unique=True, help_text="XXXABCD")
     cqc_location_id = models.CharField(null=False, max_length=128, unique=True, help_text="1-110XXXXXXXX")
-    registered_manager = models.ForeignKey("RegisteredManager", on_delete=models.CASCADE)
+    registered_manager = models.ForeignKey(
+        "RegisteredManager", on_delete=models.CASCADE, db_column="registered_manager_uuid"
+    )
+    # FHIR Organization JSON returned by care_provider_search, kept in step with name and email by save()
+    fhir_organization = models.TextField(editable=False, default="")
 
     def __str__(self):
         return f"{self.name}"
@@ -55,12 +80,26 @@ class CareProviderLocation(BaseModel):
     def clean(self):
         self.email = str(self.email).strip()
 
+    def save(self, *args, **kwargs):
+        self.fhir_organization = render_organization(self.name, self.email)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"name", "email"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "fhir_organization"}
+        super().save(*args, **kwargs)
+
 
 class RegisteredManager(BaseModel):
     """
     Model that represents somebody who is a Care Quality Commission (CQC) registered manager.
     """
 
+    class Meta:
+        indexes = [
+            trigram_index("given_name", "manager_given_name_trgm"),
+            trigram_index("family_name", "manager_family_name_trgm"),
+            trigram_index("email", "manager_email_trgm"),
+        ]
+
     given_name = models.CharField(max_length=256, db_index=True, help_text="Aislinn")
     family_name = models.CharField(max_length=256, db_index=True, help_text="Mullen")
     email = models.EmailField(
@@ -81,8 +120,28 @@ class CareRecipient(BaseModel):
     and who has had a HANS subscription made for them.
     """
 
-    care_provider_location = models.ForeignKey("CareProviderLocation", on_delete=models.CASCADE)
-    nhs_number_hash = models.CharField(null=False, max_length=128, db_index=True, editable=False)
+    class Meta:
+        indexes = [
+            # lets care_provider_search resolve a hash to its location, and when it changed, with an index-only scan
+            models.Index(
+                fields=["nhs_number_hash"],
+                include=["id", "care_provider_location", "updated_at"],
+                name="care_recipient_hash_lookup",
+            ),
+            # serves the admin's prefix search, which the unique index cannot under a non-C collation
+            models.Index(
+                fields=["provider_reference_id"],
+                opclasses=["varchar_pattern_ops"],
+                name="care_recipient_ref_prefix",
+            ),
+        ]
+
+    care_provider_location = models.ForeignKey(
+        "CareProviderLocation", on_delete=models.CASCADE, db_column="care_provider_location_uuid"
+    )
+    # a hex digest in Python, stored as its raw bytes
+    nhs_number_hash = HexDigestField(null=False, db_column="nhs_number_digest")
+    nhs_number_hash_scheme = models.CharField(max_length=64, default=Sha3Hasher.scheme, editable=False)
     subscription_id = models.CharField(
         null=False, max_length=64, db_index=True, unique=True, editable=False, default=uuid.uuid4
     )
@@ -94,8 +153,98 @@ class CareRecipient(BaseModel):
     def __str__(self):
         return f'"{self.provider_reference_id}" ({self.care_provider_location})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets a later save tell whether it replaced the hash
+        if "nhs_number_hash" in field_names:
+            instance.loaded_nhs_number_hash = instance.nhs_number_hash
+        return instance
+
     def clean(self):
-        # to be replaced by Scrypt
         if self.nhs_number is not None:
-            self.nhs_number_hash = hashlib.sha3_256(str(self.nhs_number).encode()).hexdigest()
+            hasher = get_hasher()
+            self.nhs_number_hash = hasher.hash_nhs_number(self.nhs_number)
+            self.nhs_number_hash_scheme = hasher.scheme
             self.nhs_number = None
+
+
+class CurrentTransactionId(models.Func):
+    """
+    The 64-bit id of the transaction that evaluates it, which Postgres assigns in the order transactions first write
+    """
+
+    template = "pg_current_xact_id()::text::bigint"
+    output_field = models.BigIntegerField()
+
+
+class DirectoryChange(models.Model):
+    """
+    Append-only log of the hashes whose care_provider_search answer may have changed, in the order the changes
+    were made, so that downstream caches can invalidate just those entries.
+    """
+
+    class Meta:
+        # the change feed reads in (transaction_id, sequence) order from a cursor
+        indexes = [models.Index(fields=["transaction_id", "sequence"], name="directory_change_cursor")]
+
+    class Entity(models.TextChoices):
+        CARE_RECIPIENT = "care_recipient"
+        CARE_PROVIDER_LOCATION = "care_provider_location"
+
+    class Action(models.TextChoices):
+        SAVED = "saved"
+        DELETED = "deleted"
+
+    sequence = models.BigAutoField(primary_key=True)
+    changed_at = models.DateTimeField(default=Now, editable=False)
+    # changes written before transaction ids were recorded have 0, and are served first in sequence order
+    transaction_id = models.BigIntegerField(default=CurrentTransactionId, editable=False)
+    entity = models.CharField(max_length=32, choices=Entity.choices)
+    action = models.CharField(max_length=16, choices=Action.choices)
+    nhs_number_hash = HexDigestField()
+
+    def __str__(self):
+        return f"{self.sequence}: {self.entity} {self.action}"
+
+
+class LookupOutcome(models.TextChoices):
+    HIT = "hit"
+    MISS = "miss"
+    BAD_REQUEST = "bad_request"
+
+
+class LookupAuditEvent(models.Model):
+    """
+    A pseudonymous identifier looked up by a search endpoint, and the outcome, written behind the request by
+    audit.AuditLog
+    """
+
+    class Meta:
+        # append-only in time order, so a block range index serves time ranges at a fraction of a B-tree's size
+        indexes = [BrinIndex(fields=["looked_up_at"], name="lookup_audit_event_time")]
+
+    id = models.BigAutoField(primary_key=True)
+    looked_up_at = models.DateTimeField()
+    outcome = models.CharField(max_length=16, choices=LookupOutcome.choices)
+    # empty when the request had no identifier, or one that is not a hex digest
+    nhs_number_hash = HexDigestField(blank=True)
+
+    def __str__(self):
+        return f"{self.looked_up_at}: {self.outcome}"
+
+
+class LookupAuditDay(models.Model):
+    """
+    Lookups per day and outcome, added to as audit events are written, and kept however long the events are
+    """
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["day", "outcome"], name="lookup_audit_day_outcome")]
+
+    day = models.DateField()
+    outcome = models.CharField(max_length=16, choices=LookupOutcome.choices)
+    lookups = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.lookups} {self.outcome}"
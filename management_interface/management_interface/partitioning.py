@@ -0,0 +1,253 @@
+"""
+Online conversion of the care recipient table to one hash-partitioned on nhs_number_hash, for directories large
+enough that vacuuming, index bloat and lookups in a single table become a problem.
+
+A partitioned copy of the table is created next to it with the same columns, indexes and foreign keys. A trigger
+mirrors every write to the original from then on, while existing rows are copied across in committed batches. The
+copy is then swapped in under a short exclusive lock, taking over the original's name and index names, so the
+model, ORM, admin and migrations carry on against the same table.
+
+The text keys migration 0008 keeps for the previous release must have been dropped by finish_compact_keys first,
+as the trigger keeping them in step is not carried over. Postgres requires every unique constraint on a partitioned
+table to include the partition key, so afterwards:
+
+* the primary key is (id, nhs_number_hash); ids are random UUIDs;
+* subscription_id and provider_reference_id are unique together with nhs_number_hash, and unique across every
+  partition through a trigger. It checks each new or changed value under a transaction-level advisory lock on that
+  value, so only writers of the same subscription or reference take turns, while searches are unaffected.
+
+Searches by hash are pruned to a single partition; anything else, such as the admin's lookups by id, visits an index
+on each partition. Postgres cannot build an index CONCURRENTLY on a partitioned table, so later migrations adding
+indexes to it must be plain AddIndex operations. The unique constraints change names too: once the table is
+partitioned, a later migration that alters or drops the original management_interface_carerecipient_subscription_id_key
+or ..._provider_reference_id_key fails, and has to deal with ..._subscription_hash_key and ..._reference_hash_key,
+unique together with nhs_number_hash, and the trigger instead.
+"""
+import re
+import time
+
+from django.db import OperationalError, connection, transaction
+
+from .compact_keys import keys_compacted
+from .models import CareRecipient
+
+RECIPIENTS = CareRecipient._meta.db_table
+ID = CareRecipient._meta.pk.column
+HASH = CareRecipient._meta.get_field("nhs_number_hash").column
+PARTITIONED = f"{RECIPIENTS}_partitioned"
+UNPARTITIONED = f"{RECIPIENTS}_unpartitioned"
+
+COPY_BATCH_SIZE = 10000
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 10
+# first keys of the advisory locks serialising writers of the same subscription_id or provider_reference_id; the
+# second is a hash of the value
+SUBSCRIPTION_LOCK = 7_300_001
+REFERENCE_LOCK = 7_300_002
+INDEX_DEFINITION = re.compile(r"CREATE INDEX \S+ ON \S+ ")
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", [RECIPIENTS])
+    return cursor.fetchone()[0]
+
+
+def indexes(cursor, table):
+    """
+    The (name, definition) of every index on table that is not part of a unique constraint
+    """
+    cursor.execute(
+        "SELECT index.relname, pg_get_indexdef(pg_index.indexrelid) FROM pg_index "
+        "JOIN pg_class index ON index.oid = pg_index.indexrelid "
+        "WHERE pg_index.indrelid = %s::regclass AND NOT pg_index.indisunique ORDER BY index.relname",
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def constraints(cursor, table, kinds):
+    """
+    The (name, definition) of every constraint on table of the given pg_constraint.contype kinds
+    """
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = ANY(%s) ORDER BY conname",
+        [table, list(kinds)],
+    )
+    return cursor.fetchall()
+
+
+def create_partitioned_table(cursor, partitions):
+    """
+    Creates the partitioned copy, with every index and foreign key of the original under a temporary name, and
+    the trigger mirroring writes to it
+    """
+    cursor.execute(
+        f"CREATE TABLE {PARTITIONED} (LIKE {RECIPIENTS} INCLUDING DEFAULTS INCLUDING STORAGE) "
+        f"PARTITION BY HASH ({HASH})"
+    )
+    for remainder in range(partitions):
+        cursor.execute(
+            f"CREATE TABLE {RECIPIENTS}_p{remainder:02d} PARTITION OF {PARTITIONED} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        )
+    cursor.execute(
+        f"ALTER TABLE {PARTITIONED} ADD CONSTRAINT {PARTITIONED}_pkey PRIMARY KEY ({ID}, {HASH}), "
+        f"ADD CONSTRAINT {PARTITIONED}_subscription UNIQUE (subscription_id, {HASH}), "
+        f"ADD CONSTRAINT {PARTITIONED}_reference UNIQUE (provider_reference_id, {HASH})"
+    )
+    for number, (_, definition) in enumerate(indexes(cursor, RECIPIENTS)):
+        cursor.execute(INDEX_DEFINITION.sub(f"CREATE INDEX {PARTITIONED}_{number} ON {PARTITIONED} ", definition))
+    for number, (_, definition) in enumerate(constraints(cursor, RECIPIENTS, "f")):
+        cursor.execute(f"ALTER TABLE {PARTITIONED} ADD CONSTRAINT {PARTITIONED}_fk{number} {definition}")
+
+    cursor.execute(
+        f"""
+        CREATE FUNCTION {RECIPIENTS}_mirror() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM {PARTITIONED} WHERE {ID} = OLD.{ID};
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {PARTITIONED} SELECT (NEW).*;
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    # waits for writes in progress, so every write committed after this is mirrored
+    cursor.execute(
+        f"CREATE TRIGGER {RECIPIENTS}_mirror AFTER INSERT OR UPDATE OR DELETE ON {RECIPIENTS} "
+        f"FOR EACH ROW EXECUTE FUNCTION {RECIPIENTS}_mirror()"
+    )
+
+
+def copy_rows(cursor, batch_size):
+    """
+    Copies the existing rows across in batches, each committed on its own so no lock is held for long, returning
+    how many were copied
+    """
+    copied = 0
+    cursor.execute(f"SELECT {ID} FROM {RECIPIENTS} ORDER BY {ID} LIMIT %s", [batch_size])
+    while True:
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return copied
+        with transaction.atomic():
+            # FOR SHARE reads the latest version of a row changed since the batch was chosen, and skips one
+            # deleted since; a row the trigger has already mirrored is left as it is
+            cursor.execute(
+                f"INSERT INTO {PARTITIONED} SELECT * FROM {RECIPIENTS} WHERE {ID} BETWEEN %s AND %s FOR SHARE "
+                "ON CONFLICT DO NOTHING",
+                [ids[0], ids[-1]],
+            )
+        copied += len(ids)
+        cursor.execute(f"SELECT {ID} FROM {RECIPIENTS} WHERE {ID} > %s ORDER BY {ID} LIMIT %s", [ids[-1], batch_size])
+
+
+def swap(cursor, keep_unpartitioned):
+    """
+    Puts the partitioned table in the original's place, retrying if the table cannot be locked promptly
+    """
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                swap_tables(cursor, keep_unpartitioned)
+            return
+        except OperationalError:
+            if attempt == SWAP_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+
+def swap_tables(cursor, keep_unpartitioned):
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    cursor.execute(f"LOCK TABLE {RECIPIENTS}, {PARTITIONED} IN ACCESS EXCLUSIVE MODE")
+    cursor.execute(f"DROP TRIGGER {RECIPIENTS}_mirror ON {RECIPIENTS}")
+    cursor.execute(f"DROP FUNCTION {RECIPIENTS}_mirror()")
+
+    original_indexes = [name for name, _ in indexes(cursor, RECIPIENTS)]
+    original_foreign_keys = [name for name, _ in constraints(cursor, RECIPIENTS, "f")]
+    original_unique = [name for name, _ in constraints(cursor, RECIPIENTS, "pu")]
+    if keep_unpartitioned:
+        # frees the names for the partitioned table; its foreign keys would stop care provider locations and
+        # users it still refers to from being deleted
+        for number, name in enumerate(original_indexes + original_unique):
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {UNPARTITIONED}_{number}")
+        for name in original_foreign_keys:
+            cursor.execute(f"ALTER TABLE {RECIPIENTS} DROP CONSTRAINT {name}")
+        cursor.execute(f"ALTER TABLE {RECIPIENTS} RENAME TO {UNPARTITIONED}")
+    else:
+        cursor.execute(f"DROP TABLE {RECIPIENTS}")
+
+    cursor.execute(f"ALTER TABLE {PARTITIONED} RENAME TO {RECIPIENTS}")
+    # indexes and foreign keys were created in the order they are listed in, so they pair up by position
+    for number, name in enumerate(original_indexes):
+        cursor.execute(f"ALTER INDEX {PARTITIONED}_{number} RENAME TO {name}")
+    for number, name in enumerate(original_foreign_keys):
+        cursor.execute(f"ALTER TABLE {RECIPIENTS} RENAME CONSTRAINT {PARTITIONED}_fk{number} TO {name}")
+    cursor.execute(f"ALTER INDEX {PARTITIONED}_pkey RENAME TO {RECIPIENTS}_pkey")
+    cursor.execute(f"ALTER INDEX {PARTITIONED}_subscription RENAME TO {RECIPIENTS}_subscription_hash_key")
+    cursor.execute(f"ALTER INDEX {PARTITIONED}_reference RENAME TO {RECIPIENTS}_reference_hash_key")
+    create_unique_keys_trigger(cursor)
+
+
+def create_unique_keys_trigger(cursor):
+    cursor.execute(
+        f"""
+        CREATE FUNCTION {RECIPIENTS}_unique_keys() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            -- each lock is held until commit, so a writer of the same value waits, then sees this row in its check
+            IF TG_OP = 'INSERT' OR OLD.subscription_id IS DISTINCT FROM NEW.subscription_id THEN
+                PERFORM pg_advisory_xact_lock({SUBSCRIPTION_LOCK}, hashtext(NEW.subscription_id::text));
+                IF EXISTS (
+                    SELECT FROM {RECIPIENTS} WHERE subscription_id = NEW.subscription_id AND {ID} <> NEW.{ID}
+                ) THEN
+                    RAISE unique_violation USING MESSAGE = format(
+                        'duplicate key value violates unique constraint: subscription_id %s', NEW.subscription_id
+                    );
+                END IF;
+            END IF;
+            IF TG_OP = 'INSERT' OR OLD.provider_reference_id IS DISTINCT FROM NEW.provider_reference_id THEN
+                PERFORM pg_advisory_xact_lock({REFERENCE_LOCK}, hashtext(NEW.provider_reference_id));
+                IF EXISTS (
+                    SELECT FROM {RECIPIENTS}
+                    WHERE provider_reference_id = NEW.provider_reference_id AND {ID} <> NEW.{ID}
+                ) THEN
+                    RAISE unique_violation USING MESSAGE = format(
+                        'duplicate key value violates unique constraint: provider_reference_id %s',
+                        NEW.provider_reference_id
+                    );
+                END IF;
+            END IF;
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    cursor.execute(
+        f"CREATE TRIGGER {RECIPIENTS}_unique_keys BEFORE INSERT OR UPDATE OF subscription_id, provider_reference_id "
+        f"ON {RECIPIENTS} FOR EACH ROW EXECUTE FUNCTION {RECIPIENTS}_unique_keys()"
+    )
+
+
+def partition_care_recipients(partitions, batch_size=COPY_BATCH_SIZE, keep_unpartitioned=False, log=print):
+    """
+    Converts the care recipient table to partitions hash partitions while it stays readable and writable.
+    The unpartitioned table is dropped once replaced, unless keep_unpartitioned, when it is kept, no longer
+    updated, as UNPARTITIONED.
+    """
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            raise ValueError(f"{RECIPIENTS} is already partitioned")
+        if not keys_compacted(cursor):
+            raise ValueError("Run finish_compact_keys before partitioning")
+        log(f"Creating {partitions} partitions")
+        with transaction.atomic():
+            create_partitioned_table(cursor, partitions)
+        log("Copying care recipients")
+        copied = copy_rows(cursor, batch_size)
+        log(f"Copied {copied} care recipients; swapping tables")
+        swap(cursor, keep_unpartitioned)
+        cursor.execute(f"ANALYZE {RECIPIENTS}")
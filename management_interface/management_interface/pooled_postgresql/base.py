@@ -0,0 +1,62 @@
+"""
+PostgreSQL backend whose connections come from, and go back to, a per-process ConnectionPool.
+
+Selected by settings when HANS_MI_PSQL_POOL_SIZE is non-zero. CONN_MAX_AGE is then 0, so Django "closes" the
+connection at the end of every request, which hands it back to the pool for the next request on any thread.
+"""
+import psycopg2
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import (
+    DatabaseCreation as PostgresDatabaseCreation,
+)
+from django.utils.asyncio import async_unsafe
+
+from management_interface.connection_pool import close_pools, get_pool
+
+
+def is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections to the test database would stop it being dropped
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def pool(self, conn_params):
+        return get_pool(
+            self.alias,
+            conn_params,
+            max_size=self.settings_dict["POOL_SIZE"],
+            timeout=self.settings_dict["POOL_TIMEOUT"],
+            check=is_usable if self.settings_dict["CONN_HEALTH_CHECKS"] else None,
+        )
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        connection = self.pool(conn_params).acquire()
+        options = self.settings_dict["OPTIONS"]
+        if "isolation_level" in options:
+            self.isolation_level = options["isolation_level"]
+            if connection.isolation_level != self.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        else:
+            self.isolation_level = connection.isolation_level
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool(self.get_connection_params()).release(self.connection)
@@ -0,0 +1,46 @@
+"""
+Serialization of the FHIR resources returned by the search endpoints.
+
+Building fhir.resources models validates every field, which costs more than the lookup itself, so
+Organization bodies are rendered once when a CareProviderLocation is saved and OperationOutcome
+bodies once per distinct failure. Views then return the stored JSON as-is.
+
+fhir.resources and pydantic take about a fifth of the time to load the app, so they are imported on first use,
+which warmup brings forward to before a worker takes traffic.
+"""
+import json
+from functools import lru_cache
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def render_organization(name, email):
+    from fhir.resources.contactpoint import ContactPoint
+    from fhir.resources.organization import Organization
+
+    fhir_contact_point = ContactPoint(system="email", value=email, use="work")
+    fhir_organization = Organization(name=name, telecom=[fhir_contact_point])
+    return json.dumps(fhir_organization.dict(), cls=DjangoJSONEncoder)
+
+
+@lru_cache(maxsize=64)
+def render_failure(code, diagnostics):
+    from fhir.resources.operationoutcome import OperationOutcome, OperationOutcomeIssue
+
+    operation_outcome_issue = OperationOutcomeIssue(
+        severity="error",
+        code=code,
+        diagnostics=diagnostics,
+    )
+    operation_outcome = OperationOutcome(issue=[operation_outcome_issue])
+    return json.dumps(operation_outcome.dict(), cls=DjangoJSONEncoder)
+
+
+def render_batch_response_entry(status, resource):
+    return f'{{"resource": {resource}, "response": {{"status": "{status.value} {status.phrase}"}}}}'
+
+
+def render_batch_response(entries):
+    if not entries:
+        return '{"resourceType": "Bundle", "type": "batch-response"}'
+    return '{"resourceType": "Bundle", "type": "batch-response", "entry": [' + ", ".join(entries) + "]}"
@@ -0,0 +1,240 @@
+"""
+Sends read-only lookups and exports to read replicas of the primary database, round-robin, falling back to the
+primary while a replica is failing. Everything else, writes included, stays on the primary.
+
+Only code run through read_from_replica() or using read_alias() reads from a replica, so the admin and the
+management commands always see their own writes. Staff who have just changed something are also pinned to the
+primary for HANS_REPLICA_READ_YOUR_WRITES seconds, so an export straight after an edit includes it.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError
+
+LAST_WRITE_SESSION_KEY = "hans_last_write"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class ReplicaSet:
+    """
+    Thread-safe round-robin choice between replica aliases, skipping any that failed in the last retry_after seconds
+    """
+
+    def __init__(self, aliases, retry_after, clock=time.monotonic):
+        self.aliases = tuple(aliases)
+        self.retry_after = retry_after
+        self._clock = clock
+        self._cycle = itertools.cycle(self.aliases)
+        self._failed_until = {}
+        self._lock = threading.Lock()
+        self._disabled = False
+        self.reads = dict.fromkeys(self.aliases, 0)
+        self.failures = 0
+
+    def choose(self):
+        """
+        Returns the next healthy replica alias, or None if there are no healthy replicas
+        """
+        with self._lock:
+            if self._disabled:
+                return None
+            now = self._clock()
+            for _ in self.aliases:
+                alias = next(self._cycle)
+                if self._failed_until.get(alias, 0) <= now:
+                    self.reads[alias] += 1
+                    return alias
+            return None
+
+    @contextmanager
+    def disabled(self):
+        """
+        Sends every read to the primary while in effect, for work against a database the replicas do not serve
+        """
+        self._disabled = True
+        try:
+            yield
+        finally:
+            self._disabled = False
+
+    def mark_failed(self, alias):
+        with self._lock:
+            self._failed_until[alias] = self._clock() + self.retry_after
+            self.failures += 1
+
+    def stats(self):
+        with self._lock:
+            now = self._clock()
+            return {
+                "replicas": len(self.aliases),
+                "healthy": sum(self._failed_until.get(alias, 0) <= now for alias in self.aliases),
+                "failures": self.failures,
+                **{f"{alias}_reads": reads for alias, reads in self.reads.items()},
+            }
+
+
+replicas = ReplicaSet(settings.HANS_REPLICA_DATABASES, settings.HANS_REPLICA_RETRY_AFTER)
+
+
+class ReplicaRead:
+    """
+    The replica chosen for one read_from_replica() call, so all of its queries go to the same database
+    """
+
+    def __init__(self):
+        self.alias = None
+
+
+# shared with the threads that run async ORM queries, since sync_to_async copies the context
+replica_read = ContextVar("replica_read", default=None)
+pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+
+
+def read_alias():
+    """
+    The database to read from for a read-only query outside read_from_replica()
+    """
+    if pinned_to_primary.get():
+        return DEFAULT_DB_ALIAS
+    return replicas.choose() or DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        read = replica_read.get()
+        if read is None or pinned_to_primary.get():
+            return None
+        if read.alias is None:
+            read.alias = replicas.choose() or DEFAULT_DB_ALIAS
+        return read.alias
+
+    def db_for_write(self, model, **hints):
+        # never follow the hint of an instance that was read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas.aliases
+
+
+def read_from_replica(function, *args):
+    """
+    Calls function(*args) with its reads routed to a replica, calling it again against the primary if the
+    replica fails
+    """
+    read = ReplicaRead()
+    token = replica_read.set(read)
+    try:
+        return function(*args)
+    except OperationalError:
+        if read.alias in (None, DEFAULT_DB_ALIAS):
+            raise
+        replicas.mark_failed(read.alias)
+    finally:
+        replica_read.reset(token)
+    return function(*args)
+
+
+async def aread_from_replica(function, *args):
+    """
+    As read_from_replica, for a coroutine function
+    """
+    read = ReplicaRead()
+    token = replica_read.set(read)
+    try:
+        return await function(*args)
+    except OperationalError:
+        if read.alias in (None, DEFAULT_DB_ALIAS):
+            raise
+        replicas.mark_failed(read.alias)
+    finally:
+        replica_read.reset(token)
+    return await function(*args)
+
+
+def iterate_from_replica(make_iterator):
+    """
+    Iterates over make_iterator(alias) for a replica alias, starting again on the primary if the replica fails
+    before producing anything. Failures once rows have been yielded are raised, as they cannot be retried.
+
+    The replica is chosen straight away, while any read-your-writes pin of the current request applies, rather
+    than when a streaming response is first iterated.
+    """
+    alias = read_alias()
+
+    def rows():
+        iterator = make_iterator(alias)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            return
+        except OperationalError:
+            if alias == DEFAULT_DB_ALIAS:
+                raise
+            replicas.mark_failed(alias)
+            yield from make_iterator(DEFAULT_DB_ALIAS)
+            return
+        yield first
+        yield from iterator
+
+    return rows()
+
+
+def has_session(request):
+    # API clients send no session cookie, so their requests never load a session
+    return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def recently_wrote(request):
+    last_write = request.session.get(LAST_WRITE_SESSION_KEY)
+    return last_write is not None and time.time() - last_write < settings.HANS_REPLICA_READ_YOUR_WRITES
+
+
+def record_write(request, response):
+    if response.status_code < 400 and request.user.is_authenticated:
+        request.session[LAST_WRITE_SESSION_KEY] = time.time()
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pins requests to the primary database for a while after the same session changed something
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # marks this instance as a coroutine function to Django's handler, as in Django 4.1's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = pinned_to_primary.set(has_session(request) and recently_wrote(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            pinned_to_primary.reset(token)
+        if request.method not in SAFE_METHODS and has_session(request):
+            record_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = pinned_to_primary.set(has_session(request) and await sync_to_async(recently_wrote)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            pinned_to_primary.reset(token)
+        if request.method not in SAFE_METHODS and has_session(request):
+            await sync_to_async(record_write)(request, response)
+        return response
@@ -39,17 +39,20 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "management_interface",
     "django_cognito_saml",
 ]
 
 MIDDLEWARE = [
+    "management_interface.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.auth.middleware.PersistentRemoteUserMiddleware",
+    "management_interface.routers.ReadYourWritesMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -82,20 +85,41 @@ CSRF_TRUSTED_ORIGINS = [SETTINGS.CSRF_TRUSTED_ORIGINS]
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# With HANS_MI_PSQL_POOL_SIZE set, connections are shared by the threads of a worker through a pool and
+# handed back to it after every request; otherwise each thread keeps its own for CONN_MAX_AGE seconds
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": (
+            "management_interface.pooled_postgresql" if SETTINGS.POSTGRES_POOL_SIZE else "django.db.backends.postgresql"
+        ),
         "NAME": SETTINGS.POSTGRES_DB,
         "USER": SETTINGS.POSTGRES_USER,
         "PASSWORD": SETTINGS.POSTGRES_PASSWORD,
         "HOST": SETTINGS.POSTGRES_HOST,
         "PORT": SETTINGS.POSTGRES_PORT,
+        "CONN_MAX_AGE": 0 if SETTINGS.POSTGRES_POOL_SIZE else SETTINGS.POSTGRES_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": SETTINGS.POSTGRES_CONN_HEALTH_CHECKS,
+        "POOL_SIZE": SETTINGS.POSTGRES_POOL_SIZE,
+        "POOL_TIMEOUT": SETTINGS.POSTGRES_POOL_TIMEOUT,
         "OPTIONS": {
             "connect_timeout": 10,
         },
     },
 }
 
+# Read replicas, "host" or "host:port" separated by commas, used by the routers module for read-only lookups and
+# exports. They share the primary's other settings and mirror it under test.
+for number, replica in enumerate(filter(None, SETTINGS.POSTGRES_REPLICA_HOSTS.split(","))):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica_{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": int(port) if port else SETTINGS.POSTGRES_PORT,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["management_interface.routers.ReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -153,5 +177,81 @@ COGNITO_CONFIG = {
     "CLIENT_ID": SETTINGS.COGNITO_CLIENT_ID,
     "CLIENT_SECRET": SETTINGS.COGNITO_CLIENT_SECRET,
     "JWKS_URI": SETTINGS.COGNITO_JWKS_URI,
-    "REDIRECT_URI": SETTINGS.COGNITO_REDIRECT_URI
+    "REDIRECT_URI": SETTINGS.COGNITO_REDIRECT_URI,
 }
+
+# Lookup cache: entries per worker process, and seconds before an entry is re-read from the database
+HANS_LOOKUP_CACHE_SIZE = SETTINGS.LOOKUP_CACHE_SIZE
+HANS_LOOKUP_CACHE_TTL = SETTINGS.LOOKUP_CACHE_TTL
+
+# Concurrent searches for the same hash in a worker process share one query
+HANS_SINGLE_FLIGHT = SETTINGS.SINGLE_FLIGHT
+
+# Seconds caches may reuse the response to a GET search for before revalidating it
+HANS_SEARCH_MAX_AGE = SETTINGS.SEARCH_MAX_AGE
+
+# Admission control for the search endpoints, per worker process: searches per second allowed from each client
+# address (0 for no limit), the burst allowed above that rate, how many clients to track, and the header a load
+# balancer appends the client address to, if there is one in front of the service
+HANS_SEARCH_RATE = SETTINGS.SEARCH_RATE
+HANS_SEARCH_BURST = SETTINGS.SEARCH_BURST
+HANS_SEARCH_RATE_CLIENTS = SETTINGS.SEARCH_RATE_CLIENTS
+HANS_SEARCH_CLIENT_HEADER = SETTINGS.SEARCH_CLIENT_HEADER
+# searches served at once (0 for no limit), searches that may wait for one to finish, and for how many seconds
+HANS_SEARCH_MAX_IN_FLIGHT = SETTINGS.SEARCH_MAX_IN_FLIGHT
+HANS_SEARCH_QUEUE_SIZE = SETTINGS.SEARCH_QUEUE_SIZE
+HANS_SEARCH_QUEUE_TIMEOUT = SETTINGS.SEARCH_QUEUE_TIMEOUT
+
+# Audit log of search lookups, written behind the request: events buffered per worker process, events per INSERT,
+# seconds between writes, and seconds a search waits for room in a full buffer before its event is dropped
+HANS_LOOKUP_AUDIT = SETTINGS.LOOKUP_AUDIT
+HANS_LOOKUP_AUDIT_BUFFER = SETTINGS.LOOKUP_AUDIT_BUFFER
+HANS_LOOKUP_AUDIT_BATCH_SIZE = SETTINGS.LOOKUP_AUDIT_BATCH_SIZE
+HANS_LOOKUP_AUDIT_INTERVAL = SETTINGS.LOOKUP_AUDIT_INTERVAL
+HANS_LOOKUP_AUDIT_MAX_WAIT = SETTINGS.LOOKUP_AUDIT_MAX_WAIT
+
+# Bloom filter of known hashes answering searches for unknown ones without a query: its target false positive
+# rate, and the most seconds between top-ups with changes made by other processes, which otherwise follow their
+# notifications
+HANS_NEGATIVE_LOOKUP_FILTER = SETTINGS.NEGATIVE_LOOKUP_FILTER
+HANS_NEGATIVE_LOOKUP_ERROR_RATE = SETTINGS.NEGATIVE_LOOKUP_ERROR_RATE
+HANS_NEGATIVE_LOOKUP_REFRESH = SETTINGS.NEGATIVE_LOOKUP_REFRESH
+
+# Largest number of searches accepted in one batch Bundle
+HANS_BATCH_SEARCH_MAX_ENTRIES = SETTINGS.BATCH_SEARCH_MAX_ENTRIES
+
+# Import fhir.resources, prime caches and connect to the databases before a gunicorn worker takes traffic
+HANS_WARM_UP = SETTINGS.WARM_UP
+
+# Serve care_provider_search with the async view; only worthwhile when running under ASGI
+HANS_ASYNC_SEARCH = SETTINGS.ASYNC_SEARCH
+
+# NHS number pseudonymisation: "sha3_256", or "scrypt" over the SHA3 digest with the given costs and salt, which
+# has no default and must be kept secret
+HANS_NHS_NUMBER_HASHER = SETTINGS.NHS_NUMBER_HASHER
+HANS_SCRYPT_SALT = SETTINGS.SCRYPT_SALT
+HANS_SCRYPT_N = SETTINGS.SCRYPT_N
+HANS_SCRYPT_R = SETTINGS.SCRYPT_R
+HANS_SCRYPT_P = SETTINGS.SCRYPT_P
+# Processes used for bulk hashing; 0 means one per CPU
+HANS_HASH_WORKERS = SETTINGS.HASH_WORKERS
+
+# Requests issuing more database queries than this are logged and counted; the metrics endpoint requires this
+# bearer token, or a staff member's session when none is set
+HANS_QUERY_BUDGET = SETTINGS.QUERY_BUDGET
+HANS_METRICS_TOKEN = SETTINGS.METRICS_TOKEN
+
+# Bearer token the directory change feed and snapshot require of downstream caches, which only staff can read while
+# it is unset; and the largest page the feed serves
+HANS_DIRECTORY_TOKEN = SETTINGS.DIRECTORY_TOKEN
+HANS_CHANGE_FEED_PAGE_SIZE = SETTINGS.CHANGE_FEED_PAGE_SIZE
+
+# Directory snapshot files, shared by the workers on a host, and seconds between checks for changes to rebuild it
+HANS_SNAPSHOT_DIR = SETTINGS.SNAPSHOT_DIR
+HANS_SNAPSHOT_REFRESH = SETTINGS.SNAPSHOT_REFRESH
+
+# Read replicas: seconds to avoid a replica after it fails, and seconds a session reads from the primary after
+# changing something
+HANS_REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith("replica_")]
+HANS_REPLICA_RETRY_AFTER = SETTINGS.POSTGRES_REPLICA_RETRY_AFTER
+HANS_REPLICA_READ_YOUR_WRITES = SETTINGS.POSTGRES_REPLICA_READ_YOUR_WRITES
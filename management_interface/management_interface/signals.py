@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .changes import record_changes, record_location_change
+from .lookup import known_hashes, lookup_cache
+from .models import CareProviderLocation, CareRecipient, DirectoryChange
+
+
+@receiver(post_save, sender=CareRecipient)
+@receiver(post_delete, sender=CareRecipient)
+def invalidate_care_recipient(sender, instance, **kwargs):
+    """
+    Drops cached lookups for a care recipient, including any made under a previous hash, once the change is
+    committed; dropping them sooner would let a concurrent lookup cache the uncommitted row's predecessor again
+    """
+    nhs_number_hash, pk = instance.nhs_number_hash, instance.pk
+
+    def invalidate():
+        lookup_cache.invalidate(nhs_number_hash)
+        lookup_cache.invalidate_where(lambda match: match.care_recipient_id == pk)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=CareRecipient)
+def add_known_hash(sender, instance, **kwargs):
+    known_hashes.add(instance.nhs_number_hash)
+
+
+@receiver(post_delete, sender=CareRecipient)
+def discard_known_hash(sender, instance, **kwargs):
+    known_hashes.discard(instance.nhs_number_hash)
+
+
+@receiver(post_save, sender=CareProviderLocation)
+@receiver(post_delete, sender=CareProviderLocation)
+def invalidate_care_provider_location(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: lookup_cache.invalidate_where(lambda match: match.care_provider_location_id == pk))
+
+
+@receiver(post_save, sender=CareRecipient)
+def record_care_recipient_saved(sender, instance, **kwargs):
+    previous_hash = getattr(instance, "loaded_nhs_number_hash", None)
+    if previous_hash is not None and previous_hash != instance.nhs_number_hash:
+        record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.DELETED, [previous_hash])
+    record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.SAVED, [instance.nhs_number_hash])
+    instance.loaded_nhs_number_hash = instance.nhs_number_hash
+
+
+@receiver(post_delete, sender=CareRecipient)
+def record_care_recipient_deleted(sender, instance, **kwargs):
+    record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.DELETED, [instance.nhs_number_hash])
+
+
+@receiver(post_save, sender=CareProviderLocation)
+def record_care_provider_location_saved(sender, instance, **kwargs):
+    # deleting a location deletes its care recipients, each of which records its own change
+    record_location_change(instance.pk)
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process: the first caller runs the function, and callers
+    that arrive while it is running wait for it and share its result, or its exception, instead of running it again.
+    Nothing is kept once the call returns, so a caller never receives a result from before it arrived.
+
+    Threads coalesce through do() and asyncio tasks through ado(); a thread never waits on a task or the reverse.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._tasks = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args):
+        if not self.enabled:
+            return function(*args)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function(*args)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    async def ado(self, key, function, *args):
+        """
+        As do(), for a coroutine function. The call runs as a task of its own, so a caller that is cancelled, e.g.
+        by its client disconnecting, does not cancel it for the others.
+        """
+        if not self.enabled:
+            return await function(*args)
+        flight_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._tasks.get(flight_key)
+            if task is None:
+                task = self._tasks[flight_key] = asyncio.ensure_future(function(*args))
+                task.add_done_callback(lambda done: self._finish(flight_key, done))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, flight_key, task):
+        with self._lock:
+            del self._tasks[flight_key]
+        # retrieved so that a failure every caller gave up waiting for is not logged as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {"enabled": self.enabled, "calls": self.calls, "coalesced": self.coalesced}
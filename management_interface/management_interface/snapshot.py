@@ -0,0 +1,306 @@
+"""
+Downloadable snapshot of the whole directory, for consumers that keep a local copy instead of searching.
+
+A snapshot is gzip-compressed NDJSON, one line per care recipient sorted by hash, with the care provider location
+that care_provider_search would answer with. It is read in one repeatable-read transaction on the primary,
+together with the change feed cursor it is current to, so a consumer can carry on from there with
+directory_changes. Replaying a change the snapshot already reflects does no harm.
+
+The latest snapshot is kept as a file shared by every worker on the host. Once it is refresh seconds old, the next
+request checks in the background whether a change has committed that it did not see, and rebuilds it if so; until
+then the previous snapshot is served, and the one before it is kept on disk for downloads still reading it. The
+first snapshot is built in the background as a worker starts, and requests are asked to retry until it is ready.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .changes import format_cursor, parse_cursor
+from .models import CareRecipient, DirectoryChange
+
+logger = logging.getLogger(__name__)
+
+# (snapshot field, queryset lookup)
+SNAPSHOT_COLUMNS = (
+    ("nhs_number_hash", "nhs_number_hash"),
+    ("ods_code", "care_provider_location__ods_code"),
+    ("name", "care_provider_location__name"),
+    ("email", "care_provider_location__email"),
+)
+CHUNK_SIZE = 64 * 1024
+# multiple ranges are answered with the whole snapshot, which RFC 9110 allows
+BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+# seconds a request is asked to wait while the first snapshot is built
+BUILDING_RETRY_AFTER = 5
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    filename: str
+    etag: str
+    size: int
+    # the change feed cursor to carry on from: every change of a transaction below its id is reflected
+    cursor: str
+    # the Postgres snapshot the directory was read in, to find changes committed since that it did not see
+    transactions: str
+    checked_at: float
+
+
+class HashingWriter:
+    """
+    File-like object that writes to file while taking the SHA-256 digest of everything written
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def changed_since(snapshot):
+    """
+    Whether any change has committed that was not visible to the transaction snapshot was read in
+    """
+    transaction_id, _ = parse_cursor(snapshot.cursor)
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT FROM {DirectoryChange._meta.db_table} WHERE transaction_id >= %s "
+            "AND NOT pg_visible_in_snapshot(transaction_id::text::xid8, %s::pg_snapshot))",
+            [transaction_id, snapshot.transactions],
+        )
+        return cursor.fetchone()[0]
+
+
+def write_snapshot(file):
+    """
+    Writes the directory to file as gzip-compressed NDJSON, returning its ETag, the change feed cursor it is current
+    to and the Postgres snapshot it was read in
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    outermost = not connection.in_atomic_block
+    writer = HashingWriter(file)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        with connection.cursor() as cursor:
+            if outermost:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            # every transaction below the oldest one still running has committed or rolled back, so each change
+            # beneath it is in the snapshot, and any other is served after it by the change feed
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, pg_current_snapshot()::text")
+            oldest_running, transactions = cursor.fetchone()
+        rows = (
+            # a hash can be subscribed at more than one location, so the id breaks ties the same way on every host
+            CareRecipient.objects.order_by("nhs_number_hash", "id")
+            .values_list(*(lookup for _, lookup in SNAPSHOT_COLUMNS))
+            .iterator(chunk_size=2000)
+        )
+        # a fixed mtime, so the same directory always compresses to the same bytes and ETag
+        with gzip.GzipFile(fileobj=writer, mode="wb", mtime=0) as compressed:
+            for row in rows:
+                line = dict(zip((field for field, _ in SNAPSHOT_COLUMNS), row))
+                compressed.write(json.dumps(line).encode() + b"\n")
+    return writer.digest.hexdigest(), format_cursor(oldest_running, 0), transactions
+
+
+def parse_range(header, size):
+    """
+    Returns the (first, last) byte positions asked for by a Range header with a single byte range, or None to send
+    the whole snapshot. Raises ValueError for a range that is not within it.
+    """
+    match = BYTE_RANGE.fullmatch(header.strip()) if header else None
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # a suffix range: the last n bytes
+        if int(last) == 0:
+            raise ValueError("an empty suffix range")
+        return max(size - int(last), 0), size - 1
+    first, last = int(first), min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise ValueError(f"range starts beyond the {size} byte snapshot")
+    return (first, last) if first <= last else None
+
+
+class SnapshotStore:
+    """
+    The latest Snapshot, kept as files in directory with its details in snapshot.json, shared between processes
+    through an exclusive lock on snapshot.lock
+    """
+
+    def __init__(self, directory, refresh, clock=time.time):
+        self.directory = directory
+        self.refresh_interval = refresh
+        self._clock = clock
+        self._refreshing = threading.Lock()
+        self.builds = 0
+        self.checks = 0
+        self.errors = 0
+        self.last_build_seconds = 0.0
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        try:
+            with open(self.path("snapshot.json"), encoding="utf-8") as file:
+                return Snapshot(**json.load(file))
+        # or it was saved by a release whose snapshots had other details, and is rebuilt
+        except (FileNotFoundError, TypeError):
+            return None
+
+    def save(self, snapshot):
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, delete=False, encoding="utf-8") as file:
+            json.dump(asdict(snapshot), file)
+        os.replace(file.name, self.path("snapshot.json"))
+
+    def locked(self):
+        """
+        Returns the lock on the directory, or None while another process holds it
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(self.path("snapshot.lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    def current(self):
+        """
+        Returns the latest snapshot, or None while the first one is built, refreshing it in the background when due
+        """
+        snapshot = self.load()
+        due = snapshot is None or self._clock() - snapshot.checked_at >= self.refresh_interval
+        if due and self._refreshing.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, name="directory-snapshot", daemon=True).start()
+        return snapshot
+
+    def start(self):
+        """
+        Starts building the first snapshot in the background if there is none yet; call after forking
+        """
+        self.current()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            self.errors += 1
+            logger.exception("Could not refresh the directory snapshot")
+        finally:
+            connections.close_all()
+            self._refreshing.release()
+
+    def refresh(self):
+        """
+        Builds the snapshot if there is none or a change has committed since, unless another process is already
+        """
+        lock = self.locked()
+        if lock is None:
+            return
+        try:
+            self.remove_temporary_files()
+            snapshot = self.load()
+            if snapshot is not None and self._clock() - snapshot.checked_at < self.refresh_interval:
+                return
+            self.checks += 1
+            if snapshot is not None and not changed_since(snapshot):
+                self.save(Snapshot(**{**asdict(snapshot), "checked_at": self._clock()}))
+            else:
+                self.build(previous=snapshot)
+        finally:
+            lock.close()
+
+    def remove_temporary_files(self):
+        """
+        Deletes files a process was killed while writing; call holding the lock, under which no other is written
+        """
+        for name in os.listdir(self.directory):
+            if name.startswith(tempfile.gettempprefix()):
+                os.unlink(self.path(name))
+
+    def build(self, previous):
+        """
+        Writes a new snapshot, then deletes every file but it and previous; call holding the lock
+        """
+        started = time.perf_counter()
+        checked_at = self._clock()
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            try:
+                etag, cursor, transactions = write_snapshot(file)
+            except BaseException:
+                os.unlink(file.name)
+                raise
+        filename = f"directory-{etag[:16]}.ndjson.gz"
+        os.replace(file.name, self.path(filename))
+        snapshot = Snapshot(
+            filename=filename,
+            etag=etag,
+            size=os.path.getsize(self.path(filename)),
+            cursor=cursor,
+            transactions=transactions,
+            checked_at=checked_at,
+        )
+        self.save(snapshot)
+        keep = {filename, previous.filename if previous else None}
+        for name in os.listdir(self.directory):
+            if name.startswith("directory-") and name not in keep:
+                os.unlink(self.path(name))
+        self.builds += 1
+        self.last_build_seconds = time.perf_counter() - started
+        return snapshot
+
+    def open(self, snapshot):
+        return open(self.path(snapshot.filename), "rb")
+
+    def stats(self):
+        snapshot = self.load()
+        return {
+            "size": snapshot.size if snapshot else 0,
+            "transaction_id": parse_cursor(snapshot.cursor)[0] if snapshot else 0,
+            "builds": self.builds,
+            "checks": self.checks,
+            "errors": self.errors,
+            "last_build_seconds": self.last_build_seconds,
+        }
+
+
+def read_range(file, first, last):
+    """
+    Yields bytes first to last of file, then closes it
+    """
+    try:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+snapshots = SnapshotStore(
+    directory=settings.HANS_SNAPSHOT_DIR,
+    refresh=settings.HANS_SNAPSHOT_REFRESH,
+)
@@ -0,0 +1,56 @@
+"""
+Synthetic directory data for benchmarks. Every value is derived from a row number, so runs are repeatable
+and a benchmark can recompute the pseudonymous identifiers it created without reading them back.
+"""
+from .hashers import sha3_hex
+from .models import CareProviderLocation, CareRecipient, RegisteredManager
+from .rendering import render_organization
+
+
+def synthetic_nhs_number_hash(number):
+    return sha3_hex(f"synthetic-{number:010d}")
+
+
+def create_locations(managers, locations, batch_size=1000):
+    """
+    Creates managers and locations spread evenly across them, returning the locations' primary keys
+    """
+    registered_managers = [
+        RegisteredManager(
+            given_name=f"Given{number}",
+            family_name=f"Family{number}",
+            email=f"manager{number}@nhs.net",
+            cqc_registered_manager_id=f"1-{number:08d}",
+        )
+        for number in range(managers)
+    ]
+    RegisteredManager.objects.bulk_create(registered_managers, batch_size=batch_size)
+
+    care_provider_locations = []
+    for number in range(locations):
+        location = CareProviderLocation(
+            registered_manager=registered_managers[number % managers],
+            name=f"Synthetic Branch {number}",
+            email=f"branch{number}@nhs.net",
+            ods_code=f"SYN{number:07d}",
+            cqc_location_id=f"1-110{number:08d}",
+        )
+        location.fhir_organization = render_organization(location.name, location.email)
+        care_provider_locations.append(location)
+    CareProviderLocation.objects.bulk_create(care_provider_locations, batch_size=batch_size)
+    return [location.pk for location in care_provider_locations]
+
+
+def create_recipients(location_ids, start, stop, batch_size=5000):
+    """
+    Creates care recipients numbered start to stop - 1, spread evenly across location_ids
+    """
+    for batch_start in range(start, stop, batch_size):
+        CareRecipient.objects.bulk_create(
+            CareRecipient(
+                care_provider_location_id=location_ids[number % len(location_ids)],
+                nhs_number_hash=synthetic_nhs_number_hash(number),
+                provider_reference_id=f"SYN{number:010d}",
+            )
+            for number in range(batch_start, min(batch_start + batch_size, stop))
+        )
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .admin import EstimatedCountPaginator, hash_prefix_query
+from .models import CareRecipient, RegisteredManager
+
+
+class CareRecipientAdminTests(TestCase):
+    url = reverse("admin:management_interface_carerecipient_changelist")
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@nhs.net", None))
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.locations = [
+            manager.careproviderlocation_set.create(
+                name=f"My Location Name {number}",
+                email="nosuchaddress@nhs.net",
+                ods_code=f"ODS{number}",
+                cqc_location_id=f"My CQC Location ID {number}",
+            )
+            for number in range(2)
+        ]
+
+    def create_recipients(self, count):
+        for number in range(CareRecipient.objects.count(), count):
+            self.locations[number % 2].carerecipient_set.create(
+                nhs_number_hash=f"{number:x}".rjust(64, "a"), provider_reference_id=f"REF{number:05d}"
+            )
+
+    def changelist(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["cl"].result_list)
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_recipients(1)
+        with CaptureQueriesContext(connection) as one_row:
+            self.changelist()
+        self.create_recipients(10)
+        with CaptureQueriesContext(connection) as ten_rows:
+            self.changelist()
+        self.assertEqual(len(one_row), len(ten_rows))
+
+    def test_searches_by_prefix(self):
+        self.create_recipients(20)
+        self.assertEqual(len(self.changelist(q="REF0001")), 10)
+        self.assertEqual([r.provider_reference_id for r in self.changelist(q="a" * 63 + "f")], ["REF00015"])
+        self.assertEqual(len(self.changelist(q="a" * 62 + "1")), 4)
+        self.assertEqual(self.changelist(q="0f"), [])
+
+    def test_filters_by_ods_code(self):
+        self.create_recipients(4)
+        recipients = self.changelist(ods_code="ODS1")
+        self.assertEqual({recipient.care_provider_location.ods_code for recipient in recipients}, {"ODS1"})
+
+    def test_estimates_the_size_of_large_unfiltered_tables(self):
+        self.create_recipients(3)
+        with mock.patch("management_interface.admin.estimated_count", return_value=5000000):
+            self.assertEqual(EstimatedCountPaginator(CareRecipient.objects.all(), 100).count, 5000000)
+            self.assertEqual(EstimatedCountPaginator(CareRecipient.objects.filter(nhs_number_hash="ff"), 100).count, 0)
+
+
+class HashPrefixQueryTests(TestCase):
+    def test_bounds_the_range_above_the_prefix(self):
+        self.assertIn(("nhs_number_hash__lt", bytes.fromhex("a9b0")), hash_prefix_query("a9af").children)
+        self.assertIn(("nhs_number_hash__gte", bytes.fromhex("a9a0")), hash_prefix_query("a9a").children)
+        self.assertNotIn("nhs_number_hash__lt", dict(hash_prefix_query("ff").children))
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+from http import HTTPStatus
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .admission import ConcurrencyLimit, RateLimiter, client_address
+from .test_lookup import FakeClock
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_allows_a_burst_then_the_rate(self):
+        clock = FakeClock()
+        limiter = RateLimiter(rate=2, burst=3, max_clients=10, clock=clock)
+        self.assertEqual([limiter.acquire("10.0.0.1") for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("10.0.0.1"), 0.5)
+        self.assertEqual(limiter.acquire("10.0.0.2"), 0)
+        clock.now = 0.5
+        self.assertEqual(limiter.acquire("10.0.0.1"), 0)
+        self.assertEqual((limiter.allowed, limiter.limited), (5, 1))
+
+    def test_forgets_the_least_recent_clients(self):
+        limiter = RateLimiter(rate=1, burst=1, max_clients=2, clock=FakeClock())
+        for client in ("a", "b", "c"):
+            limiter.acquire(client)
+        self.assertEqual(limiter.stats()["clients"], 2)
+        self.assertEqual(limiter.acquire("a"), 0)
+
+    def test_takes_the_address_the_load_balancer_added(self):
+        request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="1.2.3.4, 10.0.0.9", REMOTE_ADDR="10.1.1.1")
+        self.assertEqual(client_address(request, "X-Forwarded-For"), "10.0.0.9")
+        self.assertEqual(client_address(request, ""), "10.1.1.1")
+
+
+class ConcurrencyLimitTests(SimpleTestCase):
+    def test_turns_away_beyond_the_queue(self):
+        limit = ConcurrencyLimit(limit=1, queue_size=0, timeout=1)
+        self.assertTrue(limit.acquire())
+        self.assertFalse(limit.acquire())
+        limit.release()
+        self.assertTrue(limit.acquire())
+        self.assertEqual((limit.admitted, limit.rejected), (2, 1))
+
+    def test_hands_a_released_slot_to_a_waiting_thread(self):
+        limit = ConcurrencyLimit(limit=1, queue_size=1, timeout=5)
+        limit.acquire()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limit.acquire()))
+        waiter.start()
+        while not limit.stats()["waiting"]:
+            threading.Event().wait(0.001)
+        limit.release()
+        waiter.join(5)
+        self.assertEqual(results, [True])
+        self.assertEqual(limit.in_flight, 1)
+
+    def test_waiting_task_times_out(self):
+        limit = ConcurrencyLimit(limit=1, queue_size=1, timeout=0.01)
+
+        async def searches():
+            await limit.aacquire()
+            return await limit.aacquire()
+
+        self.assertFalse(asyncio.run(searches()))
+        self.assertEqual((limit.timed_out, limit.stats()["waiting"], limit.in_flight), (1, 0, 1))
+
+
+class AdmissionControlTests(TestCase):
+    def test_throttled_search_is_an_operation_outcome(self):
+        limiter = RateLimiter(rate=1, burst=1, max_clients=10, clock=FakeClock())
+        with mock.patch("management_interface.views.search_rate_limiter", limiter):
+            self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "abc123"})
+            response = self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "abc123"})
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(json.loads(response.content)["issue"][0]["code"], "throttled")
+
+    def test_overloaded_search_is_turned_away(self):
+        limit = ConcurrencyLimit(limit=1, queue_size=0, timeout=1)
+        limit.acquire()
+        with mock.patch("management_interface.views.searches_in_flight", limit):
+            response = self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "abc123"})
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertEqual(limit.in_flight, 1)
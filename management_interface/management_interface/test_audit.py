@@ -0,0 +1,74 @@
+import os
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .audit import AuditLog, lookup_audit, write_events
+from .models import LookupAuditDay, LookupAuditEvent, LookupOutcome, RegisteredManager
+
+MORNING = datetime(2026, 10, 18, 9, tzinfo=timezone.utc)
+
+
+def audit_log(write, **options):
+    return AuditLog(
+        **{"enabled": True, "write": write, "capacity": 10, "batch_size": 3, "interval": 60, "max_wait": 0, **options}
+    )
+
+
+class WriteEventsTests(TestCase):
+    def test_adds_to_daily_counts(self):
+        write_events([(MORNING, LookupOutcome.HIT, "aaaa"), (MORNING, LookupOutcome.MISS, "")])
+        write_events([(MORNING, LookupOutcome.HIT, "bbbb")])
+        self.assertEqual(LookupAuditEvent.objects.count(), 3)
+        self.assertEqual(
+            sorted(LookupAuditDay.objects.values_list("outcome", "lookups")),
+            [(LookupOutcome.HIT, 2), (LookupOutcome.MISS, 1)],
+        )
+
+    def test_records_searches(self):
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        location.carerecipient_set.create(nhs_number_hash="abc123", provider_reference_id="foobar")
+        self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "abc123"})
+        self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "not a hash"})
+        lookup_audit.flush()
+        self.assertEqual(
+            list(LookupAuditEvent.objects.order_by("id").values_list("outcome", "nhs_number_hash"))[-2:],
+            [(LookupOutcome.HIT, "abc123"), (LookupOutcome.MISS, "")],
+        )
+
+
+class AuditLogTests(SimpleTestCase):
+    def test_writes_a_batch_inline_without_a_thread(self):
+        batches = []
+        log = audit_log(batches.append)
+        log.record(LookupOutcome.HIT, "aaaa")
+        log.record(LookupOutcome.MISS, "bbbb")
+        self.assertEqual(batches, [])
+        log.record(LookupOutcome.HIT, "cccc")
+        self.assertEqual([[hash for _, _, hash in batch] for batch in batches], [["aaaa", "bbbb", "cccc"]])
+
+    def test_drops_events_once_full(self):
+        log = audit_log(mock.Mock(), capacity=2)
+        # as if this process's thread were running but could not keep up
+        log._thread_pid = os.getpid()
+        for _ in range(3):
+            log.record(LookupOutcome.HIT, "aaaa")
+        self.assertEqual((log.recorded, log.waits, log.dropped), (2, 1, 1))
+
+    def test_keeps_a_batch_that_could_not_be_written(self):
+        log = audit_log(mock.Mock(side_effect=Exception("database down")))
+        log._thread_pid = os.getpid()
+        log.record(LookupOutcome.HIT, "aaaa")
+        with self.assertLogs("management_interface.audit", level="ERROR"):
+            log.flush()
+        self.assertEqual((log.stats()["buffered"], log.errors, log.dropped), (1, 1, 0))
@@ -0,0 +1,20 @@
+from django.test import TestCase
+
+from .benchmarking import compare, run_benchmark
+from .models import CareRecipient
+
+
+class BenchmarkTests(TestCase):
+    def test_run_benchmark_reports_each_size(self):
+        results = run_benchmark([5, 10], managers=1, locations=2, requests=3, admin_requests=2, log=lambda line: None)
+
+        self.assertEqual(CareRecipient.objects.count(), 10)
+        self.assertEqual([result["recipients"] for result in results["results"]], [5, 10])
+        search = results["results"][0]["search"]
+        self.assertEqual(set(search), {"hit", "hit_uncached", "miss", "bad_request"})
+        self.assertEqual(search["hit"]["requests"], 3)
+        self.assertLessEqual(search["hit"]["p50_ms"], search["hit"]["p99_ms"])
+
+        lines = list(compare(results, results))
+        self.assertEqual(len(lines), 10)
+        self.assertIn("(+0%)", lines[0])
@@ -0,0 +1,162 @@
+import select
+from http import HTTPStatus
+
+import psycopg2
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from .changes import (
+    CHANGE_CHANNEL,
+    changes_since,
+    format_cursor,
+    hashes_changed_since,
+    parse_cursor,
+    record_changes,
+)
+from .models import CareRecipient, DirectoryChange, RegisteredManager
+
+
+def recorded():
+    return list(DirectoryChange.objects.order_by("sequence").values_list("entity", "action", "nhs_number_hash"))
+
+
+class DirectoryChangeTests(TestCase):
+    def setUp(self):
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.recipient = self.location.carerecipient_set.create(nhs_number_hash="aaaa", provider_reference_id="foobar")
+        DirectoryChange.objects.all().delete()
+
+    def test_records_replaced_and_deleted_hashes(self):
+        recipient = CareRecipient.objects.get(pk=self.recipient.pk)
+        recipient.nhs_number_hash = "bbbb"
+        recipient.save()
+        recipient.delete()
+        self.assertEqual(
+            recorded(),
+            [
+                ("care_recipient", "deleted", "aaaa"),
+                ("care_recipient", "saved", "bbbb"),
+                ("care_recipient", "deleted", "bbbb"),
+            ],
+        )
+
+    def test_records_every_hash_at_a_saved_location(self):
+        self.location.carerecipient_set.create(nhs_number_hash="cccc", provider_reference_id="barfoo")
+        DirectoryChange.objects.all().delete()
+        self.location.email = "somewhere.else@nhs.net"
+        self.location.save()
+        self.assertEqual(
+            sorted(recorded()),
+            [("care_provider_location", "saved", "aaaa"), ("care_provider_location", "saved", "cccc")],
+        )
+
+
+class ChangesSinceTests(TransactionTestCase):
+    def test_waits_for_a_transaction_that_started_writing_first(self):
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {DirectoryChange._meta.db_table} (changed_at, entity, action, nhs_number_hash) "
+                "VALUES (now(), 'care_recipient', 'saved', decode('aaaa', 'hex'))"
+            )
+        record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.SAVED, ["bbbb"])
+        self.assertEqual(changes_since((0, 0), 10), ([], (0, 0), False))
+        other.commit()
+        changes, cursor, more = changes_since((0, 0), 10)
+        self.assertEqual([change.nhs_number_hash for change in changes], ["aaaa", "bbbb"])
+        self.assertEqual(changes_since(cursor, 10), ([], cursor, False))
+
+    def test_serves_changes_from_before_transaction_ids_first(self):
+        record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.SAVED, ["aaaa", "bbbb"])
+        DirectoryChange.objects.filter(nhs_number_hash="bbbb").update(transaction_id=0)
+        changes, cursor, more = changes_since(parse_cursor("0"), 1)
+        self.assertEqual(([change.nhs_number_hash for change in changes], more), (["bbbb"], True))
+        changes, _, more = changes_since(cursor, 1)
+        self.assertEqual(([change.nhs_number_hash for change in changes], more), (["aaaa"], False))
+
+    def test_reads_hashes_committed_past_a_running_transaction_again(self):
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute("SELECT pg_current_xact_id()")
+        record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.SAVED, ["aaaa"])
+        hashes, cursor = hashes_changed_since((0, 0))
+        self.assertEqual((hashes, cursor), (["aaaa"], (0, 0)))
+        other.commit()
+        hashes, cursor = hashes_changed_since(cursor)
+        self.assertEqual(hashes, ["aaaa"])
+        self.assertEqual(hashes_changed_since(cursor), ([], cursor))
+
+    def test_notifies_listeners_as_changes_commit(self):
+        listener = psycopg2.connect(**connections[DEFAULT_DB_ALIAS].get_connection_params())
+        self.addCleanup(listener.close)
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANGE_CHANNEL}")
+        record_changes(DirectoryChange.Entity.CARE_RECIPIENT, DirectoryChange.Action.SAVED, ["aaaa", "bbbb"])
+        self.assertTrue(select.select([listener], [], [], 5)[0])
+        listener.poll()
+        self.assertEqual([notify.channel for notify in listener.notifies], [CHANGE_CHANNEL])
+
+
+class ParseCursorTests(SimpleTestCase):
+    def test_parses_cursors_and_plain_sequence_numbers(self):
+        self.assertEqual(parse_cursor(format_cursor(1234, 56)), (1234, 56))
+        self.assertEqual(parse_cursor("56"), (0, 56))
+        for cursor in ("", "x", "1.", "1.x", "-1", "1.2.3"):
+            with self.assertRaises(ValueError):
+                parse_cursor(cursor)
+
+
+# the feed only serves committed transactions, so these tests commit theirs
+@override_settings(HANS_DIRECTORY_TOKEN="sekrit")
+class DirectoryChangesViewTests(TransactionTestCase):
+    url = reverse("directory_changes")
+
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Bearer sekrit"
+        for number in range(3):
+            DirectoryChange.objects.create(entity="care_recipient", action="saved", nhs_number_hash=f"{number:02x}")
+
+    def test_pages_through_changes(self):
+        first = self.client.get(self.url, {"limit": 2}).json()
+        self.assertEqual([change["nhs_number_hash"] for change in first["changes"]], ["00", "01"])
+        self.assertTrue(first["more"])
+        second = self.client.get(self.url, {"since": first["next"], "limit": 2}).json()
+        self.assertEqual([change["nhs_number_hash"] for change in second["changes"]], ["02"])
+        self.assertFalse(second["more"])
+        third = self.client.get(self.url, {"since": second["next"]}).json()
+        self.assertEqual((third["changes"], third["next"]), ([], second["next"]))
+
+    def test_rejects_a_bad_cursor(self):
+        for since in ("x", "1.x"):
+            self.assertEqual(self.client.get(self.url, {"since": since}).status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_requires_token(self):
+        self.assertEqual(Client().get(self.url).status_code, HTTPStatus.UNAUTHORIZED)
+
+    @override_settings(HANS_DIRECTORY_TOKEN="")
+    def test_refuses_everyone_but_staff_without_a_token(self):
+        self.assertEqual(Client(HTTP_AUTHORIZATION="Bearer ").get(self.url).status_code, HTTPStatus.UNAUTHORIZED)
+        staff = Client()
+        staff.force_login(User.objects.create_superuser("admin", "admin@nhs.net", None))
+        self.assertEqual(staff.get(self.url).status_code, HTTPStatus.OK)
@@ -0,0 +1,64 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from .compact_keys import RECIPIENTS, keys_compacted
+from .models import CareRecipient, RegisteredManager
+from .partitioning import partition_care_recipients
+
+
+class CompactKeysTests(TestCase):
+    def setUp(self):
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.recipient = self.location.carerecipient_set.create(nhs_number_hash="aaaa", provider_reference_id="foobar")
+
+    def text_columns(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id, care_provider_location_id, nhs_number_hash FROM {RECIPIENTS} ORDER BY id")
+            return cursor.fetchall()
+
+    def test_keeps_the_text_columns_current_for_the_previous_release(self):
+        self.assertEqual(self.text_columns(), [(str(self.recipient.pk), str(self.location.pk), "aaaa")])
+        self.recipient.nhs_number_hash = "bbbb"
+        self.recipient.save()
+        self.assertEqual(self.text_columns()[0][2], "bbbb")
+
+    def test_fills_the_shadow_columns_from_writes_of_the_previous_release(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {RECIPIENTS} (id, created_at, updated_at, care_provider_location_id, nhs_number_hash, "
+                "nhs_number_hash_scheme, subscription_id, provider_reference_id) "
+                "VALUES (%s, now(), now(), %s, 'cccc', 'sha3', 'subscription', 'barfoo')",
+                ["5f0b6b5c-3a64-4bf4-9d0e-4a3e9c3cf2a1", str(self.location.pk)],
+            )
+            cursor.execute(f"UPDATE {RECIPIENTS} SET nhs_number_hash = 'dddd' WHERE provider_reference_id = 'foobar'")
+        self.assertEqual(CareRecipient.objects.get(nhs_number_hash="cccc").care_provider_location, self.location)
+        self.assertEqual(CareRecipient.objects.get(nhs_number_hash="dddd").pk, self.recipient.pk)
+
+    def test_drops_the_text_columns(self):
+        with connection.cursor() as cursor:
+            # the tables cannot be altered while foreign key checks on rows this test wrote are still deferred
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        call_command("finish_compact_keys", stdout=StringIO())
+        with connection.cursor() as cursor:
+            self.assertTrue(keys_compacted(cursor))
+        self.location.carerecipient_set.create(nhs_number_hash="bbbb", provider_reference_id="barfoo")
+        self.assertEqual(CareRecipient.objects.get(nhs_number_hash="aaaa").pk, self.recipient.pk)
+        self.location.delete()
+        self.assertFalse(CareRecipient.objects.exists())
+        with self.assertRaisesMessage(CommandError, "already been dropped"):
+            call_command("finish_compact_keys", stdout=StringIO())
+
+    def test_partitioning_waits_for_the_text_columns_to_go(self):
+        with self.assertRaisesMessage(ValueError, "finish_compact_keys"):
+            partition_care_recipients(2, log=lambda line: None)
@@ -0,0 +1,24 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .configuration import env_flag
+
+
+class EnvFlagTests(SimpleTestCase):
+    def test_parses_explicit_values(self):
+        for value, expected in [
+            ("TRUE", True),
+            ("1", True),
+            (" yes ", True),
+            ("false", False),
+            ("0", False),
+            ("", False),
+        ]:
+            with self.subTest(value=value), mock.patch.dict("os.environ", {"HANS_MI_FLAG": value}):
+                self.assertIs(env_flag("HANS_MI_FLAG", True), expected)
+
+    def test_defaults_when_unset(self):
+        with mock.patch.dict("os.environ", clear=True):
+            self.assertIs(env_flag("HANS_MI_FLAG", True), True)
+            self.assertIs(env_flag("HANS_MI_FLAG", False), False)
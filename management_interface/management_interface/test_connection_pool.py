@@ -0,0 +1,81 @@
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import SimpleTestCase, TestCase
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from .connection_pool import ConnectionPool, PoolTimeout, close_pools, pool_statistics
+from .pooled_postgresql.base import DatabaseWrapper
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.rolled_back = False
+        self.info = type("Info", (), {"transaction_status": TRANSACTION_STATUS_IDLE})()
+
+    def rollback(self):
+        self.rolled_back = True
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_reuses_released_connections(self):
+        pool = ConnectionPool(FakeConnection, max_size=2, timeout=0)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+
+    def test_times_out_when_every_connection_is_in_use(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_rolls_back_open_transactions_on_release(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0)
+        fake = pool.acquire()
+        fake.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        pool.release(fake)
+        self.assertTrue(fake.rolled_back)
+        self.assertEqual(pool.stats()["idle"], 1)
+
+    def test_discards_closed_and_unhealthy_connections(self):
+        healthy = {}
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0, check=lambda fake: healthy.get(fake, False))
+        closed = pool.acquire()
+        closed.close()
+        pool.release(closed)
+        unhealthy = pool.acquire()
+        pool.release(unhealthy)
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, unhealthy)
+        self.assertTrue(unhealthy.closed)
+        self.assertEqual(pool.stats()["discarded"], 2)
+
+
+class PooledDatabaseWrapperTests(TestCase):
+    def tearDown(self):
+        close_pools(connection.settings_dict["NAME"])
+
+    def test_connections_return_to_the_pool_when_closed(self):
+        pooled = DatabaseWrapper(
+            {**connection.settings_dict, "POOL_SIZE": 1, "POOL_TIMEOUT": 1}, alias=DEFAULT_DB_ALIAS
+        )
+        pool = pooled.pool(pooled.get_connection_params())
+        reused = pool.reused
+        pooled.ensure_connection()
+        raw = pooled.connection
+        pooled.close()
+        self.assertFalse(raw.closed)
+
+        with pooled.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), (1,))
+        self.assertIs(pooled.connection, raw)
+        pooled.close()
+        self.assertEqual(pool.reused - reused, 1)
+        self.assertGreaterEqual(pool_statistics()["pools"], 1)
@@ -0,0 +1,57 @@
+import csv
+import json
+from http import HTTPStatus
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from .export import EXPORT_HEADER
+from .models import RegisteredManager
+
+
+class DirectoryExportTests(TestCase):
+    def setUp(self) -> None:
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat",
+            family_name="McGibbons",
+            email="manager@nhs.net",
+            cqc_registered_manager_id="My CQC RegsiteredManagerID",
+        )
+        location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        location.carerecipient_set.create(
+            subscription_id="42", provider_reference_id="foobar", nhs_number_hash="abc123"
+        )
+
+    def test_command_writes_csv(self):
+        stdout = StringIO()
+        call_command("export_hans", format="csv", stdout=stdout)
+
+        rows = list(csv.DictReader(StringIO(stdout.getvalue())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["nhs_number_hash"], "abc123")
+        self.assertEqual(rows[0]["care_provider_location_email"], "nosuchaddress@nhs.net")
+        self.assertEqual(rows[0]["registered_manager_email"], "manager@nhs.net")
+
+    def test_endpoint_streams_ndjson_to_staff(self):
+        staff = User.objects.create_user("staff", is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse("directory_export"), {"format": "ndjson"})
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(list(rows[0]), list(EXPORT_HEADER))
+        self.assertEqual(rows[0]["ods_code"], "My Ods Code")
+
+    def test_endpoint_is_staff_only(self):
+        response = self.client.get(reverse("directory_export"))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
@@ -0,0 +1,101 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .hashers import HashingPool, ScryptHasher, Sha3Hasher, get_hasher, sha3_hex
+from .models import CareRecipient, DirectoryChange, RegisteredManager
+
+# cheap scrypt costs so the tests stay fast
+TEST_SCRYPT_SETTINGS = {
+    "HANS_NHS_NUMBER_HASHER": "scrypt",
+    "HANS_SCRYPT_SALT": "test-salt",
+    "HANS_SCRYPT_N": 16,
+    "HANS_SCRYPT_R": 1,
+    "HANS_SCRYPT_P": 1,
+}
+
+
+class HasherTests(SimpleTestCase):
+    def setUp(self) -> None:
+        get_hasher.cache_clear()
+
+    def tearDown(self) -> None:
+        get_hasher.cache_clear()
+
+    def test_default_hasher_is_sha3(self):
+        self.assertIsInstance(get_hasher(), Sha3Hasher)
+
+    @override_settings(**TEST_SCRYPT_SETTINGS)
+    def test_scrypt_hasher_is_configurable(self):
+        hasher = get_hasher()
+        self.assertIsInstance(hasher, ScryptHasher)
+        self.assertEqual(hasher.scheme, "scrypt$16$1$1")
+
+    def test_scrypt_upgrade_of_sha3_hash_matches_fresh_hash(self):
+        hasher = ScryptHasher(salt="test-salt", n=16, r=1, p=1)
+        self.assertEqual(hasher.upgrade(sha3_hex("password"), "sha3_256"), hasher.hash_nhs_number("password"))
+
+    def test_scrypt_cannot_upgrade_other_scrypt_schemes(self):
+        hasher = ScryptHasher(salt="test-salt", n=16, r=1, p=1)
+        self.assertIsNone(hasher.upgrade("abc", "scrypt$32$1$1"))
+
+    @override_settings(**{**TEST_SCRYPT_SETTINGS, "HANS_SCRYPT_SALT": ""})
+    def test_scrypt_needs_a_salt(self):
+        with self.assertRaises(ValueError):
+            get_hasher()
+        with self.assertRaises(ValueError):
+            ScryptHasher(salt="change_me", n=16, r=1, p=1)
+
+    def test_hashing_pool_preserves_order_and_is_started_once(self):
+        values = [str(number) for number in range(20)]
+        with mock.patch("management_interface.hashers.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as executor:
+            with HashingPool(workers=2) as pool:
+                self.assertEqual(pool.map(sha3_hex, values), [sha3_hex(value) for value in values])
+                self.assertEqual(pool.map(sha3_hex, values[:3]), [sha3_hex(value) for value in values[:3]])
+        executor.assert_called_once_with(max_workers=2)
+
+
+class RehashCommandTests(TestCase):
+    def setUp(self) -> None:
+        get_hasher.cache_clear()
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.care_recipient = CareRecipient(care_provider_location=location, provider_reference_id="foobar")
+        self.care_recipient.nhs_number = "password"
+        self.care_recipient.clean()
+        self.care_recipient.save()
+
+    def tearDown(self) -> None:
+        get_hasher.cache_clear()
+
+    @override_settings(**TEST_SCRYPT_SETTINGS)
+    def test_rehashes_to_configured_scheme(self):
+        # setUp ran before these settings applied, and cached the hasher they replace
+        get_hasher.cache_clear()
+        call_command("rehash", workers=1, stdout=StringIO())
+
+        self.care_recipient.refresh_from_db()
+        hasher = get_hasher()
+        self.assertEqual(self.care_recipient.nhs_number_hash_scheme, hasher.scheme)
+        self.assertEqual(self.care_recipient.nhs_number_hash, hasher.hash_nhs_number("password"))
+        changes = DirectoryChange.objects.order_by("-sequence").values_list("action", "nhs_number_hash")[:2]
+        self.assertEqual(
+            list(changes), [("saved", hasher.hash_nhs_number("password")), ("deleted", sha3_hex("password"))]
+        )
+
+    @override_settings(**TEST_SCRYPT_SETTINGS)
+    def test_dry_run_changes_nothing(self):
+        call_command("rehash", workers=1, dry_run=True, stdout=StringIO())
+
+        self.care_recipient.refresh_from_db()
+        self.assertEqual(self.care_recipient.nhs_number_hash, sha3_hex("password"))
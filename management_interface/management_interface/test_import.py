@@ -0,0 +1,161 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase
+
+from .hashers import sha3_hex
+from .models import (
+    CareProviderLocation,
+    CareRecipient,
+    DirectoryChange,
+    RegisteredManager,
+)
+
+
+class ImportHansCommandTests(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def import_hans(self, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_hans", workers=1, stdout=stdout, stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_imports_managers_locations_and_recipients(self):
+        managers = self.write_file(
+            "managers.csv",
+            "given_name,family_name,email,cqc_registered_manager_id\nAislinn,Mullen,aislinn@nhs.net,1-123\n",
+        )
+        locations = self.write_file(
+            "locations.ndjson",
+            json.dumps(
+                {
+                    "name": "My Location Name",
+                    "email": "branch@nhs.net",
+                    "ods_code": "ODS1",
+                    "cqc_location_id": "1-110",
+                    "registered_manager_email": "aislinn@nhs.net",
+                }
+            )
+            + "\n",
+        )
+        recipients = self.write_file(
+            "recipients.csv", "nhs_number,provider_reference_id,ods_code\n9990001112,REF1,ODS1\n9990001113,REF2,ODS1\n"
+        )
+
+        errors = self.import_hans(managers=managers, locations=locations, recipients=recipients, batch_size=1)
+
+        self.assertEqual(errors, "")
+        location = CareProviderLocation.objects.get(ods_code="ODS1")
+        self.assertEqual(location.registered_manager, RegisteredManager.objects.get(email="aislinn@nhs.net"))
+        self.assertIn("branch@nhs.net", location.fhir_organization)
+        recipient = CareRecipient.objects.get(provider_reference_id="REF1")
+        self.assertEqual(recipient.care_provider_location, location)
+        self.assertEqual(recipient.nhs_number_hash, sha3_hex("9990001112"))
+        self.assertIsNone(recipient.nhs_number)
+        self.assertEqual(
+            set(DirectoryChange.objects.values_list("nhs_number_hash", flat=True)),
+            {sha3_hex("9990001112"), sha3_hex("9990001113")},
+        )
+
+    def test_reports_rejected_rows_with_line_numbers(self):
+        managers = self.write_file(
+            "managers.csv",
+            "given_name,family_name,email,cqc_registered_manager_id\n"
+            "Aislinn,Mullen,aislinn@nhs.net,1-123\n"
+            "Bad,Domain,someone@example.com,1-124\n"
+            ",Missing,missing@nhs.net,1-125\n",
+        )
+        recipients = self.write_file("recipients.csv", "nhs_number,provider_reference_id,ods_code\n999,REF1,NOPE\n")
+
+        errors = self.import_hans(managers=managers, recipients=recipients)
+
+        self.assertIn("managers.csv:3: email: Enter an nhs.net email address", errors)
+        self.assertIn("managers.csv:4: missing given_name", errors)
+        self.assertIn("recipients.csv:2: no care provider location with ODS code NOPE", errors)
+        self.assertEqual(RegisteredManager.objects.count(), 1)
+        self.assertEqual(CareRecipient.objects.count(), 0)
+
+    def test_rows_cannot_refer_to_a_batch_that_failed_to_save(self):
+        managers = self.write_file(
+            "managers.csv",
+            "given_name,family_name,email,cqc_registered_manager_id\nAislinn,Mullen,aislinn@nhs.net,1-123\n",
+        )
+        locations = self.write_file(
+            "locations.csv",
+            "name,email,ods_code,cqc_location_id,registered_manager_email\n"
+            "My Location Name,branch@nhs.net,ODS1,1-110,aislinn@nhs.net\n",
+        )
+        recipients = self.write_file("recipients.csv", "nhs_number,provider_reference_id,ods_code\n999,REF1,ODS1\n")
+
+        with mock.patch.object(RegisteredManager.objects, "bulk_create", side_effect=DatabaseError("server closed")):
+            errors = self.import_hans(managers=managers, locations=locations, recipients=recipients)
+
+        self.assertIn("managers.csv:2: batch failed to save: server closed", errors)
+        self.assertIn("locations.csv:2: no registered manager with email aislinn@nhs.net", errors)
+        self.assertIn("recipients.csv:2: no care provider location with ODS code ODS1", errors)
+        self.assertEqual(CareProviderLocation.objects.count(), 0)
+
+    def import_location(self):
+        managers = self.write_file(
+            "managers.csv",
+            "given_name,family_name,email,cqc_registered_manager_id\nAislinn,Mullen,aislinn@nhs.net,1-123\n",
+        )
+        locations = self.write_file(
+            "locations.csv",
+            "name,email,ods_code,cqc_location_id,registered_manager_email\n"
+            "My Location Name,branch@nhs.net,ODS1,1-110,aislinn@nhs.net\n",
+        )
+        recipients = self.write_file("recipients.csv", "nhs_number,provider_reference_id,ods_code\n999,REF1,ODS1\n")
+        self.import_hans(managers=managers, locations=locations, recipients=recipients)
+
+    def test_rejects_nhs_numbers_already_subscribed(self):
+        self.import_location()
+        recipients = self.write_file(
+            "more-recipients.csv",
+            "nhs_number,provider_reference_id,ods_code\n999,REF2,ODS1\n998,REF3,ODS1\n998,REF4,ODS1\n",
+        )
+
+        errors = self.import_hans(recipients=recipients)
+
+        self.assertIn("more-recipients.csv:2: NHS number is already subscribed", errors)
+        self.assertIn("more-recipients.csv:4: NHS number appears more than once", errors)
+        self.assertEqual(
+            sorted(CareRecipient.objects.values_list("provider_reference_id", flat=True)), ["REF1", "REF3"]
+        )
+
+    def test_counts_each_rejected_row_once_when_a_batch_fails(self):
+        self.import_location()
+        recipients = self.write_file(
+            "more-recipients.csv", "nhs_number,provider_reference_id,ods_code\n998,REF1,ODS1\n997,REF2,ODS1\n"
+        )
+        stdout = StringIO()
+
+        with mock.patch.object(CareRecipient.objects, "bulk_create", side_effect=DatabaseError("server closed")):
+            call_command("import_hans", recipients=recipients, workers=1, stdout=stdout, stderr=StringIO())
+
+        self.assertIn("Rejected 2 rows", stdout.getvalue())
+
+    def test_dry_run_saves_nothing(self):
+        managers = self.write_file(
+            "managers.csv",
+            "given_name,family_name,email,cqc_registered_manager_id\nAislinn,Mullen,aislinn@nhs.net,1-123\n",
+        )
+
+        self.import_hans(managers=managers, dry_run=True)
+
+        self.assertEqual(RegisteredManager.objects.count(), 0)
@@ -0,0 +1,138 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from .known_hashes import BloomFilter, KnownHashFilter
+from .lookup import find_care_provider, find_care_providers, known_hashes, lookup_cache
+from .models import RegisteredManager
+
+
+class FakeChanges:
+    def __init__(self, listening=True):
+        self.listening = listening
+        self.received = 1
+
+    def wait(self, timeout):
+        return False
+
+
+def make_filter(hashes, changed=(), calls=None, changes=None):
+    def load_changed_since(cursor):
+        if calls is not None:
+            calls.append(cursor)
+        return changed, (cursor[0] + 1, 0)
+
+    return KnownHashFilter(
+        enabled=True,
+        error_rate=1e-6,
+        refresh_interval=5,
+        count=lambda: len(hashes),
+        load_all=lambda: iter(hashes),
+        load_changed_since=load_changed_since,
+        position=lambda: (100, 0),
+        changes=changes or FakeChanges(),
+    )
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_never_loses_added_keys(self):
+        bloom_filter = BloomFilter(capacity=10000, error_rate=0.01)
+        keys = [f"known-{number}" for number in range(10000)]
+        for key in keys:
+            bloom_filter.add(key)
+        self.assertTrue(all(key in bloom_filter for key in keys))
+        false_positives = sum(f"unknown-{number}" in bloom_filter for number in range(10000))
+        self.assertLess(false_positives, 200)
+        self.assertAlmostEqual(bloom_filter.false_positive_rate(), 0.01, delta=0.005)
+
+    def test_counts_distinct_keys(self):
+        bloom_filter = BloomFilter(capacity=10, error_rate=0.01)
+        bloom_filter.add("a")
+        bloom_filter.add("a")
+        self.assertEqual(bloom_filter.count, 1)
+
+
+class KnownHashFilterTests(SimpleTestCase):
+    def test_lets_everything_through_until_built(self):
+        known = make_filter(["a"])
+        self.assertTrue(known.might_contain("b"))
+        known.build()
+        self.assertTrue(known.might_contain("a"))
+        self.assertFalse(known.might_contain("b"))
+        self.assertEqual(known.stats()["negatives"], 1)
+
+    def test_keeps_hashes_added_during_a_build(self):
+        known = make_filter([])
+
+        def load_all():
+            known.add("saved-while-building")
+            return iter(["a"])
+
+        known._load_all = load_all
+        known.build()
+        self.assertTrue(known.might_contain("saved-while-building"))
+
+    def test_tops_up_with_changes_since_the_last_refresh(self):
+        calls = []
+        known = make_filter(["a"], changed=["b"], calls=calls)
+        known.refresh()
+        known.refresh()
+        known.refresh()
+        self.assertTrue(known.might_contain("b"))
+        self.assertEqual(calls, [(100, 0), (101, 0)])
+        self.assertEqual((known.builds, known.top_ups), (1, 2))
+
+    def test_queries_for_unknown_hashes_until_notified_changes_are_applied(self):
+        changes = FakeChanges()
+        known = make_filter(["a"], changes=changes)
+        known.build()
+        changes.received += 1
+        self.assertTrue(known.might_contain("b"))
+        known.top_up()
+        self.assertFalse(known.might_contain("b"))
+        self.assertEqual((known.stats()["unsure"], known.stats()["negatives"]), (1, 1))
+
+    def test_queries_for_unknown_hashes_while_not_listening(self):
+        changes = FakeChanges(listening=False)
+        known = make_filter(["a"], changes=changes)
+        known.build()
+        self.assertTrue(known.might_contain("b"))
+        changes.listening = True
+        self.assertFalse(known.might_contain("b"))
+
+    def test_rebuilds_after_deletions(self):
+        known = make_filter(["a"])
+        known.build()
+        self.assertFalse(known.needs_rebuild())
+        known.discard("a")
+        self.assertTrue(known.needs_rebuild())
+
+
+class NegativeLookupTests(TestCase):
+    def setUp(self):
+        lookup_cache.clear()
+        self.addCleanup(known_hashes.clear)
+        patcher = mock.patch.object(known_hashes, "changes", FakeChanges())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.location.carerecipient_set.create(nhs_number_hash="aaaa", provider_reference_id="foobar")
+        known_hashes.build()
+
+    def test_unknown_hashes_are_answered_without_a_query(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(find_care_provider("cccc"))
+            self.assertEqual(find_care_providers(["cccc"]), {})
+        self.assertIsNotNone(find_care_provider("aaaa"))
+
+    def test_saved_care_recipients_are_found(self):
+        self.location.carerecipient_set.create(nhs_number_hash="bbbb", provider_reference_id="barfoo")
+        self.assertIsNotNone(find_care_provider("bbbb"))
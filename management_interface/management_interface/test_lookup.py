@@ -0,0 +1,137 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .lookup import find_care_provider, lookup_cache
+from .lookup_cache import LookupCache
+from .models import RegisteredManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LookupCacheTests(SimpleTestCase):
+    def test_loads_on_miss_and_serves_hits(self):
+        cache = LookupCache(max_size=10, ttl=60)
+        loads = []
+
+        def loader(key):
+            loads.append(key)
+            return key.upper()
+
+        self.assertEqual(cache.get_or_load("abc", loader), "ABC")
+        self.assertEqual(cache.get_or_load("abc", loader), "ABC")
+        self.assertEqual(loads, ["abc"])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_does_not_store_missing_values(self):
+        cache = LookupCache(max_size=10, ttl=60)
+        cache.get_or_load("abc", lambda key: None)
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = LookupCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expires_entries_after_ttl(self):
+        clock = FakeClock()
+        cache = LookupCache(max_size=10, ttl=60, clock=clock)
+        cache.set("a", 1)
+        clock.now = 59
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 60
+        self.assertIsNone(cache.get("a"))
+
+    def test_discards_load_that_raced_with_invalidation(self):
+        cache = LookupCache(max_size=10, ttl=60)
+
+        def loader(key):
+            cache.invalidate(key)
+            return "stale"
+
+        cache.get_or_load("a", loader)
+        self.assertIsNone(cache.get("a"))
+
+    def test_remembers_when_it_last_invalidated(self):
+        clock = FakeClock()
+        cache = LookupCache(max_size=10, ttl=60, clock=clock)
+        self.assertFalse(cache.invalidated_within(10))
+        cache.invalidate_where(lambda value: False)
+        clock.now = 9
+        self.assertTrue(cache.invalidated_within(10))
+        clock.now = 10
+        self.assertFalse(cache.invalidated_within(10))
+
+    def test_zero_size_disables_cache(self):
+        cache = LookupCache(max_size=0, ttl=60)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+class FindCareProviderTests(TestCase):
+    def setUp(self) -> None:
+        lookup_cache.clear()
+        self.manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = self.manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.care_recipient = self.location.carerecipient_set.create(
+            subscription_id="42", provider_reference_id="foobar"
+        )
+        self.care_recipient.nhs_number = "password"
+        self.care_recipient.clean()
+        self.care_recipient.save()
+
+    def test_second_lookup_does_not_query(self):
+        find_care_provider(self.care_recipient.nhs_number_hash)
+        with self.assertNumQueries(0):
+            match = find_care_provider(self.care_recipient.nhs_number_hash)
+        self.assertIn("nosuchaddress@nhs.net", match.organization)
+
+    def test_location_change_invalidates(self):
+        find_care_provider(self.care_recipient.nhs_number_hash)
+        self.location.email = "somewhere.else@nhs.net"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.save()
+            # until the change commits, other connections still see the cached row
+            self.assertIn("nosuchaddress@nhs.net", find_care_provider(self.care_recipient.nhs_number_hash).organization)
+        self.assertIn("somewhere.else@nhs.net", find_care_provider(self.care_recipient.nhs_number_hash).organization)
+
+    def test_care_recipient_delete_invalidates(self):
+        find_care_provider(self.care_recipient.nhs_number_hash)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.care_recipient.delete()
+        self.assertIsNone(find_care_provider(self.care_recipient.nhs_number_hash))
+
+    @override_settings(HANS_REPLICA_READ_YOUR_WRITES=10)
+    def test_reads_the_primary_for_a_while_after_an_invalidation(self):
+        with mock.patch(
+            "management_interface.lookup.read_from_replica", side_effect=lambda read, *args: read(*args)
+        ) as replica:
+            with override_settings(HANS_REPLICA_READ_YOUR_WRITES=0):
+                find_care_provider(self.care_recipient.nhs_number_hash)
+            self.assertEqual(replica.call_count, 1)
+            self.location.email = "somewhere.else@nhs.net"
+            with self.captureOnCommitCallbacks(execute=True):
+                self.location.save()
+            # a replica that has not replayed the change yet would cache the old email for the whole TTL
+            self.assertIn(
+                "somewhere.else@nhs.net", find_care_provider(self.care_recipient.nhs_number_hash).organization
+            )
+            self.assertEqual(replica.call_count, 1)
@@ -0,0 +1,63 @@
+from http import HTTPStatus
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .metrics import METRICS
+from .models import RegisteredManager
+
+
+@override_settings(HANS_METRICS_TOKEN="sekrit")
+class RequestMetricsTests(TestCase):
+    def setUp(self) -> None:
+        for metric in METRICS:
+            metric.clear()
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+
+    def search(self):
+        return self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "abc123"})
+
+    def metrics(self, **headers):
+        return self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer sekrit", **headers)
+
+    def test_records_requests_by_view(self):
+        self.search()
+
+        response = self.metrics()
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        body = response.content.decode()
+        self.assertIn('hans_request_duration_seconds_count{view="care_provider_search"} 1', body)
+        self.assertIn('hans_db_queries_bucket{view="care_provider_search",le="1"} 1', body)
+        self.assertIn("hans_lookup_cache_misses", body)
+
+    @override_settings(HANS_QUERY_BUDGET=0)
+    def test_flags_requests_over_query_budget(self):
+        with self.assertLogs("management_interface.metrics", level="WARNING") as logs:
+            self.search()
+
+        self.assertIn("issued 1 queries, over the budget of 0", logs.output[0])
+        body = self.metrics().content.decode()
+        self.assertIn('hans_query_budget_exceeded_total{view="care_provider_search"} 1', body)
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, HTTPStatus.UNAUTHORIZED)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    @override_settings(HANS_METRICS_TOKEN="")
+    def test_only_lets_staff_in_without_a_token(self):
+        self.assertEqual(
+            self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ").status_code, HTTPStatus.UNAUTHORIZED
+        )
+        self.client.force_login(User.objects.create_superuser("admin", "admin@nhs.net", None))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, HTTPStatus.OK)
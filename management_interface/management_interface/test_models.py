@@ -1,4 +1,7 @@
+import json
+
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
 
 from .models import CareProviderLocation, CareRecipient, RegisteredManager
@@ -103,6 +106,19 @@ class CareProviderLocationTests(TestCase):
         location = create_care_provider_location(manager=manager)
         self.assertEqual(str(location), "My Location Name")
 
+    def test_save_renders_fhir_organization(self):
+        manager = create_registered_manager()
+        manager.save()
+        location = create_care_provider_location(manager=manager)
+        location.save()
+        location.email = "somewhere.else@nhs.net"
+        location.save(update_fields=["email"])
+
+        organization = json.loads(CareProviderLocation.objects.get(pk=location.pk).fhir_organization)
+        self.assertEqual(organization["resourceType"], "Organization")
+        self.assertEqual(organization["name"], "My Location Name")
+        self.assertEqual(organization["telecom"][0]["value"], "somewhere.else@nhs.net")
+
 
 class CareRecipientTests(TestCase):
     def create_registered_manager_object(self):
@@ -139,6 +155,19 @@ class CareRecipientTests(TestCase):
         jeff_comparison = CareRecipient.objects.get(pk=jeff.id)
         self.assertEquals(jeff.nhs_number_hash, jeff_comparison.nhs_number_hash)
 
+    def test_nhs_number_hash_is_stored_as_bytes(self):
+        manager = self.create_registered_manager_object()
+        location = self.create_care_provider_location_object(manager=manager)
+        jeff = location.carerecipient_set.create(provider_reference_id="foobar", nhs_number_hash="c0067d4a" * 8)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT octet_length(nhs_number_digest) FROM management_interface_carerecipient WHERE uuid = %s",
+                [jeff.pk],
+            )
+            self.assertEqual(cursor.fetchone(), (32,))
+        self.assertEqual(CareRecipient.objects.get(nhs_number_hash="c0067d4a" * 8).pk, jeff.pk)
+
     def test_str_method(self):
         manager = self.create_registered_manager_object()
         location = self.create_care_provider_location_object(manager=manager)
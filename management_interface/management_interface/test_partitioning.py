@@ -0,0 +1,119 @@
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.urls import reverse
+
+from .admin import estimated_count
+from .compact_keys import finish_compact_keys
+from .models import CareRecipient, RegisteredManager
+from .partitioning import (
+    copy_rows,
+    create_partitioned_table,
+    is_partitioned,
+    partition_care_recipients,
+    swap,
+)
+from .synthetic import synthetic_nhs_number_hash
+
+
+class PartitioningTests(TestCase):
+    def setUp(self):
+        finish_compact_keys(log=lambda line: None)
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        for number in range(5):
+            self.create_recipient(number)
+
+    def create_recipient(self, number, reference=None):
+        return self.location.carerecipient_set.create(
+            nhs_number_hash=synthetic_nhs_number_hash(number), provider_reference_id=reference or f"REF{number}"
+        )
+
+    def partition(self, partitions=4):
+        with connection.cursor() as cursor:
+            # the table cannot be altered while foreign key checks on rows this test wrote are still deferred
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        partition_care_recipients(partitions, batch_size=2, log=lambda line: None)
+
+    def test_copies_every_care_recipient(self):
+        self.partition()
+        with connection.cursor() as cursor:
+            self.assertTrue(is_partitioned(cursor))
+        self.assertEqual(
+            sorted(CareRecipient.objects.values_list("provider_reference_id", flat=True)),
+            [f"REF{number}" for number in range(5)],
+        )
+        self.assertEqual(
+            CareRecipient.objects.get(nhs_number_hash=synthetic_nhs_number_hash(3)).care_provider_location,
+            self.location,
+        )
+
+    def test_lookup_visits_one_partition(self):
+        self.partition()
+        plan = CareRecipient.objects.filter(nhs_number_hash=synthetic_nhs_number_hash(3)).explain()
+        self.assertEqual(plan.count(f"{CareRecipient._meta.db_table}_p0"), 1)
+
+    def test_keeps_unique_keys_unique_across_partitions(self):
+        self.partition()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_recipient(5, reference="REF1")
+        self.create_recipient(5)
+
+    def test_only_locks_unique_keys_that_change(self):
+        self.partition()
+        recipient = CareRecipient.objects.get(provider_reference_id="REF1")
+        recipient.save()
+        self.assertEqual(self.advisory_locks(), 0)
+        self.create_recipient(5)
+        self.assertEqual(self.advisory_locks(), 2)
+
+    def advisory_locks(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def test_moves_a_care_recipient_whose_hash_changes(self):
+        self.partition()
+        CareRecipient.objects.filter(provider_reference_id="REF1").update(nhs_number_hash=synthetic_nhs_number_hash(9))
+        CareRecipient.objects.filter(provider_reference_id="REF2").delete()
+        self.assertEqual(
+            CareRecipient.objects.get(nhs_number_hash=synthetic_nhs_number_hash(9)).provider_reference_id, "REF1"
+        )
+        self.assertEqual(CareRecipient.objects.count(), 4)
+
+    def test_mirrors_writes_made_while_copying(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            create_partitioned_table(cursor, 2)
+            self.create_recipient(5)
+            CareRecipient.objects.filter(provider_reference_id="REF1").update(provider_reference_id="REF1a")
+            CareRecipient.objects.filter(provider_reference_id="REF2").delete()
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            self.assertEqual(copy_rows(cursor, batch_size=2), 5)
+            swap(cursor, keep_unpartitioned=False)
+        self.assertEqual(
+            sorted(CareRecipient.objects.values_list("provider_reference_id", flat=True)),
+            ["REF0", "REF1a", "REF3", "REF4", "REF5"],
+        )
+
+    def test_admin_keeps_working(self):
+        self.partition()
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {CareRecipient._meta.db_table}")
+        self.assertEqual(estimated_count(CareRecipient.objects.all()), 5)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@nhs.net", None))
+        response = self.client.get(reverse("admin:management_interface_carerecipient_changelist"))
+        self.assertEqual(len(response.context["cl"].result_list), 5)
+
+    def test_refuses_to_partition_twice(self):
+        self.partition()
+        with self.assertRaisesMessage(CommandError, "already partitioned"):
+            call_command("partition_care_recipients")
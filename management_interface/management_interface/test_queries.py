@@ -0,0 +1,32 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from .lookup import match_queryset
+from .models import RegisteredManager
+
+
+@skipUnless(connection.vendor == "postgresql", "query plans are PostgreSQL-specific")
+class HashLookupQueryPlanTests(TestCase):
+    def setUp(self) -> None:
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        for number in range(100):
+            location.carerecipient_set.create(provider_reference_id=f"ref{number}", nhs_number_hash=f"{number:064x}")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE management_interface_carerecipient")
+            # the test tables are far too small for the planner to prefer an index on cost alone
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+
+    def test_hash_lookup_is_index_only_on_care_recipients(self):
+        plan = match_queryset().filter(nhs_number_hash=f"{42:064x}").explain()
+        self.assertIn("Index Only Scan using care_recipient_hash_lookup", plan)
@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from . import routers
+from .models import CareRecipient
+from .routers import (
+    LAST_WRITE_SESSION_KEY,
+    ReplicaRouter,
+    ReplicaSet,
+    iterate_from_replica,
+    pinned_to_primary,
+    read_from_replica,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReplicaSetTests(SimpleTestCase):
+    def test_chooses_replicas_in_turn(self):
+        replicas = ReplicaSet(["replica_0", "replica_1"], retry_after=30)
+        self.assertEqual([replicas.choose() for _ in range(3)], ["replica_0", "replica_1", "replica_0"])
+
+    def test_chooses_none_while_disabled(self):
+        replicas = ReplicaSet(["replica_0"], retry_after=30)
+        with replicas.disabled():
+            self.assertIsNone(replicas.choose())
+        self.assertEqual(replicas.choose(), "replica_0")
+
+    def test_skips_failed_replicas_until_retry_after(self):
+        clock = FakeClock()
+        replicas = ReplicaSet(["replica_0", "replica_1"], retry_after=30, clock=clock)
+        replicas.mark_failed("replica_0")
+        self.assertEqual({replicas.choose() for _ in range(3)}, {"replica_1"})
+        replicas.mark_failed("replica_1")
+        self.assertIsNone(replicas.choose())
+        clock.now = 30
+        self.assertIsNotNone(replicas.choose())
+        self.assertEqual(replicas.stats()["failures"], 2)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(routers, "replicas", ReplicaSet(["replica_0"], retry_after=30))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def query(self):
+        alias = ReplicaRouter().db_for_read(CareRecipient)
+        if alias == "replica_0":
+            raise OperationalError("replica is down")
+        return alias
+
+    def test_only_routes_reads_inside_read_from_replica(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(CareRecipient))
+        self.assertEqual(read_from_replica(router.db_for_read, CareRecipient), "replica_0")
+        self.assertEqual(router.db_for_write(CareRecipient), "default")
+
+    def test_falls_back_to_the_primary_when_the_replica_fails(self):
+        self.assertIsNone(read_from_replica(self.query))
+        self.assertIsNone(routers.replicas.choose())
+
+    def test_pinned_sessions_read_from_the_primary(self):
+        token = pinned_to_primary.set(True)
+        try:
+            self.assertIsNone(read_from_replica(ReplicaRouter().db_for_read, CareRecipient))
+            self.assertEqual(list(iterate_from_replica(lambda alias: iter([alias]))), ["default"])
+        finally:
+            pinned_to_primary.reset(token)
+
+    def test_iteration_restarts_on_the_primary_when_the_replica_fails(self):
+        def rows(alias):
+            if alias == "replica_0":
+                raise OperationalError("replica is down")
+            yield alias
+
+        self.assertEqual(list(iterate_from_replica(rows)), ["default"])
+
+
+class ReadYourWritesTests(TestCase):
+    def test_records_writes_by_staff_sessions(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@nhs.net", None))
+        self.client.post(
+            reverse("admin:management_interface_registeredmanager_add"),
+            {
+                "given_name": "Jehosephat",
+                "family_name": "McGibbons",
+                "email": "jehosephat@nhs.net",
+                "cqc_registered_manager_id": "1-000000001",
+            },
+        )
+        self.assertIn(LAST_WRITE_SESSION_KEY, self.client.session)
+
+    def test_api_requests_do_not_touch_the_session(self):
+        self.client.post(reverse("care_provider_search"), {"_careRecipientPseudoId": "abc"})
+        self.assertNotIn(LAST_WRITE_SESSION_KEY, self.client.session)
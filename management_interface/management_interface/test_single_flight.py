@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+
+from .single_flight import SingleFlight
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def query(key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return key.upper()
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do("abc", query, "abc")))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flights.do("abc", query, "abc"))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        while flights.coalesced < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(results, ["ABC"] * 4)
+        self.assertEqual(calls, ["abc"])
+        self.assertEqual(flights.stats(), {"enabled": True, "calls": 1, "coalesced": 3})
+
+    def test_calls_again_once_the_first_has_returned(self):
+        flights = SingleFlight()
+        calls = []
+        flights.do("abc", calls.append, "abc")
+        flights.do("abc", calls.append, "abc")
+        self.assertEqual(calls, ["abc", "abc"])
+
+    def test_shares_exceptions(self):
+        flights = SingleFlight()
+
+        async def query():
+            await asyncio.sleep(0.01)
+            raise ValueError("replica down")
+
+        async def lookups():
+            return await asyncio.gather(*(flights.ado("abc", query) for _ in range(3)), return_exceptions=True)
+
+        errors = asyncio.run(lookups())
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertEqual((flights.calls, flights.coalesced), (1, 2))
+
+    def test_cancelling_one_caller_does_not_cancel_the_call(self):
+        flights = SingleFlight()
+
+        async def query():
+            await asyncio.sleep(0.01)
+            return "found"
+
+        async def lookups():
+            first = asyncio.ensure_future(flights.ado("abc", query))
+            second = asyncio.ensure_future(flights.ado("abc", query))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(lookups()), "found")
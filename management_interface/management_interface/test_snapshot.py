@@ -0,0 +1,179 @@
+import gzip
+import json
+import os
+import tempfile
+from http import HTTPStatus
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from .changes import parse_cursor
+from .models import CareRecipient, DirectoryChange, RegisteredManager
+from .snapshot import SnapshotStore, parse_range
+
+
+@override_settings(HANS_DIRECTORY_TOKEN="sekrit")
+class DirectorySnapshotTests(TestCase):
+    def setUp(self):
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.location.carerecipient_set.create(nhs_number_hash="bbbb", provider_reference_id="foobar")
+        self.location.carerecipient_set.create(nhs_number_hash="aaaa", provider_reference_id="barfoo")
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # refreshed far less often than a test takes, so no background thread is started once it is built here
+        self.store = SnapshotStore(directory.name, refresh=3600)
+        self.store.refresh()
+        patcher = mock.patch("management_interface.views.snapshots", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def download(self, **headers):
+        response = self.client.get(reverse("directory_snapshot"), HTTP_AUTHORIZATION="Bearer sekrit", **headers)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_serves_the_directory_sorted_by_hash(self):
+        response, content = self.download()
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        # a consumer carrying on from the cursor is sent the changes this test's own transaction wrote again
+        transaction_id, sequence = parse_cursor(response["X-Change-Cursor"])
+        self.assertLessEqual(transaction_id, DirectoryChange.objects.latest("sequence").transaction_id)
+        self.assertEqual(sequence, 0)
+        lines = [json.loads(line) for line in gzip.decompress(content).splitlines()]
+        self.assertEqual([line["nhs_number_hash"] for line in lines], ["aaaa", "bbbb"])
+        self.assertEqual(lines[0]["email"], "nosuchaddress@nhs.net")
+
+    def test_orders_a_hash_at_two_locations_by_id(self):
+        other = self.location.registered_manager.careproviderlocation_set.create(
+            name="My Other Location Name",
+            email="somewhere.else@nhs.net",
+            ods_code="My Other Ods",
+            cqc_location_id="My Other CQC Location ID",
+        )
+        other.carerecipient_set.create(nhs_number_hash="aaaa", provider_reference_id="raboof")
+        snapshot = self.store.build(previous=None)
+        with self.store.open(snapshot) as file:
+            lines = [json.loads(line) for line in gzip.decompress(file.read()).splitlines()]
+        self.assertEqual(
+            [line["ods_code"] for line in lines],
+            list(
+                CareRecipient.objects.order_by("nhs_number_hash", "id").values_list(
+                    "care_provider_location__ods_code", flat=True
+                )
+            ),
+        )
+
+    def test_asks_to_retry_while_the_first_snapshot_is_built(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with mock.patch(
+            "management_interface.views.snapshots", SnapshotStore(directory.name, refresh=3600)
+        ), mock.patch("management_interface.snapshot.threading.Thread") as thread:
+            response, _ = self.download()
+        self.assertEqual(response.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "5")
+        thread.return_value.start.assert_called_once_with()
+
+    def test_removes_files_left_by_a_killed_process(self):
+        for name in ("tmpabcd.tmp", "tmpefgh"):
+            open(self.store.path(name), "w").close()
+        self.store.refresh()
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.store.directory) if not name.startswith("directory-")),
+            ["snapshot.json", "snapshot.lock"],
+        )
+
+    def test_rebuilds_the_same_directory_to_the_same_etag(self):
+        first = self.store.current()
+        self.assertEqual(self.store.build(previous=first).etag, first.etag)
+
+    def test_not_modified_for_a_matching_etag(self):
+        response, _ = self.download()
+        response, content = self.download(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(content, b"")
+
+    def test_resumes_with_a_range(self):
+        response, content = self.download()
+        response, tail = self.download(HTTP_RANGE="bytes=10-", HTTP_IF_RANGE=response["ETag"])
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], f"bytes 10-{len(content) - 1}/{len(content)}")
+        self.assertEqual(tail, content[10:])
+
+    def test_sends_everything_when_the_snapshot_has_changed(self):
+        response, content = self.download(HTTP_RANGE="bytes=10-", HTTP_IF_RANGE='"an older snapshot"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(content), self.store.current().size)
+
+    def test_requires_token(self):
+        response = self.client.get(reverse("directory_snapshot"), HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    @override_settings(HANS_DIRECTORY_TOKEN="")
+    def test_refuses_everyone_but_staff_without_a_token(self):
+        response = self.client.get(reverse("directory_snapshot"), HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@nhs.net", None))
+        self.assertEqual(self.client.get(reverse("directory_snapshot")).status_code, HTTPStatus.OK)
+
+    def test_rejects_a_range_beyond_the_snapshot(self):
+        response, _ = self.download(HTTP_RANGE="bytes=100000-")
+        self.assertEqual(response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response["Content-Range"], f"bytes */{self.store.current().size}")
+
+
+class SnapshotRefreshTests(TransactionTestCase):
+    def setUp(self):
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.location.carerecipient_set.create(nhs_number_hash="aaaa", provider_reference_id="barfoo")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.now = 0
+        self.store = SnapshotStore(directory.name, refresh=60, clock=lambda: self.now)
+
+    def test_rebuilds_only_once_a_change_has_committed_since(self):
+        self.store.refresh()
+        first = self.store.load()
+        self.now += 60
+        self.store.refresh()
+        self.assertEqual((self.store.checks, self.store.builds, self.store.load().etag), (2, 1, first.etag))
+        self.location.carerecipient_set.create(nhs_number_hash="bbbb", provider_reference_id="foobar")
+        self.now += 60
+        self.store.refresh()
+        self.assertEqual((self.store.checks, self.store.builds), (3, 2))
+        self.assertNotEqual(self.store.load().etag, first.etag)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_parses_single_byte_ranges(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-200", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertIsNone(parse_range("bytes=0-9,20-29", 100))
+        self.assertIsNone(parse_range(None, 100))
+        with self.assertRaises(ValueError):
+            parse_range("bytes=100-", 100)
@@ -1,9 +1,12 @@
+import json
 from http import HTTPStatus
 
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 from django.urls import reverse
 
+from .lookup import lookup_cache
 from .models import RegisteredManager
+from .views import acare_provider_search
 
 
 class CareProviderLocationTests(TestCase):
@@ -27,11 +30,38 @@ class CareProviderLocationTests(TestCase):
         self.assertEqual(response.status_code, expected_status_code)
         self.assertEqual(response.json()["issue"][0]["code"], expected_code)
 
-    def test_search_get_method_not_allowed(self):
+    def test_search_put_method_not_allowed(self):
         url = reverse("care_provider_search")
-        response = self.client.get(url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash})
+        response = self.client.put(url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash})
         self.assertFailure(response, HTTPStatus.METHOD_NOT_ALLOWED, "not-allowed")
 
+    def test_get_search_is_cacheable(self):
+        url = reverse("care_provider_search")
+        response = self.client.get(url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()["name"], self.location.name)
+        self.assertEqual(response["Cache-Control"], "max-age=60")
+        self.assertIn("Last-Modified", response)
+
+        revalidated = self.client.get(
+            url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(revalidated.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(revalidated.content, b"")
+        self.assertEqual(revalidated["ETag"], response["ETag"])
+
+    def test_get_search_changes_etag_with_the_location(self):
+        url = reverse("care_provider_search")
+        before = self.client.get(url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash})
+        self.location.email = "somewhere.else@nhs.net"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.save()
+        after = self.client.get(
+            url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash}, HTTP_IF_NONE_MATCH=before["ETag"]
+        )
+        self.assertEqual(after.status_code, HTTPStatus.OK)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+
     def test_successful_search(self):
         url = reverse("care_provider_search")
         response = self.client.post(url, {"_careRecipientPseudoId": self.care_recipient.nhs_number_hash})
@@ -47,3 +77,107 @@ class CareProviderLocationTests(TestCase):
         url = reverse("care_provider_search")
         response = self.client.post(url, {})
         self.assertFailure(response, HTTPStatus.BAD_REQUEST, "required")
+
+
+class AsyncCareProviderSearchTests(TestCase):
+    def setUp(self) -> None:
+        lookup_cache.clear()
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.location.carerecipient_set.create(
+            subscription_id="42", provider_reference_id="foobar", nhs_number_hash="abc123"
+        )
+        self.factory = RequestFactory()
+        self.url = reverse("care_provider_search")
+
+    async def test_successful_search(self):
+        response = await acare_provider_search(self.factory.post(self.url, {"_careRecipientPseudoId": "abc123"}))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(json.loads(response.content)["name"], "My Location Name")
+
+    async def test_search_not_found(self):
+        response = await acare_provider_search(self.factory.post(self.url, {"_careRecipientPseudoId": "unknown"}))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    async def test_search_missing_param_returns_bad_request(self):
+        response = await acare_provider_search(self.factory.post(self.url, {}))
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    async def test_get_search(self):
+        response = await acare_provider_search(self.factory.get(self.url, {"_careRecipientPseudoId": "abc123"}))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn("ETag", response)
+
+    async def test_put_method_not_allowed(self):
+        response = await acare_provider_search(self.factory.put(self.url))
+        self.assertEqual(response.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
+
+
+class CareProviderBatchSearchTests(TestCase):
+    def setUp(self) -> None:
+        lookup_cache.clear()
+        manager = RegisteredManager.objects.create(
+            given_name="Jehosephat", family_name="McGibbons", cqc_registered_manager_id="My CQC RegsiteredManagerID"
+        )
+        self.location = manager.careproviderlocation_set.create(
+            name="My Location Name",
+            email="nosuchaddress@nhs.net",
+            ods_code="My Ods Code",
+            cqc_location_id="My CQC Location ID",
+        )
+        self.care_recipient = self.location.carerecipient_set.create(
+            subscription_id="42", provider_reference_id="foobar", nhs_number_hash="abc123"
+        )
+
+    def post_batch(self, bundle):
+        url = reverse("care_provider_batch_search")
+        return self.client.post(url, json.dumps(bundle), content_type="application/fhir+json")
+
+    def search_entry(self, pseudo_id):
+        return {
+            "request": {"method": "POST", "url": f"CareProviderLocation/_search?_careRecipientPseudoId={pseudo_id}"}
+        }
+
+    def test_returns_one_entry_per_search_in_order(self):
+        with self.assertNumQueries(1):
+            response = self.post_batch(
+                {
+                    "resourceType": "Bundle",
+                    "type": "batch",
+                    "entry": [self.search_entry("abc123"), self.search_entry("unknown"), {}],
+                }
+            )
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        body = response.json()
+        self.assertEqual(body["type"], "batch-response")
+        statuses = [entry["response"]["status"] for entry in body["entry"]]
+        self.assertEqual(statuses, ["200 OK", "404 Not Found", "400 Bad Request"])
+        self.assertEqual(body["entry"][0]["resource"]["name"], self.location.name)
+        self.assertEqual(body["entry"][1]["resource"]["issue"][0]["code"], "not-found")
+        self.assertEqual(body["entry"][2]["resource"]["issue"][0]["code"], "required")
+
+    def test_rejects_non_batch_bundle(self):
+        response = self.post_batch({"resourceType": "Bundle", "type": "transaction"})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.json()["issue"][0]["code"], "invalid")
+
+    def test_rejects_malformed_body(self):
+        response = self.post_batch({"resourceType": "Patient"})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(response.json()["issue"][0]["code"], "structure")
+
+    def test_rejects_oversized_batch(self):
+        with self.settings(HANS_BATCH_SEARCH_MAX_ENTRIES=1):
+            response = self.post_batch(
+                {"resourceType": "Bundle", "type": "batch", "entry": [self.search_entry("a"), self.search_entry("b")]}
+            )
+        self.assertEqual(response.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.json()["issue"][0]["code"], "too-costly")
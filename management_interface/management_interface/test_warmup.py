@@ -0,0 +1,55 @@
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase
+
+from .connection_pool import ConnectionPool
+from .management.commands.startup_profile import parse_import_times, time_by_package
+from .rendering import render_failure
+from .test_connection_pool import FakeConnection
+from .warmup import COMMON_FAILURES, POOLED_ENGINE, warm_up_connections, warm_up_process
+
+IMPORT_TIMES = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     pydantic.typing
+import time:      2213 |       2333 |   fhir.resources.contactpoint
+import time:       930 |       3263 | management_interface.rendering
+"""
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_renders_common_failures_ahead_of_time(self):
+        render_failure.cache_clear()
+        timings = warm_up_process()
+        self.assertEqual(list(timings), ["fhir_resources", "failure_bodies", "url_resolvers", "model_metadata"])
+        self.assertEqual(render_failure.cache_info().currsize, len(COMMON_FAILURES))
+
+
+class WarmUpConnectionsTests(TestCase):
+    def test_connects_to_each_database(self):
+        self.assertIn("connect_default", warm_up_connections())
+        self.assertIsNotNone(connection.connection)
+
+    def test_leaves_connections_to_request_threads(self):
+        with mock.patch.object(connection, "ensure_connection") as ensure_connection:
+            self.assertEqual(warm_up_connections(threads=4, on_request_thread=False), {})
+        ensure_connection.assert_not_called()
+
+    def test_fills_a_pool_for_each_thread(self):
+        pool = ConnectionPool(FakeConnection, max_size=3, timeout=1)
+        with mock.patch.dict(connection.settings_dict, {"ENGINE": POOLED_ENGINE}), mock.patch.object(
+            connection, "pool", return_value=pool, create=True
+        ):
+            warm_up_connections(threads=4, on_request_thread=False)
+        self.assertEqual((pool.stats()["idle"], pool.stats()["in_use"]), (3, 0))
+
+    def test_starts_without_an_unreachable_database(self):
+        with mock.patch.object(connection, "ensure_connection", side_effect=OperationalError("down")):
+            with self.assertLogs("management_interface.warmup", level="ERROR"):
+                warm_up_connections()
+
+
+class StartupProfileTests(SimpleTestCase):
+    def test_parses_import_times(self):
+        imports = parse_import_times(IMPORT_TIMES)
+        self.assertEqual(imports[1], ("fhir.resources.contactpoint", 0.002213, 0.002333))
+        self.assertAlmostEqual(time_by_package(imports)["management_interface"], 0.00093)
@@ -13,13 +13,33 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
-from .views import care_provider_search
+from .views import (
+    acare_provider_search,
+    care_provider_batch_search,
+    care_provider_search,
+    directory_changes,
+    directory_export,
+    directory_snapshot,
+    metrics,
+    statistics,
+)
 
 urlpatterns = [
-    path("care-provider-location/_search/", care_provider_search, name="care_provider_search"),
+    path(
+        "care-provider-location/_search/",
+        acare_provider_search if settings.HANS_ASYNC_SEARCH else care_provider_search,
+        name="care_provider_search",
+    ),
+    path("care-provider-location/_batch/", care_provider_batch_search, name="care_provider_batch_search"),
+    path("directory/_export/", directory_export, name="directory_export"),
+    path("directory/_changes/", directory_changes, name="directory_changes"),
+    path("directory/_snapshot/", directory_snapshot, name="directory_snapshot"),
+    path("_statistics/", statistics, name="statistics"),
+    path("_metrics/", metrics, name="metrics"),
     path("admin/", admin.site.urls),
     path("saml/", include("django_cognito_saml.urls")),
 ]
@@ -1,54 +1,415 @@
+import asyncio
+import math
+from functools import wraps
 from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_etags, quote_etag
 from django.views.decorators.csrf import csrf_exempt
-from fhir.resources.contactpoint import ContactPoint
-from fhir.resources.operationoutcome import OperationOutcome, OperationOutcomeIssue
-from fhir.resources.organization import Organization
 
-from .models import CareProviderLocation
+from .admission import client_address, search_rate_limiter, searches_in_flight
+from .audit import lookup_audit
+from .changes import changes_since, format_cursor, parse_cursor
+from .export import EXPORT_FORMATS, directory_rows
+from .lookup import (
+    afind_care_provider,
+    find_care_provider,
+    find_care_providers,
+    lookup_statistics,
+)
+from .metrics import render_metrics
+from .models import LookupOutcome
+from .rendering import (
+    render_batch_response,
+    render_batch_response_entry,
+    render_failure,
+)
+from .snapshot import BUILDING_RETRY_AFTER, parse_range, read_range, snapshots
+
+MISSING_PSEUDO_ID_DIAGNOSTICS = "Required search parameter was missing: _careRecipientPseudoId"
+NOT_FOUND_DIAGNOSTICS = "No subscription was found on the system for the given pseudonymous identifier"
+SEARCH_METHOD_NOT_ALLOWED_DIAGNOSTICS = "Method not allowed - _search only supports GET and POST"
+SEARCH_METHODS = ("GET", "POST")
+RATE_LIMITED_DIAGNOSTICS = "Too many searches from this client - retry after the time given in Retry-After"
+OVERLOADED_DIAGNOSTICS = "Too many searches in progress - retry after the time given in Retry-After"
+# seconds a client turned away for overload is asked to wait, by when the queue has usually drained
+OVERLOADED_RETRY_AFTER = 1
+
+
+def has_token(request, token):
+    """
+    Whether the request carries token as its bearer token or comes from a signed-in staff member. Only staff members
+    get in while no token is configured.
+    """
+    if token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    return request.user.is_staff
+
+
+def fhir_response(content, status=HTTPStatus.OK):
+    return HttpResponse(content, status=status, content_type="application/json")
 
 
 def failure_response(status, code, diagnostics):
-    operation_outcome_issue = OperationOutcomeIssue(
-        severity="error",
-        code=code,
-        diagnostics=diagnostics,
-    )
-    operation_outcome = OperationOutcome(issue=[operation_outcome_issue])
-    return JsonResponse(operation_outcome.dict(), status=status)
+    return fhir_response(render_failure(code, diagnostics), status=status)
+
+
+def search_parameters(request):
+    return request.GET if request.method == "GET" else request.POST
+
+
+def search_response(request, care_provider):
+    """
+    The care provider location's Organization. A GET is answered with validators and a lifetime, so caches in
+    front of the service can keep it and revalidate it with a 304 that skips sending it.
+    """
+    if request.method != "GET":
+        return fhir_response(care_provider.organization)
+
+    # the response is the location's Organization, which only changes when the location is saved
+    location_updated_at = care_provider.care_provider_location_updated_at
+    etag = quote_etag(f"{care_provider.care_provider_location_id.hex}.{location_updated_at.timestamp():.6f}")
+    last_modified = max(care_provider.care_recipient_updated_at, location_updated_at).timestamp()
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = fhir_response(care_provider.organization)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = f"max-age={settings.HANS_SEARCH_MAX_AGE}"
+    return response
+
+
+def throttled_response(diagnostics, retry_after):
+    response = failure_response(status=HTTPStatus.TOO_MANY_REQUESTS, code="throttled", diagnostics=diagnostics)
+    response["Retry-After"] = str(max(math.ceil(retry_after), 1))
+    return response
+
+
+def rate_limited_response(request):
+    """
+    A 429 response if the request's client has used up its rate limit, otherwise None
+    """
+    wait = search_rate_limiter.acquire(client_address(request, settings.HANS_SEARCH_CLIENT_HEADER))
+    return throttled_response(RATE_LIMITED_DIAGNOSTICS, wait) if wait else None
+
+
+def admission_controlled(view):
+    """
+    Turns a search away with a 429 when its client is over its rate limit, or when too many searches are already
+    in progress and too many waiting; decorates both sync and async views
+    """
+    if asyncio.iscoroutinefunction(view):
+
+        @wraps(view)
+        async def async_view(request, *args, **kwargs):
+            response = rate_limited_response(request)
+            if response is not None:
+                return response
+            if not await searches_in_flight.aacquire():
+                return throttled_response(OVERLOADED_DIAGNOSTICS, OVERLOADED_RETRY_AFTER)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                searches_in_flight.release()
+
+        return async_view
+
+    @wraps(view)
+    def sync_view(request, *args, **kwargs):
+        response = rate_limited_response(request)
+        if response is not None:
+            return response
+        if not searches_in_flight.acquire():
+            return throttled_response(OVERLOADED_DIAGNOSTICS, OVERLOADED_RETRY_AFTER)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            searches_in_flight.release()
+
+    return sync_view
+
+
+def batch_entry_pseudo_id(entry):
+    if entry.request is None:
+        return None
+    pseudo_ids = parse_qs(urlsplit(entry.request.url).query).get("_careRecipientPseudoId")
+    return pseudo_ids[0] if pseudo_ids else None
 
 
 @csrf_exempt
+@admission_controlled
 def care_provider_search(request):
-    if request.method == "POST":
+    if request.method in SEARCH_METHODS:
 
         try:
-            nhs_number_hash = request.POST["_careRecipientPseudoId"]
+            nhs_number_hash = search_parameters(request)["_careRecipientPseudoId"]
         except KeyError:
+            lookup_audit.record(LookupOutcome.BAD_REQUEST, "")
             return failure_response(
                 status=HTTPStatus.BAD_REQUEST,
                 code="required",
-                diagnostics="Required search parameter was missing: _careRecipientPseudoId",
+                diagnostics=MISSING_PSEUDO_ID_DIAGNOSTICS,
+            )
+
+        care_provider = find_care_provider(nhs_number_hash)
+        if care_provider is None:
+            lookup_audit.record(LookupOutcome.MISS, nhs_number_hash)
+            return failure_response(
+                status=HTTPStatus.NOT_FOUND,
+                code="not-found",
+                diagnostics=NOT_FOUND_DIAGNOSTICS,
             )
 
+        lookup_audit.record(LookupOutcome.HIT, nhs_number_hash)
+        return search_response(request, care_provider)
+
+    # if not allowed method was used on this endpoint
+    else:
+        return failure_response(
+            status=HTTPStatus.METHOD_NOT_ALLOWED,
+            code="not-allowed",
+            diagnostics=SEARCH_METHOD_NOT_ALLOWED_DIAGNOSTICS,
+        )
+
+
+@admission_controlled
+async def acare_provider_search(request):
+    """
+    care_provider_search for ASGI deployments: the lookup awaits the async ORM instead of holding a worker
+    """
+    if request.method in SEARCH_METHODS:
+
         try:
-            care_provider = CareProviderLocation.objects.get(carerecipient__nhs_number_hash=nhs_number_hash)
-        except CareProviderLocation.DoesNotExist:
+            nhs_number_hash = search_parameters(request)["_careRecipientPseudoId"]
+        except KeyError:
+            await lookup_audit.arecord(LookupOutcome.BAD_REQUEST, "")
+            return failure_response(
+                status=HTTPStatus.BAD_REQUEST,
+                code="required",
+                diagnostics=MISSING_PSEUDO_ID_DIAGNOSTICS,
+            )
+
+        care_provider = await afind_care_provider(nhs_number_hash)
+        if care_provider is None:
+            await lookup_audit.arecord(LookupOutcome.MISS, nhs_number_hash)
             return failure_response(
                 status=HTTPStatus.NOT_FOUND,
                 code="not-found",
-                diagnostics="No subscription was found on the system for the given pseudonymous identifier",
+                diagnostics=NOT_FOUND_DIAGNOSTICS,
             )
 
-        fhir_contact_point = ContactPoint(system="email", value=care_provider.email, use="work")
-        fhir_organization = Organization(name=care_provider.name, telecom=[fhir_contact_point])
-        return JsonResponse(fhir_organization.dict())
+        await lookup_audit.arecord(LookupOutcome.HIT, nhs_number_hash)
+        return search_response(request, care_provider)
 
     # if not allowed method was used on this endpoint
     else:
         return failure_response(
             status=HTTPStatus.METHOD_NOT_ALLOWED,
             code="not-allowed",
-            diagnostics="Method not allowed - _search only supports POST",
+            diagnostics=SEARCH_METHOD_NOT_ALLOWED_DIAGNOSTICS,
         )
+
+
+# csrf_exempt() wraps views in a synchronous function until Django 5.0, which would hide the coroutine
+acare_provider_search.csrf_exempt = True
+
+
+@csrf_exempt
+@admission_controlled
+def care_provider_batch_search(request):
+    """
+    Resolves every CareProviderLocation search in a FHIR batch Bundle with a single query.
+    Each entry's request url carries its _careRecipientPseudoId, e.g.
+    "CareProviderLocation/_search?_careRecipientPseudoId=...", and gets its own entry in the batch-response.
+    """
+    if request.method != "POST":
+        return failure_response(
+            status=HTTPStatus.METHOD_NOT_ALLOWED,
+            code="not-allowed",
+            diagnostics="Method not allowed - batch search only supports POST",
+        )
+
+    # imported on first use, as in rendering
+    from fhir.resources.bundle import Bundle
+
+    try:
+        bundle = Bundle.parse_raw(request.body)
+    except ValueError:
+        return failure_response(
+            status=HTTPStatus.BAD_REQUEST,
+            code="structure",
+            diagnostics="Request body must be a FHIR Bundle",
+        )
+
+    if bundle.type != "batch":
+        return failure_response(
+            status=HTTPStatus.BAD_REQUEST,
+            code="invalid",
+            diagnostics="Bundle type must be batch",
+        )
+
+    entries = bundle.entry or []
+    if len(entries) > settings.HANS_BATCH_SEARCH_MAX_ENTRIES:
+        return failure_response(
+            status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            code="too-costly",
+            diagnostics=f"Batch may contain at most {settings.HANS_BATCH_SEARCH_MAX_ENTRIES} entries",
+        )
+
+    pseudo_ids = [batch_entry_pseudo_id(entry) for entry in entries]
+    care_providers = find_care_providers(pseudo_id for pseudo_id in pseudo_ids if pseudo_id is not None)
+
+    response_entries = []
+    for pseudo_id in pseudo_ids:
+        if pseudo_id is None:
+            lookup_audit.record(LookupOutcome.BAD_REQUEST, "")
+            response_entry = render_batch_response_entry(
+                HTTPStatus.BAD_REQUEST,
+                render_failure(code="required", diagnostics=MISSING_PSEUDO_ID_DIAGNOSTICS),
+            )
+        elif pseudo_id not in care_providers:
+            lookup_audit.record(LookupOutcome.MISS, pseudo_id)
+            response_entry = render_batch_response_entry(
+                HTTPStatus.NOT_FOUND,
+                render_failure(code="not-found", diagnostics=NOT_FOUND_DIAGNOSTICS),
+            )
+        else:
+            lookup_audit.record(LookupOutcome.HIT, pseudo_id)
+            response_entry = render_batch_response_entry(HTTPStatus.OK, care_providers[pseudo_id].organization)
+        response_entries.append(response_entry)
+
+    return fhir_response(render_batch_response(response_entries))
+
+
+@staff_member_required
+def statistics(request):
+    return JsonResponse(lookup_statistics())
+
+
+@staff_member_required
+def directory_export(request):
+    """
+    Streams the whole subscription directory as CSV (default) or NDJSON, chosen by ?format=
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(f"Unknown export format: {export_format}", status=HTTPStatus.BAD_REQUEST)
+
+    content_type, render = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(render(directory_rows()), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="hans-directory.{export_format}"'
+    return response
+
+
+def directory_changes(request):
+    """
+    Changes to the directory after the cursor ?since=, in commit-safe order. Consumers start from 0 and pass back
+    the "next" cursor of each page, fetching again straight away while "more" is true.
+    """
+    if not has_token(request, settings.HANS_DIRECTORY_TOKEN):
+        return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+    try:
+        since = parse_cursor(request.GET.get("since", "0"))
+    except ValueError:
+        return HttpResponse("since must be the next cursor of a previous page", status=HTTPStatus.BAD_REQUEST)
+    try:
+        limit = min(
+            int(request.GET.get("limit", settings.HANS_CHANGE_FEED_PAGE_SIZE)), settings.HANS_CHANGE_FEED_PAGE_SIZE
+        )
+    except ValueError:
+        return HttpResponse("limit must be an integer", status=HTTPStatus.BAD_REQUEST)
+    if limit < 1:
+        return HttpResponse("limit must be positive", status=HTTPStatus.BAD_REQUEST)
+
+    changes, cursor, more = changes_since(since, limit)
+    return JsonResponse(
+        {
+            "changes": [
+                {
+                    "sequence": change.sequence,
+                    "changed_at": change.changed_at,
+                    "entity": change.entity,
+                    "action": change.action,
+                    "nhs_number_hash": change.nhs_number_hash,
+                }
+                for change in changes
+            ],
+            "next": format_cursor(*cursor),
+            "more": more,
+        }
+    )
+
+
+def directory_snapshot(request):
+    """
+    The whole directory as gzip-compressed NDJSON, current to the change feed cursor in X-Change-Cursor, from
+    which directory_changes keeps a copy up to date. Send the ETag back in If-None-Match to skip an unchanged
+    snapshot, and resume an interrupted download with Range and If-Range. Answers 503 while the first one is built.
+    """
+    if not has_token(request, settings.HANS_DIRECTORY_TOKEN):
+        return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+
+    snapshot = snapshots.current()
+    if snapshot is None:
+        return HttpResponse(
+            "The directory snapshot is being built",
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(BUILDING_RETRY_AFTER)},
+        )
+    etag = quote_etag(snapshot.etag)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+        "X-Change-Cursor": snapshot.cursor,
+    }
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        return HttpResponse(status=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    byte_range = None
+    # a range of a snapshot that has since been replaced would not fit onto the part already downloaded
+    if request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), snapshot.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{snapshot.size}"
+            return HttpResponse(status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+
+    file = snapshots.open(snapshot)
+    if byte_range is None:
+        return FileResponse(
+            file,
+            as_attachment=True,
+            filename="hans-directory.ndjson.gz",
+            content_type="application/gzip",
+            headers=headers,
+        )
+    first, last = byte_range
+    headers["Content-Range"] = f"bytes {first}-{last}/{snapshot.size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingHttpResponse(
+        read_range(file, first, last),
+        status=HTTPStatus.PARTIAL_CONTENT,
+        content_type="application/gzip",
+        headers=headers,
+    )
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint for the worker process that answers it
+    """
+    if not has_token(request, settings.HANS_METRICS_TOKEN):
+        return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+    return HttpResponse(render_metrics(lookup_statistics()), content_type="text/plain; version=0.0.4")
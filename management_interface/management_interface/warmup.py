@@ -0,0 +1,127 @@
+"""
+Work brought forward to before a gunicorn worker takes traffic, so that its first requests do not pay for it.
+
+warm_up_process() runs once in the gunicorn master, after the app is preloaded and before workers are forked, so
+every worker shares its result. warm_up_connections() runs in each worker, whose database connections are its own.
+Both return the seconds spent on each step.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+from django.urls import resolve, reverse
+
+from .rendering import render_failure, render_organization
+from .views import (
+    MISSING_PSEUDO_ID_DIAGNOSTICS,
+    NOT_FOUND_DIAGNOSTICS,
+    OVERLOADED_DIAGNOSTICS,
+    RATE_LIMITED_DIAGNOSTICS,
+    SEARCH_METHOD_NOT_ALLOWED_DIAGNOSTICS,
+)
+
+logger = logging.getLogger(__name__)
+
+POOLED_ENGINE = "management_interface.pooled_postgresql"
+# the failures search requests most often end in, whose rendered bodies views serve from render_failure's cache
+COMMON_FAILURES = (
+    ("not-found", NOT_FOUND_DIAGNOSTICS),
+    ("required", MISSING_PSEUDO_ID_DIAGNOSTICS),
+    ("not-allowed", SEARCH_METHOD_NOT_ALLOWED_DIAGNOSTICS),
+    # served in a surge, when rendering them would take time from the searches being let through
+    ("throttled", RATE_LIMITED_DIAGNOSTICS),
+    ("throttled", OVERLOADED_DIAGNOSTICS),
+)
+URL_NAMES = ("care_provider_search", "care_provider_batch_search", "statistics", "metrics")
+
+
+def import_fhir_resources():
+    # the first use of each pydantic model also builds its validators
+    from fhir.resources.bundle import Bundle
+
+    Bundle.parse_raw('{"resourceType": "Bundle", "type": "batch"}')
+    render_organization("Warm-up", "warm-up@nhs.net")
+
+
+def render_common_failures():
+    for code, diagnostics in COMMON_FAILURES:
+        render_failure(code, diagnostics)
+
+
+def populate_url_resolvers():
+    for name in URL_NAMES:
+        resolve(reverse(name))
+
+
+def populate_model_metadata():
+    for model in apps.get_models():
+        model._meta.get_fields()
+
+
+def timed(steps):
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def warm_up_process():
+    timings = timed(
+        [
+            ("fhir_resources", import_fhir_resources),
+            ("failure_bodies", render_common_failures),
+            ("url_resolvers", populate_url_resolvers),
+            ("model_metadata", populate_model_metadata),
+        ]
+    )
+    logger.info("Warmed up in %.0f ms", sum(timings.values()) * 1000)
+    return timings
+
+
+def fill_pool(connection, threads):
+    """
+    Opens a pooled connection for each of up to threads request threads and hands them all to the pool
+    """
+    pool = connection.pool(connection.get_connection_params())
+    opened = []
+    try:
+        with connection.wrap_database_errors:
+            for _ in range(min(threads, pool.max_size)):
+                opened.append(pool.acquire())
+    finally:
+        for pooled in opened:
+            pool.release(pooled)
+
+
+def connect(alias, threads):
+    connection = connections[alias]
+    try:
+        if connection.settings_dict["ENGINE"] == POOLED_ENGINE:
+            fill_pool(connection, threads)
+        else:
+            connection.ensure_connection()
+    except DatabaseError:
+        # the worker still starts; its requests fail or fall back as they would have without warming up
+        logger.exception("Could not connect to database %s while warming up", alias)
+
+
+def warm_up_connections(threads=1, on_request_thread=True):
+    """
+    Connects to each database, so that connecting and authenticating are done before the first request.
+
+    Django's connections belong to the thread that opens them, so a connection of the calling thread is only of use
+    on_request_thread, when requests are served on it. Otherwise only pools are filled, with a connection for each of
+    the worker's threads.
+    """
+    aliases = [
+        alias
+        for alias in connections
+        if on_request_thread or connections[alias].settings_dict["ENGINE"] == POOLED_ENGINE
+    ]
+    timings = timed([(f"connect_{alias}", lambda alias=alias: connect(alias, threads)) for alias in aliases])
+    if aliases:
+        logger.info("Connected to %s in %.0f ms", ", ".join(aliases), sum(timings.values()) * 1000)
+    return timings
@@ -1,6 +1,26 @@
 #!/bin/sh
+# Usage: start.sh [init|serve]
+#   init   applies migrations, collects static files and creates the superuser, then exits; run once per deploy
+#   serve  starts the server without any one-off work, so new containers take traffic quickly
+# With no argument, it does both, in that order.
 
-python manage.py migrate \
-&& python manage.py collectstatic --no-input \
-&& python manage.py createsuperuser --noinput || true \
-&& python manage.py runserver 0.0.0.0:8000
+MODE=${1:-all}
+
+if [ "$MODE" = "init" ] || [ "$MODE" = "all" ]; then
+    python manage.py migrate \
+    && python manage.py collectstatic --no-input \
+    && (python manage.py createsuperuser --noinput || true) \
+    || exit 1
+fi
+
+if [ "$MODE" = "init" ]; then
+    exit 0
+fi
+
+SERVER_MODE=$(python -c "from management_interface.configuration import SETTINGS; print(SETTINGS.SERVER_MODE)")
+
+if [ "$SERVER_MODE" = "production" ]; then
+    exec gunicorn --config gunicorn.conf.py
+else
+    exec python manage.py runserver 0.0.0.0:8000
+fi